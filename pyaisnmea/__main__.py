@@ -5,12 +5,80 @@ command line interface for processing AIS traffic
 import argparse
 import logging
 
+import pyaisnmea.ais as ais
 import pyaisnmea.capturefile as capturefile
 import pyaisnmea.gui.basicgui as basicgui
 import pyaisnmea.livekmlmap as livekmlmap
 import pyaisnmea.version as version
 
 
+def host_and_port(hostport):
+    """
+    read a host and port from the command line
+
+    Args:
+        hostport(str): host and port as HOST:PORT
+
+    Raises:
+        argparse.ArgumentTypeError: if hostport is not HOST:PORT
+
+    Returns:
+        hostandport(tuple): the host and port as an int
+    """
+    host, _, port = hostport.rpartition(':')
+    try:
+        if not host:
+            raise ValueError
+        return (host, int(port))
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '{} is not HOST:PORT'.format(hostport))
+
+
+def number_list(numbers):
+    """
+    read a comma separated list of whole numbers from the command line
+
+    Args:
+        numbers(str): numbers separated by commas e.g. 1,2,3,18
+
+    Raises:
+        argparse.ArgumentTypeError: if any of the numbers are not integers
+
+    Returns:
+        numberlist(list): the numbers as ints
+    """
+    try:
+        return [int(number) for number in numbers.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '{} is not a list of numbers'.format(numbers))
+
+
+def bounding_box(bbox):
+    """
+    read a bounding box from the command line
+
+    Args:
+        bbox(str): MINLON,MINLAT,MAXLON,MAXLAT
+
+    Raises:
+        argparse.ArgumentTypeError: if bbox is not 4 numbers
+
+    Returns:
+        bbox(list): min longitude, min latitude, max longitude and
+                    max latitude as floats
+    """
+    try:
+        bboxlist = [float(coord) for coord in bbox.split(',')]
+        if len(bboxlist) != 4:
+            raise ValueError
+        return bboxlist
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            '{} is not MINLON,MINLAT,MAXLON,MAXLAT'.format(bbox))
+
+
 def cli_arg_parser():
     """
     get the cli arguments and run the program
@@ -49,6 +117,46 @@ def cli_arg_parser():
         '-cl', action='store_true', help='order output by class')
     mapfileorder.add_argument(
         '-ty', action='store_true', help='order output by types (default)')
+    livemapparser.add_argument(
+        '-i', action='store_true',
+        help=('incremental map, only send Google Earth the stations that '
+              'have changed'))
+    livemapparser.add_argument(
+        '-g', type=int, metavar='PORT',
+        help='serve a live GeoJSON map over HTTP on this port')
+    livemapparser.add_argument(
+        '-s', action='store_true',
+        help=('single process, receive sentences with asyncio in the same '
+              'process as the map rather than a separate server process'))
+    livemapparser.add_argument(
+        '-m', action='store_true',
+        help=('pass sentences from the server process through a ring '
+              'buffer in shared memory rather than a queue'))
+    livemapparser.add_argument(
+        '-u', type=host_and_port, action='append', metavar='HOST:PORT',
+        help=('listen for UDP datagrams on HOST:PORT, '
+              'default is 127.0.0.1:10110 if no other sources are given'))
+    livemapparser.add_argument(
+        '-tc', type=host_and_port, action='append', metavar='HOST:PORT',
+        help='connect to a TCP server sending NMEA sentences on HOST:PORT')
+    livemapparser.add_argument(
+        '-ts', type=host_and_port, action='append', metavar='HOST:PORT',
+        help='listen for TCP connections from feeders on HOST:PORT')
+    livemapparser.add_argument(
+        '-f', type=host_and_port, action='append', metavar='HOST:PORT',
+        help=('forward the received sentences to HOST:PORT over UDP, '
+              'can be given more than once'))
+    livemapparser.add_argument(
+        '-fm', action='store_true',
+        help='pack forwarded sentences into MTU sized datagrams')
+    livemapparser.add_argument(
+        '-r', type=int, default=4194304, metavar='BYTES',
+        help=('size to ask for the UDP socket receive buffer to be, '
+              'default is 4194304'))
+    livemapparser.add_argument(
+        '-d', type=float, metavar='SECONDS',
+        help=('ignore duplicate messages from overlapping receivers heard '
+              'within SECONDS of each other'))
     fileparser = subparsers.add_parser('file',
                                        help=('read AIS traffic '
                                              'from a capture file'))
@@ -57,6 +165,22 @@ def cli_arg_parser():
              'output individual KMZ, CSV and JSON Lines for each AIS Station')
     fileparser.add_argument(dest='outputdir', help='output directory path')
     fileparser.add_argument('-e', action='store_true', help=ehelp)
+    fileparser.add_argument(
+        '-w', type=int, default=1,
+        help='number of AIS Stations to export at the same time with -e')
+    fileparser.add_argument(
+        '-lm', action='store_true',
+        help=('low memory - store only message payloads and decode '
+              'them again when exporting'))
+    fileparser.add_argument(
+        '-mt', type=number_list, metavar='TYPES',
+        help='only import these message types e.g. 1,2,3,18')
+    fileparser.add_argument(
+        '-mm', type=number_list, metavar='MMSIS',
+        help='only import messages from these comma separated MMSIs')
+    fileparser.add_argument(
+        '-bb', type=bounding_box, metavar='MINLON,MINLAT,MAXLON,MAXLAT',
+        help='only import position reports inside this bounding box')
     filetype = fileparser.add_mutually_exclusive_group()
     filetype.add_argument('-t', action='store_true', help='import text file')
     filetype.add_argument('-c', action='store_true', help='import CSV file')
@@ -103,27 +227,35 @@ def main():
             region = 'B'
         else:
             region = 'A'
+        messagefilter = None
+        if cliargs.mt or cliargs.mm or cliargs.bb:
+            messagefilter = ais.MessageFilter(
+                msgtypes=cliargs.mt, mmsis=cliargs.mm, bbox=cliargs.bb)
         if (cliargs.t or
                 cliargs.inputfile.endswith('.txt') or
                 cliargs.inputfile.endswith('.nmea')):
             capturefile.read_from_file(
                 cliargs.inputfile, cliargs.outputdir,
                 everything=cliargs.e, filetype='text',
-                orderby=orderby, region=region)
+                orderby=orderby, region=region, compact=cliargs.lm,
+                workers=cliargs.w, messagefilter=messagefilter)
         elif cliargs.c or cliargs.inputfile.endswith('.csv'):
             capturefile.read_from_file(
                 cliargs.inputfile, cliargs.outputdir,
                 everything=cliargs.e, filetype='csv',
-                orderby=orderby, region=region)
+                orderby=orderby, region=region, compact=cliargs.lm,
+                workers=cliargs.w, messagefilter=messagefilter)
         elif cliargs.j or cliargs.inputfile.endswith('.jsonl'):
             capturefile.read_from_file(
                 cliargs.inputfile, cliargs.outputdir,
                 everything=cliargs.e, filetype='jsonlines',
-                orderby=orderby, region=region)
+                orderby=orderby, region=region, compact=cliargs.lm,
+                workers=cliargs.w, messagefilter=messagefilter)
         else:
             capturefile.read_from_file(
                 cliargs.inputfile, cliargs.outputdir, everything=cliargs.e,
-                orderby=orderby, region=region)
+                orderby=orderby, region=region, compact=cliargs.lm,
+                workers=cliargs.w, messagefilter=messagefilter)
     elif cliargs.subcommand == 'livemap':
         if cliargs.fl:
             orderby = 'Flags'
@@ -142,10 +274,24 @@ def main():
         if cliargs.a or cliargs.b:
             livemap = livekmlmap.LiveKMLMap(
                 cliargs.outputdir, kmzoutput=kmzoutput,
-                orderby=orderby, region=region)
+                orderby=orderby, region=region, incremental=cliargs.i,
+                sharedmemory=cliargs.m, forwardto=cliargs.f,
+                forwardbatch=cliargs.fm, duplicatewindow=cliargs.d,
+                rcvbuf=cliargs.r)
             livemap.create_netlink_file()
-            livemap.start_server()
-            livemap.get_nmea_sentences()
+            if cliargs.g:
+                livemap.start_geojson_server(port=cliargs.g)
+            sources = []
+            for servertype, hostports in (('udp', cliargs.u),
+                                          ('tcpclient', cliargs.tc),
+                                          ('tcpserver', cliargs.ts)):
+                for host, port in hostports or []:
+                    sources.append((servertype, host, port))
+            if cliargs.s:
+                livemap.run_async_server(sources=sources)
+            else:
+                livemap.start_server(sources=sources)
+                livemap.get_nmea_sentences()
         else:
             cliparser.print_help()
     else:
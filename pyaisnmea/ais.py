@@ -5,9 +5,10 @@ contains the main class that represents each AIS station
 """
 
 import collections
+import copy
 import datetime
-import os
 import re
+import time
 
 import pyaisnmea.binary as binary
 import pyaisnmea.export as export
@@ -26,6 +27,13 @@ LONGITUDEUNAVAILABLE = 181.0
 TIMEUNAVAILABLE = '0/00/00 24:60:60'
 
 
+STATICBITS = {
+    5: ((38, None),),
+    19: ((143, None),),
+    21: ((38, 164), (219, 253), (259, 260), (268, None)),
+    24: ((38, None),)}
+
+
 TIMEREGEX = re.compile(r'(0[0-9]|1[0-9]|2[0-3]):([0-5][0-9]):([0-5][0-9])')
 
 
@@ -35,6 +43,29 @@ NAVHEADERS = ['MMSI', 'Name', 'Callsign', 'Type', 'Flag',
               'Time', 'Destination', 'ETA']
 
 
+def get_position_arrows(pos):
+    """
+    get the heading and CoG of a position report to draw arrows on a map
+
+    Args:
+        pos(dict): a position report
+
+    Returns:
+        heading(int): true heading, None if unavailable
+        cog(int): course over ground, None if unavailable
+    """
+    heading = pos.get('True Heading', HEADINGUNAVAILABLE)
+    if heading == HEADINGUNAVAILABLE:
+        heading = None
+    try:
+        cog = int(pos['CoG'])
+        if cog == COGUNAVAILABLE:
+            cog = None
+    except KeyError:
+        cog = None
+    return heading, cog
+
+
 class AISStation():
     """
     represents a single AIS station
@@ -52,6 +83,18 @@ class AISStation():
         flag(str): the country the station is sailing under
         sentmsgs(collections.defaultdict): count of different message types
                                            this station has sent
+        version(int): goes up by 1 every time the station is updated
+        fragments(dict): cache of things rendered from this station such as
+                         its KML, keys are what was rendered and values are
+                         tuples of the version and number of positions it
+                         was rendered from and what was rendered
+        latestfragments(dict): the same as fragments but for snapshots
+                               that only have the last position
+        staticdata(dict): fingerprints of the static and voyage data last
+                          received, keys are message types or tuples of
+                          type 24 and the part number
+        staticdetails(dict): the details last written by each of the keys
+                             in staticdata
 
     Args:
         mmsi(str): same as above
@@ -67,6 +110,40 @@ class AISStation():
         self.binarymsgs = []
         self.flag = self.identify_flag(mmsi)
         self.sentmsgs = collections.Counter()
+        self.version = 0
+        self.fragments = {}
+        self.latestfragments = {}
+        self.staticdata = {}
+        self.staticdetails = {}
+
+    def get_fragment(self, key, createfragment):
+        """
+        get something rendered from this station, e.g. its KML, from the
+        cache or render it if the station has changed since it was cached
+
+        Note:
+            snapshots share the cache with the station they were taken from,
+            each entry is only used by a station of the same version with
+            the same number of positions
+
+        Args:
+            key(str or tuple): what is being rendered and how
+            createfragment(function): called with no arguments to render
+                                      the fragment if it is not cached
+
+        Returns:
+            fragment: what createfragment returned
+        """
+        renderedfrom = (self.version, len(self.posrep))
+        try:
+            cachedfrom, fragment = self.fragments[key]
+            if cachedfrom == renderedfrom:
+                return fragment
+        except KeyError:
+            pass
+        fragment = createfragment()
+        self.fragments[key] = (renderedfrom, fragment)
+        return fragment
 
     @staticmethod
     def identify_flag(mmsi):
@@ -170,7 +247,75 @@ class AISStation():
             if msgobj.partno == 1:
                 self.stntype = msgobj.shiptype
 
-    def find_position_information(self, msgobj):
+    def check_static_data(self, msgobj):
+        """
+        check if a message has different static and voyage data to the last
+        one of its type from this station
+
+        Note:
+            the fingerprint is the bits of the message binary that
+            get_details and find_station_name_and_type read, listed in
+            STATICBITS, the position and time are left out
+
+            a fingerprint is forgotten when another message type writes
+            any of the same details, e.g. the length from a type 24, so
+            the next message of its type is not skipped as unchanged
+
+        Args:
+            msgobj(messages.aismessage.AISMessage): message object
+
+        Returns:
+            changed(bool): True if the static data has changed or the
+                           message type has no static data
+        """
+        try:
+            staticbits = STATICBITS[msgobj.msgtype]
+        except KeyError:
+            return True
+        key = self.static_data_key(msgobj)
+        fingerprint = ''.join(
+            msgobj.msgbinary[start:end] for start, end in staticbits)
+        if self.staticdata.get(key) == fingerprint:
+            return False
+        self.staticdata[key] = fingerprint
+        return True
+
+    @staticmethod
+    def static_data_key(msgobj):
+        """
+        the key a message's static data fingerprint is kept under
+
+        Args:
+            msgobj(messages.aismessage.AISMessage): message object
+
+        Returns:
+            key(int or tuple): the message type, or a tuple of 24 and the
+                               part number for type 24
+        """
+        if msgobj.msgtype == 24:
+            return (24, msgobj.partno)
+        return msgobj.msgtype
+
+    def record_static_details(self, msgobj, msgdetails):
+        """
+        record the details a message with static data wrote and forget the
+        fingerprints of other message types that wrote any of them
+
+        Args:
+            msgobj(messages.aismessage.AISMessage): message object
+            msgdetails(dict): the details from the message
+        """
+        if msgobj.msgtype not in STATICBITS:
+            return
+        key = self.static_data_key(msgobj)
+        written = set(msgdetails)
+        for otherkey, otherdetails in list(self.staticdetails.items()):
+            if otherkey != key and not written.isdisjoint(otherdetails):
+                del self.staticdetails[otherkey]
+                self.staticdata.pop(otherkey, None)
+        self.staticdetails[key] = written
+
+    def find_position_information(self, msgobj, staticchanged=True):
         """
         takes a message object and gets useful information from it
 
@@ -179,7 +324,16 @@ class AISStation():
 
         Args:
             msgobj(messages.aismessage.AISMessage): message object
+            staticchanged(bool): if False the details from the message are
+                                 the same as last time and are not updated
+
+        Returns:
+            changes(dict): keys are details that have changed, values are
+                           tuples of the old value, None if it is new,
+                           and the new value
         """
+        changes = {}
+        self.version += 1
         self.sentmsgs[msgobj.description] += 1
         binarymsgtypes = [6, 8]
         posreptypes = [1, 2, 3, 4, 9, 11, 18, 19, 21, 27]
@@ -189,6 +343,8 @@ class AISStation():
                 self.update_position(posrepdict)
             except (NotImplementedError, NoSuitablePositionReport):
                 pass
+        if not staticchanged:
+            return changes
         try:
             msgdetails = msgobj.get_details()
             if msgobj.msgtype in binarymsgtypes:
@@ -198,9 +354,15 @@ class AISStation():
                 self.details.update(latest)
                 self.binarymsgs.append(msgdetails)
             else:
+                for detail, value in msgdetails.items():
+                    oldvalue = self.details.get(detail)
+                    if oldvalue != value:
+                        changes[detail] = (oldvalue, value)
                 self.details.update(msgdetails)
+                self.record_static_details(msgobj, msgdetails)
         except NotImplementedError:
             pass
+        return changes
 
     def update_position(self, currentpos):
         """
@@ -217,6 +379,7 @@ class AISStation():
         if (currentpos['Latitude'] == LATITUDEUNAVAILABLE or
                 currentpos['Longitude'] == LONGITUDEUNAVAILABLE):
             raise NoSuitablePositionReport('do not have a suitable LAT/LON')
+        self.version += 1
         try:
             currentpos['Destination'] = self.details['Destination']
         except KeyError:
@@ -274,6 +437,23 @@ class AISStation():
                 stninfo['Last Known Position'] = 'Unknown'
         return stninfo
 
+    def get_geojson_properties(self, lastpos):
+        """
+        get the properties for a GeoJSON point of this station
+
+        Args:
+            lastpos(dict): the position report the point is for
+
+        Returns:
+            properties(dict): station information and heading
+        """
+        properties = self.get_station_info()
+        try:
+            properties['Heading'] = lastpos['True Heading']
+        except KeyError:
+            properties['Heading'] = HEADINGUNAVAILABLE
+        return properties
+
     def create_positions_csv(self, outputfile, dialect='excel'):
         """
         create a CSV file of all the position reports for this station
@@ -319,90 +499,222 @@ class AISStation():
         staticstations = ('Base Station', 'Navigation Aid')
         greenarrows = set()
         orangearrows = set()
-        if kmzoutput:
-            docpath = os.path.join(os.path.dirname(outputfile), 'doc.kml')
-        else:
-            docpath = os.path.join(outputfile)
-        kmlmap = kml.KMLOutputParser(docpath)
-        kmlmap.create_kml_header(
-            kmz=kmzoutput, iconsused=self.stntype, ialaregion=region)
-        stninfo = self.get_station_info(messagetally=False)
-        if self.name != '':
-            displayname = self.mmsi + ' - ' + self.name
-        else:
-            displayname = self.mmsi
-        kmlmap.open_folder(displayname)
-        if self.stnclass in staticstations:
-            lastpos = self.get_latest_position()
-            stninfo = self.get_station_info(messagetally=True)
-            desc = kmlmap.format_kml_placemark_description(stninfo)
-            kmlmap.add_kml_placemark(displayname, desc,
-                                     str(lastpos['Longitude']),
-                                     str(lastpos['Latitude']),
-                                     self.stntype, '0', kmzoutput)
-        else:
-            posnumber = 1
-            stninfo = self.get_station_info(messagetally=False)
+        if kmzoutput and self.stnclass not in staticstations:
             for pos in self.posrep:
-                timematch = TIMEREGEX.search(pos['Time'])
-                if timematch:
-                    posfoldername = str(posnumber) + ' - ' + timematch.group()
-                    try:
-                        kmltimestamp = kml.convert_timestamp_to_kmltimestamp(
-                            pos['Time'])
-                    except kml.InvalidDateTimeString:
-                        kmltimestamp = ''
-                else:
-                    posfoldername = str(posnumber)
-                    kmltimestamp = ''
-                kmlmap.open_folder(posfoldername)
-                stninfo['Last Known Position'] = pos
+                heading, cog = get_position_arrows(pos)
+                if heading is not None:
+                    greenarrows.add(heading)
+                if cog is not None:
+                    orangearrows.add(cog)
+        with kml.KMLStreamWriter(outputfile, kmz=kmzoutput) as kmlmap:
+            kmlmap.create_kml_header(
+                kmz=kmzoutput, iconsused=self.stntype, ialaregion=region,
+                headings=greenarrows, cogs=orangearrows)
+            stninfo = self.get_station_info(messagetally=False)
+            if self.name != '':
+                displayname = self.mmsi + ' - ' + self.name
+            else:
+                displayname = self.mmsi
+            kmlmap.open_folder(displayname)
+            if self.stnclass in staticstations:
+                lastpos = self.get_latest_position()
+                stninfo = self.get_station_info(messagetally=True)
                 desc = kmlmap.format_kml_placemark_description(stninfo)
-                try:
-                    alt = str(pos['Altitude (m)'])
-                except KeyError:
-                    alt = '0'
-                try:
-                    heading = pos['True Heading']
-                    if heading != HEADINGUNAVAILABLE and kmzoutput:
-                        greenarrows.add(heading)
+                kmlmap.add_kml_placemark(displayname, desc,
+                                         str(lastpos['Longitude']),
+                                         str(lastpos['Latitude']),
+                                         self.stntype, '0', kmzoutput)
+            else:
+                posnumber = 1
+                stninfo = self.get_station_info(messagetally=False)
+                for pos in self.posrep:
+                    timematch = TIMEREGEX.search(pos['Time'])
+                    if timematch:
+                        posfoldername = '{} - {}'.format(
+                            posnumber, timematch.group())
+                        try:
+                            kmltimestamp = \
+                                kml.convert_timestamp_to_kmltimestamp(
+                                    pos['Time'])
+                        except kml.InvalidDateTimeString:
+                            kmltimestamp = ''
+                    else:
+                        posfoldername = str(posnumber)
+                        kmltimestamp = ''
+                    kmlmap.open_folder(posfoldername)
+                    stninfo['Last Known Position'] = pos
+                    desc = kmlmap.format_kml_placemark_description(stninfo)
+                    try:
+                        alt = str(pos['Altitude (m)'])
+                    except KeyError:
+                        alt = '0'
+                    heading, cog = get_position_arrows(pos)
+                    if heading is not None and kmzoutput:
                         hdesc = 'HEADING - {}'.format(heading)
                         kmlmap.add_kml_placemark(hdesc, '',
                                                  str(pos['Longitude']),
                                                  str(pos['Latitude']),
                                                  str(heading) + 'TH',
                                                  alt, kmzoutput, kmltimestamp)
-                except KeyError:
-                    pass
-                try:
-                    cog = int(pos['CoG'])
-                    if cog != COGUNAVAILABLE and kmzoutput:
-                        orangearrows.add(cog)
+                    if cog is not None and kmzoutput:
                         hdesc = 'CoG - {}'.format(cog)
                         kmlmap.add_kml_placemark(hdesc, '',
                                                  str(pos['Longitude']),
                                                  str(pos['Latitude']),
                                                  str(cog) + 'CoG',
                                                  alt, kmzoutput, kmltimestamp)
-                except KeyError:
-                    pass
-                try:
-                    kmlmap.add_kml_placemark(displayname, desc,
-                                             str(pos['Longitude']),
-                                             str(pos['Latitude']),
-                                             self.stntype, alt, kmzoutput,
-                                             kmltimestamp)
-                except KeyError:
-                    pass
-                kmlmap.close_folder()
-                posnumber += 1
+                    try:
+                        kmlmap.add_kml_placemark(displayname, desc,
+                                                 str(pos['Longitude']),
+                                                 str(pos['Latitude']),
+                                                 self.stntype, alt, kmzoutput,
+                                                 kmltimestamp)
+                    except KeyError:
+                        pass
+                    kmlmap.close_folder()
+                    posnumber += 1
+                kmlmap.add_kml_placemark_linestring(self.mmsi, self.posrep)
+            kmlmap.close_folder()
+            kmlmap.close_kml_file()
+            kmlmap.write_kml_doc_file()
+            if kmzoutput:
+                stntypes = [icons.ICONS[self.stntype]]
+                kmlmap.add_kmz_icons(stntypes, greenarrows, orangearrows)
+
+    def create_kml_folder(self, kmlmap, desc, kmzoutput=True,
+                          linestring=True, folderid=None):
+        """
+        add a folder for this station to a KML map with placemarks for its
+        last known position and arrows for its heading and CoG
+
+        Note:
+            the KML is cached until the station is updated
+
+        Args:
+            kmlmap(kml.KMLOutputParser): the KML map to add the folder to
+            desc(str): description for the station placemark
+            kmzoutput(bool): whether to use custom icons and arrows (True)
+                             or basic placemarks (False)
+            linestring(bool): display a line showing where the vessel has been
+            folderid(str): id for the folder, so it can be updated later
+
+        Raises:
+            NoSuitablePositionReport: if the station has no positions
+        """
+        lastpos = self.get_latest_position()
+        stnkml = self.get_fragment(
+            ('kmlfolder', desc, kmzoutput, linestring, folderid),
+            lambda: self.render_kml_folder(
+                lastpos, desc, kmzoutput, linestring, folderid))
+        kmlmap.append_kml(stnkml)
+
+    def render_kml_folder(self, lastpos, desc, kmzoutput, linestring,
+                          folderid):
+        """
+        render the KML for create_kml_folder
+
+        Args:
+            lastpos(dict): the position report to place the station at
+            desc(str): description for the station placemark
+            kmzoutput(bool): whether to use custom icons and arrows (True)
+                             or basic placemarks (False)
+            linestring(bool): display a line showing where the vessel has been
+            folderid(str): id for the folder, so it can be updated later
+
+        Returns:
+            stnkml(str): the KML for the folder
+        """
+        kmlmap = kml.KMLOutputParser(None)
+        if self.name != '':
+            displayname = self.mmsi + ' - ' + self.name
+        else:
+            displayname = self.mmsi
+        kmlmap.open_folder(displayname, folderid=folderid)
+        try:
+            alt = str(lastpos['Altitude (m)'])
+        except KeyError:
+            alt = '0'
+        heading, cog = get_position_arrows(lastpos)
+        if heading is not None and kmzoutput:
+            hdesc = 'HEADING - {}'.format(heading)
+            kmlmap.add_kml_placemark(
+                hdesc, '',
+                str(lastpos['Longitude']),
+                str(lastpos['Latitude']),
+                str(heading) + 'TH', alt, kmzoutput)
+        if cog is not None and kmzoutput:
+            hdesc = 'CoG - {}'.format(cog)
+            kmlmap.add_kml_placemark(
+                hdesc, '',
+                str(lastpos['Longitude']),
+                str(lastpos['Latitude']),
+                str(cog) + 'CoG',
+                alt, kmzoutput)
+        if linestring:
             kmlmap.add_kml_placemark_linestring(self.mmsi, self.posrep)
+        kmlmap.add_kml_placemark(displayname, desc,
+                                 str(lastpos['Longitude']),
+                                 str(lastpos['Latitude']),
+                                 self.stntype, alt, kmzoutput)
         kmlmap.close_folder()
-        kmlmap.close_kml_file()
-        kmlmap.write_kml_doc_file()
-        if kmzoutput:
-            stntypes = [icons.ICONS[self.stntype]]
-            kml.make_kmz(outputfile, stntypes, greenarrows, orangearrows)
+        return ''.join(kmlmap.kmldoc)
+
+    def create_nav_table_line(self):
+        """
+        create this station's line in the table made by
+        AISTracker.create_nav_table
+
+        Returns:
+            line(list): values for each of the NAVHEADERS
+        """
+        lastposheader = ['Latitude', 'Longitude', 'CoG', 'Speed (knots)',
+                         'Navigation Status', 'Turn Rate', 'Time']
+        stninfo = self.get_station_info()
+        line = []
+        for item in lastposheader:
+            try:
+                stninfo[item] = (stninfo['Last Known Position'][item])
+            except (NoSuitablePositionReport, TypeError, KeyError):
+                stninfo[item] = ''
+        for item in NAVHEADERS:
+            try:
+                line.append(stninfo[item])
+            except KeyError:
+                line.append('')
+        return line
+
+    def snapshot(self, latestonly=False):
+        """
+        copy this station so it can be read whilst this one is updated
+
+        Note:
+            the position reports themselves are shared, they are never
+            changed once they have been added to posrep, the fragments
+            cache is also shared so anything rendered from the snapshot
+            can be reused by the station until it is next updated
+
+        Args:
+            latestonly(bool): only copy the last position report and the
+                              details needed for get_station_info, enough
+                              to put the station on a GeoJSON map, these
+                              snapshots use latestfragments as their cache
+                              so nothing rendered from them is used by a
+                              station with all its positions
+
+        Returns:
+            stn(AISStation): copy of this station
+        """
+        stn = copy.copy(self)
+        stn.details = dict(self.details)
+        stn.sentmsgs = collections.Counter(self.sentmsgs)
+        if latestonly:
+            stn.posrep = self.posrep[-1:]
+            stn.binarymsgs = []
+            stn.fragments = self.latestfragments
+        else:
+            stn.posrep = list(self.posrep)
+            stn.binarymsgs = list(self.binarymsgs)
+        return stn
 
     def __str__(self):
         strtext = ('AIS Station - MMSI: {}, Name: {}, Class: {},'
@@ -419,6 +731,194 @@ class AISStation():
         return reprstr
 
 
+class DuplicateFilter():
+    """
+    spot AIS messages that have already been received in the last few
+    seconds, when several receivers hear the same transmission
+
+    Note:
+        payloads are kept in the order they were first seen, so the ones
+        older than the window are removed from the front, the oldest
+        payloads are also removed if there are ever more than maxsize
+
+    Args:
+        window(float): seconds a payload counts as a duplicate for
+        maxsize(int): most payloads to remember
+
+    Attributes:
+        payloads(collections.OrderedDict): keys are payloads, values are
+                                           time.monotonic() they were
+                                           first seen
+        checked(int): number of payloads checked
+        duplicates(int): number of payloads that were duplicates
+    """
+
+    def __init__(self, window=10, maxsize=100000):
+        self.window = window
+        self.maxsize = maxsize
+        self.payloads = collections.OrderedDict()
+        self.checked = 0
+        self.duplicates = 0
+
+    def is_duplicate(self, payload, currenttime=None):
+        """
+        check if a payload has been seen within the window
+
+        Args:
+            payload(str): full message payload from 1 or more NMEA sentences
+            currenttime(float): time.monotonic() the payload was received,
+                                default is now
+
+        Returns:
+            duplicate(bool): True if we have already seen this payload
+        """
+        if currenttime is None:
+            currenttime = time.monotonic()
+        self.checked += 1
+        oldest = currenttime - self.window
+        payloads = self.payloads
+        while payloads:
+            firstpayload, firstseen = next(iter(payloads.items()))
+            if firstseen > oldest and len(payloads) < self.maxsize:
+                break
+            del payloads[firstpayload]
+        if payload in payloads:
+            self.duplicates += 1
+            return True
+        payloads[payload] = currenttime
+        return False
+
+    def stats(self):
+        """
+        the duplicate counts
+
+        Returns:
+            stats(dict): messages checked, duplicates and the percentage
+                         of messages that were duplicates
+        """
+        stats = {}
+        stats['Messages Checked'] = self.checked
+        stats['Duplicates Suppressed'] = self.duplicates
+        if self.checked:
+            stats['Duplicate Rate %'] = round(
+                100 * self.duplicates / self.checked, 2)
+        else:
+            stats['Duplicate Rate %'] = 0
+        return stats
+
+
+class MessageFilter():
+    """
+    decide if an AIS message is wanted from the start of its payload,
+    before the whole message is decoded
+
+    Note:
+        the message type is the first character of the payload and the
+        MMSI is in the first 7 characters, for position reports with a
+        bounding box only the characters up to the end of the latitude
+        are converted to binary
+
+        messages that are not position reports are not checked against
+        the bounding box, positions that are not available are outside it
+
+    Args:
+        msgtypes(list): message type numbers to keep, default is all types
+        mmsis(list): MMSIs to keep, default is all MMSIs
+        bbox(list): min longitude, min latitude, max longitude and
+                    max latitude position reports must be inside,
+                    default is anywhere
+
+    Attributes:
+        checked(int): number of payloads checked
+        rejected(int): number of payloads that were not wanted
+    """
+
+    positionbits = {
+        1: (61, 89, 116, 600000.0),
+        2: (61, 89, 116, 600000.0),
+        3: (61, 89, 116, 600000.0),
+        4: (79, 107, 134, 600000.0),
+        9: (61, 89, 116, 600000.0),
+        11: (79, 107, 134, 600000.0),
+        18: (57, 85, 112, 600000.0),
+        19: (57, 85, 112, 600000.0),
+        21: (164, 192, 219, 600000.0),
+        27: (44, 62, 79, 600.0)}
+
+    def __init__(self, msgtypes=None, mmsis=None, bbox=None):
+        self.msgtypes = None
+        self.mmsis = None
+        if msgtypes:
+            self.msgtypes = {int(msgtype) for msgtype in msgtypes}
+        if mmsis:
+            self.mmsis = {int(mmsi) for mmsi in mmsis}
+        self.bbox = bbox
+        self.checked = 0
+        self.rejected = 0
+
+    def is_wanted(self, payload):
+        """
+        check the message type, MMSI and position of a payload
+
+        Note:
+            payloads too short to check are wanted, so they fail when
+            they are decoded like any other bad payload
+
+        Args:
+            payload(str): full message payload from 1 or more NMEA sentences
+
+        Returns:
+            wanted(bool): True if the message should be processed
+        """
+        self.checked += 1
+        if not payload:
+            return True
+        msgtype = ord(payload[0]) - 48
+        if msgtype > 40:
+            msgtype -= 8
+        if self.msgtypes is not None and msgtype not in self.msgtypes:
+            self.rejected += 1
+            return False
+        if self.mmsis is not None and len(payload) >= 7:
+            msgbinary = binary.ais_sentence_payload_binary(payload[:7])
+            if int(msgbinary[8:38], 2) not in self.mmsis:
+                self.rejected += 1
+                return False
+        if self.bbox and msgtype in self.positionbits:
+            lonstart, latstart, latend, divisor = self.positionbits[msgtype]
+            msgbinary = binary.ais_sentence_payload_binary(
+                payload[:(latend + 5) // 6])
+            if len(msgbinary) < latend:
+                return True
+            longitude = binary.decode_twos_complement(
+                msgbinary[lonstart:latstart]) / divisor
+            latitude = binary.decode_twos_complement(
+                msgbinary[latstart:latend]) / divisor
+            if not (self.bbox[0] <= longitude <= self.bbox[2] and
+                    self.bbox[1] <= latitude <= self.bbox[3]):
+                self.rejected += 1
+                return False
+        return True
+
+    def stats(self):
+        """
+        the filter counts
+
+        Returns:
+            stats(dict): messages checked, messages filtered out and the
+                         percentage of messages that were filtered out
+        """
+        stats = {}
+        stats['Messages Checked'] = self.checked
+        stats['Messages Filtered Out'] = self.rejected
+        if self.checked:
+            stats['Filtered Out %'] = round(
+                100 * self.rejected / self.checked, 2)
+        else:
+            stats['Filtered Out %'] = 0
+        return stats
+
+
 class AISTracker():
     """
     keep track of multiple AIS stations and their messages
@@ -430,9 +930,26 @@ class AISTracker():
                                            recieved
         messagesprocessed(int): total count of messages recieved
         timings(list): timings received from AIS base stations
+        timingset(set): the same timings as timings, so checking whether a
+                        timing has already been recorded is quick
         timingsource(list): the mmsis of AIS base stations used to provide
                            message timings, type 4 messages from this will be
                            used as a timestamp reference
+        sources(dict): keys are the names of where messages came from,
+                       values are dicts of the message and duplicate counts
+                       and the set of MMSIs heard from that source
+        duplicatefilter(DuplicateFilter): if set, messages already
+                                          received in its window are not
+                                          processed again
+        messagefilter(MessageFilter): if set, only messages it wants are
+                                      processed
+        decodecache(allmessages.DecodeCache): if set, messages with the same
+                                              payload as one already decoded
+                                              are copied from the cache
+        changehandler(function): if set, called with the station, the
+                                 message and a dict of the details that
+                                 changed, e.g. destination or ETA, whenever
+                                 a message changes a station's details
     """
 
     def __init__(self):
@@ -440,12 +957,50 @@ class AISTracker():
         self.messages = collections.Counter()
         self.messagesprocessed = 0
         self.timings = []
+        self.timingset = set()
         self.timingsource = []
+        self.sources = {}
+        self.duplicatefilter = None
+        self.messagefilter = None
+        self.decodecache = None
+        self.changehandler = None
 
     def __len__(self):
         return len(self.stations)
 
-    def process_message(self, data, timestamp=None):
+    def snapshot(self, latestonly=False):
+        """
+        copy this tracker so maps can be drawn from it whilst this one
+        carries on processing messages
+
+        Note:
+            take the snapshot whilst nothing else is processing messages,
+            it is much quicker than drawing the map itself
+
+        Args:
+            latestonly(bool): only copy the stations with their last
+                              position, only the stations should be read
+                              from the snapshot
+
+        Returns:
+            aistracker(AISTracker): copy of this tracker and its stations
+        """
+        aistracker = copy.copy(self)
+        aistracker.stations = {
+            mmsi: stn.snapshot(latestonly=latestonly)
+            for mmsi, stn in self.stations.items()}
+        if latestonly:
+            return aistracker
+        aistracker.messages = collections.Counter(self.messages)
+        aistracker.timings = list(self.timings)
+        aistracker.timingset = set(self.timingset)
+        aistracker.timingsource = copy.copy(self.timingsource)
+        aistracker.sources = {
+            source: dict(sourcestats, mmsis=set(sourcestats['mmsis']))
+            for source, sourcestats in self.sources.items()}
+        return aistracker
+
+    def process_message(self, data, timestamp=None, source=None):
         """
         determine what type of AIS message it is
 
@@ -461,50 +1016,99 @@ class AISTracker():
             timestamp(str): time this message was recieved, if provided this
                             will take precedence over timings received from AIS
                             base stations
+            source(str): where the message came from, messages and unique
+                         stations are counted for each source
 
         Raises:
             UnknownMessageType: if the message type is not in the
                                 allmessages.MSGTYPES dict
             InvalidMMSI: if the mmsi = 000000000
+            DuplicateMessage: if duplicatefilter is set and the message
+                              has already been received
+            UnwantedMessage: if messagefilter is set and does not want
+                             the message
 
         Returns:
             msgobj(messages.aismessage.AISMessage): the ais message type object
         """
-        msgbinary = binary.ais_sentence_payload_binary(data)
-        msgtype = binary.decode_sixbit_integer(msgbinary[0:6])
-        if msgtype in allmessages.MSGTYPES.keys():
-            msgobj = allmessages.MSGTYPES[msgtype](msgbinary)
+        if self.messagefilter and not self.messagefilter.is_wanted(data):
+            raise UnwantedMessage('Unwanted message - ' + data)
+        if self.duplicatefilter and self.duplicatefilter.is_duplicate(data):
+            if source is not None:
+                self.get_source_stats(source)['duplicates'] += 1
+            raise DuplicateMessage('Duplicate message - ' + data)
+        msgobj = None
+        if self.decodecache is not None:
+            msgobj = self.decodecache.get(data)
+        if msgobj is None:
+            msgbinary = binary.ais_sentence_payload_binary(data)
+            msgtype = binary.decode_sixbit_integer(msgbinary[0:6])
+            if msgtype in allmessages.MSGTYPES.keys():
+                msgobj = allmessages.MSGTYPES[msgtype](msgbinary)
+            else:
+                raise UnknownMessageType(
+                    'Unknown message type {} - {}'.format(msgtype, data))
+            if self.decodecache is not None:
+                self.decodecache.put(data, msgobj)
         else:
-            raise UnknownMessageType(
-                'Unknown message type {} - {}'.format(msgtype, data))
+            msgtype = msgobj.msgtype
         if msgobj.mmsi == '000000000':
             raise InvalidMMSI('Invalid MMSI - 000000000')
         if msgobj.mmsi not in self.stations:
             self.stations[msgobj.mmsi] = AISStation(msgobj.mmsi)
         if self.stations[msgobj.mmsi].stnclass == 'Unknown':
             self.stations[msgobj.mmsi].determine_station_class(msgobj)
-        if (self.stations[msgobj.mmsi].stntype == 'Unknown' or
+        staticchanged = self.stations[msgobj.mmsi].check_static_data(msgobj)
+        if staticchanged and (
+                self.stations[msgobj.mmsi].stntype == 'Unknown' or
                 self.stations[msgobj.mmsi].name == ''):
             self.stations[msgobj.mmsi].find_station_name_and_type(msgobj)
         if timestamp:
-            if timestamp not in self.timings:
+            if timestamp not in self.timingset:
                 self.timings.append(timestamp)
+                self.timingset.add(timestamp)
         else:
             if msgtype in (4, 11) and msgobj.mmsi in self.timingsource:
                 if (msgobj.timestamp != TIMEUNAVAILABLE and
-                        msgobj.timestamp not in self.timings and
+                        msgobj.timestamp not in self.timingset and
                         kml.DATETIMEREGEX.match(msgobj.timestamp)):
                     self.timings.append(msgobj.timestamp + ' (estimated)')
+                    self.timingset.add(msgobj.timestamp + ' (estimated)')
             try:
                 timestamp = self.timings[len(self.timings) - 1]
             except IndexError:
                 timestamp = 'N/A'
         msgobj.rxtime = timestamp
-        self.stations[msgobj.mmsi].find_position_information(msgobj)
+        changes = self.stations[msgobj.mmsi].find_position_information(
+            msgobj, staticchanged=staticchanged)
+        if changes and self.changehandler:
+            self.changehandler(self.stations[msgobj.mmsi], msgobj, changes)
         self.messagesprocessed += 1
         self.messages[allmessages.MSGDESCRIPTIONS[msgtype]] += 1
+        if source is not None:
+            sourcestats = self.get_source_stats(source)
+            sourcestats['messages'] += 1
+            sourcestats['mmsis'].add(msgobj.mmsi)
         return msgobj
 
+    def get_source_stats(self, source):
+        """
+        get the counts for a source, adding it if it is new
+
+        Args:
+            source(str): where messages came from
+
+        Returns:
+            sourcestats(dict): the message and duplicate counts and the set
+                               of MMSIs heard from that source
+        """
+        try:
+            return self.sources[source]
+        except KeyError:
+            sourcestats = self.sources[source] = {
+                'messages': 0, 'duplicates': 0, 'mmsis': set()}
+            return sourcestats
+
     def get_centre_of_map(self):
         """
         find the centre of the map based on what lat lon positions
@@ -576,6 +1180,18 @@ class AISTracker():
                 self.timingsource
         except IndexError:
             stats['Times'] = 'No time data available.'
+        if self.duplicatefilter:
+            stats['Duplicates'] = self.duplicatefilter.stats()
+        if self.messagefilter:
+            stats['Filtered'] = self.messagefilter.stats()
+        if self.decodecache is not None:
+            stats['Decode Cache'] = self.decodecache.stats()
+        if self.sources:
+            stats['Sources'] = {
+                source: {'Messages': sourcestats['messages'],
+                         'Duplicates': sourcestats['duplicates'],
+                         'Unique Stations': len(sourcestats['mmsis'])}
+                for source, sourcestats in self.sources.items()}
         return stats
 
     def all_station_info(self, verbose=True):
@@ -592,8 +1208,9 @@ class AISTracker():
         """
         allstations = {}
         for stn in self.stations_generator():
-            allstations[stn.mmsi] = stn.get_station_info(
-                verbose=verbose)
+            allstations[stn.mmsi] = stn.get_fragment(
+                ('stationinfo', verbose),
+                lambda: stn.get_station_info(verbose=verbose))
         return allstations
 
     def sort_mmsi_by_catagory(self):
@@ -618,9 +1235,50 @@ class AISTracker():
         organised['Types'] = stntypes
         return organised
 
+    def get_map_stations(self, orderby='Types', livemap=False,
+                         livemaptimeout=480):
+        """
+        get the stations to draw on a map, sorted into catagories
+
+        Args:
+            orderby(str): order the stations by 'Types', 'Flags' or 'Class'
+                          default is 'Types'
+            livemap(bool): leave out stations we have not heard from
+                           for longer than livemaptimeout
+            livemaptimeout(int): if the last postion time of a station is
+                                 greater than this, then the station will not
+                                 be displayed on the map,
+                                 default is 480 seconds (8 minutes)
+                                 APPLIES TO LIVE MAP ONLY
+
+        Returns:
+            mapstns(collections.OrderedDict): keys are catagories, values are
+                lists of tuples of AISStation and its last known position
+        """
+        mapstns = collections.OrderedDict()
+        organisedstns = self.sort_mmsi_by_catagory()
+        for catagory in organisedstns[orderby]:
+            mapstns[catagory] = []
+            for mmsi in organisedstns[orderby][catagory]:
+                stn = self.stations[mmsi]
+                try:
+                    lastpos = stn.get_latest_position()
+                except NoSuitablePositionReport:
+                    continue
+                if livemap:
+                    currenttime = datetime.datetime.utcnow()
+                    lastpostime = datetime.datetime.strptime(
+                        lastpos['Time'], '%Y/%m/%d %H:%M:%S')
+                    timediff = currenttime - lastpostime
+                    if timediff.seconds > livemaptimeout:
+                        continue
+                mapstns[catagory].append((stn, lastpos))
+        return mapstns
+
     def create_kml_map(
             self, outputfile, kmzoutput=True, linestring=True, livemap=False,
-            livemaptimeout=480, orderby='Types', region='A'):
+            livemaptimeout=480, orderby='Types', region='A',
+            incremental=False, mapstns=None):
         """
         create a KML map of all the vessels we have on record
 
@@ -638,86 +1296,70 @@ class AISTracker():
             orderby(str): order the stations by 'Types', 'Flags' or 'Class'
                           default is 'Types'
             region(str): IALA region, default is A
+            incremental(bool): the map will be changed later by KML updates,
+                               give the document and folders ids and write
+                               every style in the header
+            mapstns(collections.OrderedDict): the stations to draw, as
+                returned by get_map_stations, default is to get them using
+                orderby, livemap and livemaptimeout
+
+        Returns:
+            mapstns(collections.OrderedDict): the stations on the map, as
+                returned by get_map_stations
         """
-        types = set()
+        stntypes = set()
         headings = set()
         cogs = set()
-        if kmzoutput and not livemap:
-            docpath = os.path.join(os.path.dirname(outputfile), 'doc.kml')
-        else:
-            docpath = os.path.join(outputfile)
-        kmlmap = kml.KMLOutputParser(docpath)
-        kmlmap.create_kml_header(kmz=kmzoutput, ialaregion=region)
-        organisedstns = self.sort_mmsi_by_catagory()
-        for catagory in organisedstns[orderby]:
-            kmlmap.open_folder(catagory)
-            for mmsi in organisedstns[orderby][catagory]:
-                stn = self.stations[mmsi]
-                try:
-                    lastpos = stn.get_latest_position()
+        if mapstns is None:
+            mapstns = self.get_map_stations(
+                orderby=orderby, livemap=livemap,
+                livemaptimeout=livemaptimeout)
+        for catagory in mapstns:
+            for stn, lastpos in mapstns[catagory]:
+                heading, cog = get_position_arrows(lastpos)
+                if kmzoutput:
+                    if heading is not None:
+                        headings.add(heading)
+                    if cog is not None:
+                        cogs.add(cog)
+                stntypes.add(stn.stntype)
+        with kml.KMLStreamWriter(
+            outputfile, kmz=kmzoutput and not livemap) as kmlmap:
+            if incremental:
+                kmlmap.create_kml_header(
+                    kmz=kmzoutput, ialaregion=region,
+                    documentid=kml.LIVEMAPDOCUMENTID)
+            else:
+                kmlmap.create_kml_header(
+                    kmz=kmzoutput, iconsused=stntypes, ialaregion=region,
+                    headings=headings, cogs=cogs)
+            for catagory in mapstns:
+                catagoryid = None
+                if incremental:
+                    catagoryid = kml.create_feature_id('catagory', catagory)
+                kmlmap.open_folder(catagory, folderid=catagoryid)
+                for stn, lastpos in mapstns[catagory]:
                     if livemap:
-                        currenttime = datetime.datetime.utcnow()
-                        lastpostime = datetime.datetime.strptime(
-                            lastpos['Time'], '%Y/%m/%d %H:%M:%S')
-                        timediff = currenttime - lastpostime
-                        if timediff.seconds > livemaptimeout:
-                            continue
                         desc = lastpos['Time']
                     else:
-                        stninfo = stn.get_station_info()
-                        desc = kmlmap.format_kml_placemark_description(stninfo)
-                    if stn.name != '':
-                        displayname = stn.mmsi + ' - ' + stn.name
-                    else:
-                        displayname = stn.mmsi
-                    kmlmap.open_folder(displayname)
-                    try:
-                        alt = str(lastpos['Altitude (m)'])
-                    except KeyError:
-                        alt = '0'
-                    try:
-                        heading = lastpos['True Heading']
-                        if heading != HEADINGUNAVAILABLE and kmzoutput:
-                            headings.add(heading)
-                            hdesc = 'HEADING - {}'.format(heading)
-                            kmlmap.add_kml_placemark(
-                                hdesc, '',
-                                str(lastpos['Longitude']),
-                                str(lastpos['Latitude']),
-                                str(heading) + 'TH', alt, kmzoutput)
-                    except KeyError:
-                        pass
-                    try:
-                        cog = int(lastpos['CoG'])
-                        if cog != COGUNAVAILABLE and kmzoutput:
-                            cogs.add(cog)
-                            hdesc = 'CoG - {}'.format(cog)
-                            kmlmap.add_kml_placemark(
-                                hdesc, '',
-                                str(lastpos['Longitude']),
-                                str(lastpos['Latitude']),
-                                str(cog) + 'CoG',
-                                alt, kmzoutput)
-                    except KeyError:
-                        pass
-                    if linestring:
-                        posreps = stn.posrep
-                        kmlmap.add_kml_placemark_linestring(
-                            stn.mmsi, posreps)
-                    kmlmap.add_kml_placemark(displayname, desc,
-                                             str(lastpos['Longitude']),
-                                             str(lastpos['Latitude']),
-                                             stn.stntype, alt, kmzoutput)
-                    kmlmap.close_folder()
-                    types.add(icons.ICONS[stn.stntype])
-                except NoSuitablePositionReport:
-                    continue
-            kmlmap.close_folder()
-        kmlmap.close_kml_file()
-        kmlmap.write_kml_doc_file()
-        if kmzoutput and not livemap:
-            kml.make_kmz(outputfile, iconslist=types, greenarrows=headings,
-                         orangearrows=cogs)
+                        desc = stn.get_fragment(
+                            'kmldescription',
+                            lambda: kmlmap.format_kml_placemark_description(
+                                stn.get_station_info()))
+                    stnid = None
+                    if incremental:
+                        stnid = kml.create_feature_id('station', stn.mmsi)
+                    stn.create_kml_folder(
+                        kmlmap, desc, kmzoutput=kmzoutput,
+                        linestring=linestring, folderid=stnid)
+                kmlmap.close_folder()
+            kmlmap.close_kml_file()
+            kmlmap.write_kml_doc_file()
+            if kmzoutput and not livemap:
+                types = set(icons.ICONS[stntype] for stntype in stntypes)
+                kmlmap.add_kmz_icons(iconslist=types, greenarrows=headings,
+                                     orangearrows=cogs)
+        return mapstns
 
     def create_geojson_map(self, outputfile=None):
         """
@@ -738,18 +1380,15 @@ class AISTracker():
             except NoSuitablePositionReport:
                 continue
             currentmmsi = stn.mmsi
-            currentproperties = {}
-            currentproperties.update(
-                stn.get_station_info())
-            try:
-                currentproperties['Heading'] = lastpos['True Heading']
-            except KeyError:
-                currentproperties['Heading'] = HEADINGUNAVAILABLE
+            currentproperties = stn.get_fragment(
+                'geojsonproperties',
+                lambda: stn.get_geojson_properties(lastpos))
             lastlat = lastpos['Latitude']
             lastlon = lastpos['Longitude']
-            currentcoords = []
-            for pos in stn.posrep:
-                currentcoords.append([pos['Longitude'], pos['Latitude']])
+            currentcoords = stn.get_fragment(
+                'geojsoncoords',
+                lambda: [[pos['Longitude'], pos['Latitude']]
+                         for pos in stn.posrep])
             geojsonmap.add_station_info(currentmmsi,
                                         currentproperties,
                                         currentcoords,
@@ -775,26 +1414,13 @@ class AISTracker():
                             in the table
         """
         csvtable = []
-        lastposheader = ['Latitude', 'Longitude', 'CoG', 'Speed (knots)',
-                         'Navigation Status', 'Turn Rate', 'Time']
         if mmsilist:
             stations = mmsilist
         else:
             stations = self.stations_generator()
         for stn in stations:
-            stninfo = stn.get_station_info()
-            line = []
-            for item in lastposheader:
-                try:
-                    stninfo[item] = (stninfo['Last Known Position'][item])
-                except (NoSuitablePositionReport, TypeError, KeyError):
-                    stninfo[item] = ''
-            for item in NAVHEADERS:
-                try:
-                    line.append(stninfo[item])
-                except KeyError:
-                    line.append('')
-            csvtable.append(line)
+            csvtable.append(stn.get_fragment(
+                'navtableline', stn.create_nav_table_line))
         return csvtable
 
     def create_table_data(self, mmsilist=None, csvheader=None,
@@ -944,3 +1570,15 @@ class NoSuitablePositionReport(Exception):
     """
     raise if we cannot get a position
     """
+
+
+class DuplicateMessage(Exception):
+    """
+    raise when a message has already been received from another receiver
+    """
+
+
+class UnwantedMessage(Exception):
+    """
+    raise when a message is not wanted by the message filter
+    """
@@ -6,8 +6,12 @@ helper module to get all the AIS pyaisnmea.messages together in one module
 # pylint: disable=import-error
 # pylint: disable=no-name-in-module
 
+import array
+import bisect
 import collections
+import functools
 
+import pyaisnmea.binary as binary
 import pyaisnmea.messages
 import pyaisnmea.messages.aismessage
 import pyaisnmea.messages.t123
@@ -69,6 +73,111 @@ MSGTYPES = {
     27: pyaisnmea.messages.t27.Type27LongRangeAISPositionReport}
 
 
+class DecodeCache():
+    """
+    least recently used cache of decoded message fields keyed by payload,
+    static messages are often sent again with exactly the same payload
+
+    Note:
+        the fields are copied from the message object as soon as it is
+        decoded, a hit makes a new message object of the same class from
+        a copy of them without decoding any binary. only message types
+        whose fields are all immutable values should be cached.
+
+    Args:
+        maxsize(int): most payloads to keep
+        msgtypes(tuple): message type numbers to cache
+
+    Attributes:
+        messages(collections.OrderedDict): keys are payloads, values are
+                                           tuples of the message class and
+                                           a dict of its fields
+        hits(int): number of messages found in the cache
+        misses(int): number of messages not found in the cache, including
+                     messages of types that are never cached
+    """
+
+    def __init__(self, maxsize=10000, msgtypes=(4, 5, 21, 24)):
+        self.maxsize = maxsize
+        self.msgtypes = frozenset(msgtypes)
+        self.messages = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.messages)
+
+    def get(self, payload):
+        """
+        get a new message object for a payload if it is in the cache
+
+        Args:
+            payload(str): full message payload from 1 or more NMEA sentences
+
+        Returns:
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+                                                               or None if
+                                                               not cached
+        """
+        try:
+            msgclass, fields = self.messages[payload]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.messages.move_to_end(payload)
+        self.hits += 1
+        msgobj = msgclass.__new__(msgclass)
+        msgobj.__dict__.update(fields)
+        return msgobj
+
+    def put(self, payload, msgobj):
+        """
+        cache the fields of a message that has just been decoded
+
+        Args:
+            payload(str): full message payload from 1 or more NMEA sentences
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        if msgobj.msgtype not in self.msgtypes:
+            return
+        self.messages[payload] = (type(msgobj), dict(msgobj.__dict__))
+        if len(self.messages) > self.maxsize:
+            self.messages.popitem(last=False)
+
+    def stats(self):
+        """
+        the cache counts
+
+        Returns:
+            stats(dict): cache hits, misses and the percentage of messages
+                         that were hits
+        """
+        stats = {}
+        stats['Cache Hits'] = self.hits
+        stats['Cache Misses'] = self.misses
+        lookups = self.hits + self.misses
+        if lookups:
+            stats['Hit Rate %'] = round(100 * self.hits / lookups, 2)
+        else:
+            stats['Hit Rate %'] = 0
+        return stats
+
+
+def create_message_log(compact=False):
+    """
+    get a new message log
+
+    Args:
+        compact(bool): use the lower memory CompactAISMessageLog
+
+    Returns:
+        messagelog(AISMessageLog): an empty message log
+    """
+    if compact:
+        return CompactAISMessageLog()
+    return AISMessageLog()
+
+
 class AISMessageLog():
     """
     class to store individual AISMessage objects where they can be easily
@@ -91,6 +200,9 @@ class AISMessageLog():
         self.messagesbymmsi = collections.defaultdict(list)
         self.mesagesbytype = collections.defaultdict(list)
 
+    def __len__(self):
+        return len(self.messagedict)
+
     def store(self, msgno, payload, msgobj):
         """
         store a message in the messagedict
@@ -112,10 +224,84 @@ class AISMessageLog():
         self.messagesbymmsi.clear()
         self.mesagesbytype.clear()
 
+    def get_message(self, msgno, payload):
+        """
+        get a single message from the log
+
+        Args:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+
+        Raises:
+            KeyError: if the message is not in the log
+
+        Returns:
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        return self.messagedict[(msgno, payload)]
+
+    def messages_generator(self, mmsi=None):
+        """
+        iterate over the messages in the order they were received
+
+        Args:
+            mmsi(str): only yield messages from this mmsi
+                       all messages are yielded if mmsi is None
+
+        Yields:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        if mmsi:
+            messages = self.messagesbymmsi[mmsi]
+        else:
+            messages = self.messagedict
+        for msg in messages:
+            yield msg[0], msg[1], self.messagedict[msg]
+
+    def message_table_generator(self):
+        """
+        iterate over the messages to make up the rows of the message log table
+        in the GUI
+
+        Yields:
+            line(list): message number, payload, description, mmsi and
+                        received time
+        """
+        for msgno, payload, msgobj in self.messages_generator():
+            yield [msgno, payload, msgobj.description, msgobj.mmsi,
+                   msgobj.rxtime]
+
+    def debug_output_generator(self, mmsi=None):
+        """
+        prepare output to jsonlines and csv one message at a time
+
+        Args:
+            mmsi(str): the mmsi of a AIS station we want the messages of
+                       all messages are yielded if mmsi is None
+
+        Yields:
+            message(dict): the AIS message for a JSON lines file
+            singlemsg(list): the AIS message as a row for a csv file
+        """
+        for _, payload, msgobj in self.messages_generator(mmsi=mmsi):
+            message = {}
+            message['payload'] = payload
+            message.update(msgobj.__dict__)
+            message.pop('msgbinary', None)
+            singlemsg = [payload, msgobj.mmsi, msgobj.msgtype,
+                         msgobj.rxtime, msgobj.__str__()]
+            yield message, singlemsg
+
     def debug_output(self, mmsi=None):
         """
         prepare output to jsonlines and csv
 
+        Note:
+            for large logs use export.write_debug_files which writes the
+            messages out as they are generated
+
         Args:
             mmsi(str): the mmsi of a AIS station we want the messages of
                        all messages are returned if mmsi is None
@@ -127,20 +313,203 @@ class AISMessageLog():
         csvlist = []
         jsonlines = []
         csvlist.append(self.csvheaders)
-        if mmsi:
-            messages = self.messagesbymmsi[mmsi]
-        else:
-            messages = self.messagedict
-        for msg in messages:
-            payload = msg[1]
-            message = {}
-            message['payload'] = payload
-            message.update(self.messagedict[msg].__dict__)
-            message.pop('msgbinary', None)
+        for message, singlemsg in self.debug_output_generator(mmsi=mmsi):
             jsonlines.append(message)
-            singlemsg = [payload, self.messagedict[msg].mmsi,
-                         self.messagedict[msg].msgtype,
-                         self.messagedict[msg].rxtime,
-                         self.messagedict[msg].__str__()]
             csvlist.append(singlemsg)
         return (jsonlines, csvlist)
+
+
+class CompactAISMessageLog(AISMessageLog):
+    """
+    a lower memory version of the AISMessageLog
+
+    Note:
+        only the payload, received time and a few small integers are kept for
+        each message, the message objects are decoded again from the payload
+        when they are needed. the most recently decoded messages are kept in
+        a least recently used cache.
+
+    Args:
+        cachesize(int): maximum number of decoded message objects to keep
+
+    Attributes:
+        payloads(list): NMEA payload of each message
+        msgnumbers(array.array): message number of each message
+        msgtypes(array.array): message type number of each message
+        mmsis(array.array): mmsi of each message as an integer
+        rxtimeindexes(array.array): index into rxtimes for each message
+        rxtimes(list): unique received times
+        rxtimelookup(dict): received time to its index in rxtimes
+        messagesbymmsi(collections.defaultdict): row numbers of the messages
+                                                 for each mmsi
+        messagesbytype(collections.defaultdict): row numbers of the messages
+                                                 for each message type
+        decodecache(collections.OrderedDict): keys are row numbers, values
+                                              are the decoded AISMessage
+                                              objects
+    """
+
+    def __init__(self, cachesize=1000):
+        super().__init__()
+        self.cachesize = cachesize
+        self.payloads = []
+        self.msgnumbers = array.array('L')
+        self.msgtypes = array.array('B')
+        self.mmsis = array.array('L')
+        self.rxtimeindexes = array.array('L')
+        self.rxtimes = []
+        self.rxtimelookup = {}
+        self.messagesbymmsi = collections.defaultdict(
+            functools.partial(array.array, 'L'))
+        self.mesagesbytype = collections.defaultdict(
+            functools.partial(array.array, 'L'))
+        self.decodecache = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def store(self, msgno, payload, msgobj):
+        """
+        store the payload and details needed to decode the message again
+
+        Args:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        self.store_payload(msgno, payload, msgobj.msgtype, msgobj.mmsi,
+                           msgobj.rxtime)
+
+    def store_payload(self, msgno, payload, msgtype, mmsi, rxtime):
+        """
+        store the payload and details needed to decode the message again
+        without needing the message object
+
+        Args:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+            msgtype(int): the message type number
+            mmsi(str): the mmsi of the AIS station that sent the message
+            rxtime(str): the time the message was received
+        """
+        row = len(self.payloads)
+        try:
+            rxtimeindex = self.rxtimelookup[rxtime]
+        except KeyError:
+            rxtimeindex = len(self.rxtimes)
+            self.rxtimes.append(rxtime)
+            self.rxtimelookup[rxtime] = rxtimeindex
+        self.payloads.append(payload)
+        self.msgnumbers.append(msgno)
+        self.msgtypes.append(msgtype)
+        self.mmsis.append(int(mmsi))
+        self.rxtimeindexes.append(rxtimeindex)
+        self.messagesbymmsi[mmsi].append(row)
+        self.mesagesbytype[msgtype].append(row)
+
+    def clear(self):
+        """
+        clear all saved data from this object
+        """
+        self.payloads.clear()
+        self.msgnumbers = array.array('L')
+        self.msgtypes = array.array('B')
+        self.mmsis = array.array('L')
+        self.rxtimeindexes = array.array('L')
+        self.rxtimes.clear()
+        self.rxtimelookup.clear()
+        self.messagesbymmsi.clear()
+        self.mesagesbytype.clear()
+        self.decodecache.clear()
+
+    def decode_row(self, row):
+        """
+        get the message object for a row, decoding it from the payload if it
+        is not already in the cache
+
+        Args:
+            row(int): the position of the message in the log
+
+        Returns:
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        try:
+            self.decodecache.move_to_end(row)
+            return self.decodecache[row]
+        except KeyError:
+            pass
+        msgbinary = binary.ais_sentence_payload_binary(self.payloads[row])
+        msgobj = MSGTYPES[self.msgtypes[row]](msgbinary)
+        msgobj.rxtime = self.rxtimes[self.rxtimeindexes[row]]
+        try:
+            # some message types add the rxtime to their details when this
+            # is called by the AISStation, do the same so the output matches
+            msgobj.get_details()
+        except NotImplementedError:
+            pass
+        self.decodecache[row] = msgobj
+        if len(self.decodecache) > self.cachesize:
+            self.decodecache.popitem(last=False)
+        return msgobj
+
+    def get_message(self, msgno, payload):
+        """
+        get a single message from the log
+
+        Note:
+            message numbers are stored in the order they were received so
+            we can use a binary search to find the row
+
+        Args:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+
+        Raises:
+            KeyError: if the message is not in the log
+
+        Returns:
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        row = bisect.bisect_left(self.msgnumbers, msgno)
+        while (row < len(self.msgnumbers) and
+               self.msgnumbers[row] == msgno):
+            if self.payloads[row] == payload:
+                return self.decode_row(row)
+            row += 1
+        raise KeyError((msgno, payload))
+
+    def messages_generator(self, mmsi=None):
+        """
+        iterate over the messages in the order they were received
+
+        Args:
+            mmsi(str): only yield messages from this mmsi
+                       all messages are yielded if mmsi is None
+
+        Yields:
+            msgno(int): number of the order in which the message was received
+            payload(str): the NMEA payload as a string
+            msgobj(pyaisnmea.messages.aismessage.AISMessage): the AIS message
+        """
+        if mmsi:
+            rows = self.messagesbymmsi.get(mmsi, ())
+        else:
+            rows = range(len(self.payloads))
+        for row in rows:
+            yield self.msgnumbers[row], self.payloads[row], \
+                self.decode_row(row)
+
+    def message_table_generator(self):
+        """
+        iterate over the messages to make up the rows of the message log table
+        in the GUI without decoding any of the messages
+
+        Yields:
+            line(list): message number, payload, description, mmsi and
+                        received time
+        """
+        for row, payload in enumerate(self.payloads):
+            yield [self.msgnumbers[row], payload,
+                   MSGDESCRIPTIONS.get(self.msgtypes[row], 'Unknown'),
+                   format(self.mmsis[row], '09d'),
+                   self.rxtimes[self.rxtimeindexes[row]]]
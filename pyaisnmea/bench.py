@@ -0,0 +1,691 @@
+"""
+benchmark the decode, track and export pipeline on synthetic AIS traffic
+
+run with python3 -m pyaisnmea.bench, every stage is timed on the same
+generated sentences and the results can be saved to a JSON file so the
+speed of different versions can be compared
+"""
+
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import pyaisnmea.ais as ais
+import pyaisnmea.allmessages as allmessages
+import pyaisnmea.binary as binary
+import pyaisnmea.capturefile as capturefile
+import pyaisnmea.export as export
+import pyaisnmea.nmea as nmea
+import pyaisnmea.version as version
+
+
+CENTRELAT = 50.75
+CENTRELON = -1.25
+MAXFRAGMENT = 56
+
+
+def pack_fields(fields):
+    """
+    pack numbers and text into an AIS message binary string
+
+    Args:
+        fields(list): tuples of a value and the number of bits it takes up,
+                      ints are stored as twos complement so negative
+                      numbers can be used, strs are stored as six bit ASCII
+                      padded with @
+
+    Returns:
+        msgbinary(str): the message as binary in a string e.g '01101010111'
+    """
+    bits = []
+    for value, length in fields:
+        if isinstance(value, str):
+            text = value.upper()[:length // 6].ljust(length // 6, '@')
+            for char in text:
+                code = ord(char)
+                if code >= 64:
+                    code -= 64
+                bits.append(format(code, '06b'))
+        else:
+            bits.append(format(value & ((1 << length) - 1),
+                               '0{}b'.format(length)))
+    return ''.join(bits)
+
+
+def create_sentences(msgbinary, sequenceid, channel):
+    """
+    wrap an AIS message binary string in NMEA 0183 sentences
+
+    Args:
+        msgbinary(str): the message as binary in a string
+        sequenceid(int): 0 to 9, used to join multipart messages together
+        channel(str): AIS channel A or B
+
+    Returns:
+        sentences(list): NMEA 0183 sentences as strings
+    """
+    fillbits = -len(msgbinary) % 6
+    payload = binary.ais_sentence_binary_payload(msgbinary + '0' * fillbits)
+    fragments = [payload[pos:pos + MAXFRAGMENT]
+                 for pos in range(0, len(payload), MAXFRAGMENT)]
+    sentences = []
+    for fragmentno, fragment in enumerate(fragments, 1):
+        if len(fragments) == 1:
+            seqid = ''
+        else:
+            seqid = str(sequenceid)
+        if fragmentno == len(fragments):
+            fill = fillbits
+        else:
+            fill = 0
+        data = 'AIVDM,{},{},{},{},{},{}'.format(
+            len(fragments), fragmentno, seqid, channel, fragment, fill)
+        chksum = 0
+        for char in data:
+            chksum ^= ord(char)
+        sentences.append('!{}*{:02X}'.format(data, chksum))
+    return sentences
+
+
+class TrafficGenerator():
+    """
+    make up realistic looking AIS traffic from a fleet of stations
+
+    Note:
+        the mix is roughly what a coastal receiver hears, mostly Class A
+        and Class B position reports with static data, base station
+        reports and navigation aids, static messages are sent again with
+        the same payload as real transponders do
+
+    Args:
+        stations(int): number of ships to make up
+        seed(int): seed for the random numbers so runs can be repeated
+
+    Attributes:
+        classa(list): dicts of the state of each Class A ship
+        classb(list): dicts of the state of each Class B ship
+        basestations(list): MMSIs of the base stations
+        navaids(list): dicts of each navigation aid
+        msgcount(int): number of messages made up so far, base station
+                       times go up by a second for every message
+    """
+
+    def __init__(self, stations=1000, seed=1):
+        self.random = random.Random(seed)
+        classacount = max(1, stations * 7 // 10)
+        self.classa = [self.create_ship(232000000 + shipno)
+                       for shipno in range(classacount)]
+        self.classb = [self.create_ship(235000000 + shipno)
+                       for shipno in range(max(1, stations - classacount))]
+        self.basestations = [2320000 + stnno
+                             for stnno in range(max(1, stations // 100))]
+        self.navaids = [self.create_ship(992350000 + aidno)
+                        for aidno in range(max(1, stations // 20))]
+        self.sequenceid = 0
+        self.msgcount = 0
+
+    def create_ship(self, mmsi):
+        """
+        make up a station somewhere near the centre of the area
+
+        Args:
+            mmsi(int): the station's MMSI
+
+        Returns:
+            ship(dict): MMSI, name, position, speed and course
+        """
+        return {
+            'mmsi': mmsi,
+            'name': 'VESSEL {}'.format(mmsi % 100000),
+            'callsign': 'M{}'.format(mmsi % 1000000),
+            'destination': self.random.choice(
+                ('SOUTHAMPTON', 'PORTSMOUTH', 'COWES', 'POOLE', 'LE HAVRE')),
+            'shiptype': self.random.choice((30, 36, 37, 52, 60, 70, 80)),
+            'latitude': CENTRELAT + self.random.uniform(-0.5, 0.5),
+            'longitude': CENTRELON + self.random.uniform(-0.75, 0.75),
+            'speed': self.random.randint(0, 250),
+            'course': self.random.randint(0, 3599)}
+
+    def move(self, ship):
+        """
+        move a ship a short way along its course
+
+        Args:
+            ship(dict): the ship to move
+        """
+        ship['latitude'] += self.random.uniform(-0.001, 0.001)
+        ship['longitude'] += self.random.uniform(-0.001, 0.001)
+        ship['course'] = (ship['course'] + self.random.randint(-20, 20)) % 3600
+
+    def position_report_class_a(self, ship):
+        """
+        Args:
+            ship(dict): the ship sending the message
+
+        Returns:
+            msgbinary(str): a type 1, 2 or 3 message
+        """
+        self.move(ship)
+        return pack_fields([
+            (self.random.choice((1, 1, 1, 2, 3)), 6), (0, 2),
+            (ship['mmsi'], 30), (0, 4), (0, 8), (ship['speed'], 10), (1, 1),
+            (round(ship['longitude'] * 600000), 28),
+            (round(ship['latitude'] * 600000), 27),
+            (ship['course'], 12), (ship['course'] // 10, 9),
+            (self.msgcount % 60, 6), (0, 2), (0, 3), (0, 1), (0, 19)])
+
+    def position_report_class_b(self, ship):
+        """
+        Args:
+            ship(dict): the ship sending the message
+
+        Returns:
+            msgbinary(str): a type 18 message
+        """
+        self.move(ship)
+        return pack_fields([
+            (18, 6), (0, 2), (ship['mmsi'], 30), (0, 8),
+            (ship['speed'], 10), (0, 1),
+            (round(ship['longitude'] * 600000), 28),
+            (round(ship['latitude'] * 600000), 27),
+            (ship['course'], 12), (511, 9), (self.msgcount % 60, 6),
+            (0, 2), (1, 1), (0, 1), (1, 1), (1, 1), (1, 1), (0, 1),
+            (0, 1), (0, 20)])
+
+    @staticmethod
+    def static_data_class_a(ship):
+        """
+        Args:
+            ship(dict): the ship sending the message
+
+        Returns:
+            msgbinary(str): a type 5 message
+        """
+        return pack_fields([
+            (5, 6), (0, 2), (ship['mmsi'], 30), (0, 2),
+            (9000000 + ship['mmsi'] % 1000000, 30),
+            (ship['callsign'], 42), (ship['name'], 120),
+            (ship['shiptype'], 8), (100, 9), (50, 9), (10, 6), (10, 6),
+            (1, 4), (6, 4), (15, 5), (12, 5), (30, 6), (55, 8),
+            (ship['destination'], 120), (0, 1), (0, 1)])
+
+    @staticmethod
+    def static_data_class_b(ship, partno):
+        """
+        Args:
+            ship(dict): the ship sending the message
+            partno(int): 0 for the name, 1 for the type and callsign
+
+        Returns:
+            msgbinary(str): a type 24 message
+        """
+        if partno == 0:
+            return pack_fields([
+                (24, 6), (0, 2), (ship['mmsi'], 30), (0, 2),
+                (ship['name'], 120), (0, 8)])
+        return pack_fields([
+            (24, 6), (0, 2), (ship['mmsi'], 30), (1, 2),
+            (ship['shiptype'], 8), ('PYA', 18), (1, 4), (12345, 20),
+            (ship['callsign'], 42), (10, 9), (5, 9), (2, 6), (2, 6),
+            (0, 6)])
+
+    def base_station_report(self, mmsi):
+        """
+        Args:
+            mmsi(int): MMSI of the base station
+
+        Returns:
+            msgbinary(str): a type 4 message, the time goes up by a
+                            second for every message generated
+        """
+        seconds = self.msgcount
+        return pack_fields([
+            (4, 6), (0, 2), (mmsi, 30), (2021, 14), (6, 4), (1, 5),
+            (seconds // 3600 % 24, 5), (seconds // 60 % 60, 6),
+            (seconds % 60, 6), (1, 1),
+            (round(CENTRELON * 600000), 28),
+            (round(CENTRELAT * 600000), 27),
+            (7, 4), (0, 10), (0, 1), (0, 19)])
+
+    def navigation_aid_report(self, navaid):
+        """
+        Args:
+            navaid(dict): the navigation aid sending the message
+
+        Returns:
+            msgbinary(str): a type 21 message
+        """
+        return pack_fields([
+            (21, 6), (0, 2), (navaid['mmsi'], 30), (24, 5),
+            (navaid['name'], 120), (1, 1),
+            (round(navaid['longitude'] * 600000), 28),
+            (round(navaid['latitude'] * 600000), 27),
+            (0, 9), (0, 9), (0, 6), (0, 6), (7, 4),
+            (self.msgcount % 60, 6), (0, 1), (0, 8), (0, 1), (0, 1),
+            (0, 1), (0, 1)])
+
+    def create_message(self):
+        """
+        pick a station and a message type and make up the message
+
+        Returns:
+            msgbinary(str): the message as binary in a string
+        """
+        self.msgcount += 1
+        choice = self.random.random()
+        if choice < 0.65:
+            return self.position_report_class_a(
+                self.random.choice(self.classa))
+        if choice < 0.83:
+            return self.position_report_class_b(
+                self.random.choice(self.classb))
+        if choice < 0.90:
+            return self.static_data_class_a(self.random.choice(self.classa))
+        if choice < 0.94:
+            return self.static_data_class_b(
+                self.random.choice(self.classb), self.random.randint(0, 1))
+        if choice < 0.97:
+            return self.base_station_report(
+                self.random.choice(self.basestations))
+        return self.navigation_aid_report(self.random.choice(self.navaids))
+
+    def sentences(self, messages):
+        """
+        generate NMEA sentences for a number of messages
+
+        Args:
+            messages(int): how many AIS messages to make up
+
+        Yields:
+            sentence(str): a NMEA 0183 sentence
+        """
+        for _ in range(messages):
+            msgbinary = self.create_message()
+            self.sequenceid = (self.sequenceid + 1) % 10
+            channel = 'AB'[self.msgcount % 2]
+            yield from create_sentences(msgbinary, self.sequenceid, channel)
+
+
+class Benchmark():
+    """
+    time each stage of the pipeline and keep the results
+
+    Args:
+        tracememory(bool): measure the peak memory allocated by each stage
+                           with tracemalloc, this makes each stage slower
+
+    Attributes:
+        stages(dict): keys are stage names, values are dicts of the
+                      results for that stage
+    """
+
+    def __init__(self, tracememory=False):
+        self.tracememory = tracememory
+        self.stages = {}
+
+    def run_stage(self, name, function, items, unit='messages'):
+        """
+        time a stage and save its results
+
+        Args:
+            name(str): name of the stage
+            function(function): called with no arguments to run the stage
+            items(int): number of things the stage works on
+            unit(str): what the items are
+
+        Returns:
+            result: what function returned
+        """
+        if self.tracememory:
+            tracemalloc.start()
+        starttime = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - starttime
+        stage = {}
+        stage['Items'] = items
+        stage['Unit'] = unit
+        stage['Seconds'] = round(seconds, 4)
+        if seconds:
+            stage['Items per Second'] = round(items / seconds, 1)
+        else:
+            stage['Items per Second'] = 0
+        if self.tracememory:
+            stage['Peak Memory (MB)'] = round(
+                tracemalloc.get_traced_memory()[1] / 1048576, 2)
+            tracemalloc.stop()
+        self.stages[name] = stage
+        return result
+
+
+def parse_sentences(sentences):
+    """
+    split each sentence into its fields without checking the checksum
+
+    Args:
+        sentences(list): NMEA 0183 sentences
+    """
+    for sentence in sentences:
+        nmea.NMEA0183Sentence(sentence, errorcheck=False)
+
+
+def check_checksums(sentences):
+    """
+    check the checksum of each sentence
+
+    Args:
+        sentences(list): NMEA 0183 sentences
+    """
+    for sentence in sentences:
+        nmea.calculate_nmea_checksum(sentence)
+
+
+def reassemble_messages(sentences):
+    """
+    get the payloads of all the messages with a NMEAtracker
+
+    Args:
+        sentences(list): NMEA 0183 sentences
+
+    Returns:
+        nmeatracker(nmea.NMEAtracker): the tracker that read the sentences
+        payloads(list): the full payload of each message
+    """
+    nmeatracker = nmea.NMEAtracker()
+    payloads = []
+    for sentence in sentences:
+        payload = nmeatracker.process_sentence(sentence)
+        if payload:
+            payloads.append(payload)
+    return nmeatracker, payloads
+
+
+def payloads_to_binary(payloads):
+    """
+    Args:
+        payloads(list): full message payloads
+
+    Returns:
+        msgbinaries(list): each payload as binary in a string
+    """
+    return [binary.ais_sentence_payload_binary(payload)
+            for payload in payloads]
+
+
+def decode_messages(msgbinaries):
+    """
+    build the message object for each message binary
+
+    Args:
+        msgbinaries(list): message binaries all of the same type
+    """
+    for msgbinary in msgbinaries:
+        allmessages.MSGTYPES[int(msgbinary[0:6], 2)](msgbinary)
+
+
+def track_messages(payloads, decodecache=None):
+    """
+    process every message with an AISTracker
+
+    Args:
+        payloads(list): full message payloads
+        decodecache(allmessages.DecodeCache): cache for the tracker to use
+
+    Returns:
+        aistracker(ais.AISTracker): the tracker that processed the messages
+        msgobjs(list): the message objects
+    """
+    aistracker = ais.AISTracker()
+    aistracker.timingsource = []
+    aistracker.decodecache = decodecache
+    msgobjs = []
+    for msgno, payload in enumerate(payloads):
+        timestamp = time.strftime(
+            '%Y/%m/%d %H:%M:%S', time.gmtime(1622505600 + msgno))
+        msgobjs.append(aistracker.process_message(payload, timestamp))
+    return aistracker, msgobjs
+
+
+def store_messages(messagelog, payloads, msgobjs):
+    """
+    store every message in a message log
+
+    Args:
+        messagelog(allmessages.AISMessageLog): log to store the messages in
+        payloads(list): full message payloads
+        msgobjs(list): the message objects for the payloads
+
+    Returns:
+        messagelog(allmessages.AISMessageLog): the log
+    """
+    for msgno, (payload, msgobj) in enumerate(zip(payloads, msgobjs), 1):
+        messagelog.store(msgno, payload, msgobj)
+    return messagelog
+
+
+def run_benchmark(messages=100000, stations=1000, seed=1,
+                  tracememory=False, exports=True):
+    """
+    run every stage of the benchmark
+
+    Args:
+        messages(int): number of AIS messages to generate
+        stations(int): number of ships in the generated traffic
+        seed(int): seed for the traffic generator
+        tracememory(bool): measure the peak memory of each stage
+        exports(bool): time the exporters as well
+
+    Returns:
+        results(dict): details of the run and the results of each stage
+    """
+    bench = Benchmark(tracememory=tracememory)
+    generator = TrafficGenerator(stations=stations, seed=seed)
+    sentences = bench.run_stage(
+        'Generate Traffic',
+        lambda: list(generator.sentences(messages)), messages)
+    bench.run_stage(
+        'NMEA Parse', lambda: parse_sentences(sentences), len(sentences),
+        unit='sentences')
+    bench.run_stage(
+        'Checksum', lambda: check_checksums(sentences), len(sentences),
+        unit='sentences')
+    nmeatracker, payloads = bench.run_stage(
+        'NMEAtracker.process_sentence',
+        lambda: reassemble_messages(sentences), len(sentences),
+        unit='sentences')
+    msgbinaries = bench.run_stage(
+        'Payload to Binary', lambda: payloads_to_binary(payloads),
+        len(payloads))
+    bytype = collections.defaultdict(list)
+    for msgbinary in msgbinaries:
+        bytype[int(msgbinary[0:6], 2)].append(msgbinary)
+    for msgtype in sorted(bytype):
+        bench.run_stage(
+            'Decode Type {}'.format(msgtype),
+            lambda: decode_messages(bytype[msgtype]), len(bytype[msgtype]))
+    del msgbinaries, bytype
+    aistracker, msgobjs = bench.run_stage(
+        'AISTracker.process_message',
+        lambda: track_messages(payloads), len(payloads))
+    bench.run_stage(
+        'AISTracker.process_message with DecodeCache',
+        lambda: track_messages(payloads, allmessages.DecodeCache()),
+        len(payloads))
+    messagelog = bench.run_stage(
+        'AISMessageLog.store',
+        lambda: store_messages(
+            allmessages.AISMessageLog(), payloads, msgobjs), len(payloads))
+    bench.run_stage(
+        'CompactAISMessageLog.store',
+        lambda: store_messages(
+            allmessages.CompactAISMessageLog(), payloads, msgobjs),
+        len(payloads))
+    del msgobjs
+    if exports:
+        run_exports(bench, aistracker, nmeatracker, messagelog)
+    results = {}
+    results['Version'] = version.VERSION
+    results['Python'] = platform.python_version()
+    results['Platform'] = platform.platform()
+    results['Time'] = time.strftime('%Y/%m/%d %H:%M:%S', time.gmtime())
+    results['Messages'] = len(payloads)
+    results['Sentences'] = len(sentences)
+    results['Stations'] = len(aistracker.stations)
+    results['Seed'] = seed
+    if resource:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            maxrss /= 1024
+        results['Peak Memory (MB)'] = round(maxrss / 1024, 2)
+    results['Stages'] = bench.stages
+    return results
+
+
+def run_exports(bench, aistracker, nmeatracker, messagelog):
+    """
+    time each of the exporters, the files are written to a temporary
+    directory that is deleted afterwards
+
+    Args:
+        bench(Benchmark): where to save the results
+        aistracker(ais.AISTracker): the tracker to export
+        nmeatracker(nmea.NMEAtracker): stats for the JSON export
+        messagelog(allmessages.AISMessageLog): the messages to export
+    """
+    stations = len(aistracker.stations)
+
+    def export_json(outputfile):
+        joutdict = {}
+        joutdict['NMEA Stats'] = nmeatracker.nmea_stats()
+        joutdict['AIS Stats'] = aistracker.tracker_stats()
+        joutdict['AIS Stations'] = aistracker.all_station_info(verbose=False)
+        export.write_json_file(joutdict, outputfile)
+
+    with tempfile.TemporaryDirectory() as outpath:
+        bench.run_stage(
+            'Export CSV',
+            lambda: export.write_csv_file(
+                aistracker.create_table_data(),
+                os.path.join(outpath, 'stations.csv')),
+            stations, unit='stations')
+        bench.run_stage(
+            'Export JSON',
+            lambda: export_json(os.path.join(outpath, 'stations.json')),
+            stations, unit='stations')
+        bench.run_stage(
+            'Export JSONL',
+            lambda: export.write_debug_files(
+                messagelog, os.path.join(outpath, 'ais-messages.jsonl'),
+                os.path.join(outpath, 'ais-messages.csv')),
+            len(messagelog))
+        bench.run_stage(
+            'Export KML',
+            lambda: aistracker.create_kml_map(
+                os.path.join(outpath, 'map.kml'), kmzoutput=False),
+            stations, unit='stations')
+        bench.run_stage(
+            'Export KMZ',
+            lambda: aistracker.create_kml_map(
+                os.path.join(outpath, 'map.kmz'), kmzoutput=True),
+            stations, unit='stations')
+        bench.run_stage(
+            'Export GeoJSON',
+            lambda: aistracker.create_geojson_map(
+                os.path.join(outpath, 'map.geojson')),
+            stations, unit='stations')
+
+
+def create_results_table(results, baseline=None):
+    """
+    make a table of the results for print_table
+
+    Args:
+        results(dict): results from run_benchmark
+        baseline(dict): results from an earlier run to compare against
+
+    Returns:
+        table(list): list of lists, each list is a row of the table
+    """
+    header = ['Stage', 'Items', 'Unit', 'Seconds', 'Items per Second']
+    showmemory = any('Peak Memory (MB)' in stage
+                     for stage in results['Stages'].values())
+    if showmemory:
+        header.append('Peak Memory (MB)')
+    if baseline:
+        header.append('Speed vs Baseline')
+    table = [header]
+    for name, stage in results['Stages'].items():
+        row = [name, stage['Items'], stage['Unit'], stage['Seconds'],
+               stage['Items per Second']]
+        if showmemory:
+            row.append(stage.get('Peak Memory (MB)', ''))
+        if baseline:
+            try:
+                row.append('{:.2f}x'.format(
+                    stage['Items per Second'] /
+                    baseline['Stages'][name]['Items per Second']))
+            except (KeyError, ZeroDivisionError):
+                row.append('')
+        table.append(row)
+    return table
+
+
+def main():
+    """
+    get the command line arguments and run the benchmark
+    """
+    parser = argparse.ArgumentParser(
+        description='benchmark pyaisnmea on synthetic AIS traffic',
+        epilog='pyaisnmea version = {}'.format(version.VERSION))
+    parser.add_argument(
+        '-n', type=int, default=100000, metavar='MESSAGES',
+        help='number of AIS messages to generate, default is 100000')
+    parser.add_argument(
+        '-s', type=int, default=1000, metavar='STATIONS',
+        help='number of ships in the traffic, default is 1000')
+    parser.add_argument(
+        '--seed', type=int, default=1,
+        help='seed for the traffic generator, default is 1')
+    parser.add_argument(
+        '-m', action='store_true',
+        help='measure the peak memory of each stage, slows every stage')
+    parser.add_argument(
+        '-x', action='store_true', help='do not time the exporters')
+    parser.add_argument(
+        '-o', metavar='FILE', help='save the results to a JSON file')
+    parser.add_argument(
+        '-c', metavar='FILE',
+        help='compare the speed against results saved with -o')
+    cliargs = parser.parse_args()
+    baseline = None
+    if cliargs.c:
+        with open(cliargs.c) as baselinefile:
+            baseline = json.load(baselinefile)
+    results = run_benchmark(
+        messages=cliargs.n, stations=cliargs.s, seed=cliargs.seed,
+        tracememory=cliargs.m, exports=not cliargs.x)
+    print('pyaisnmea {} - Python {} - {} messages, {} sentences, '
+          '{} stations'.format(
+              results['Version'], results['Python'], results['Messages'],
+              results['Sentences'], results['Stations']))
+    capturefile.print_table(create_results_table(results, baseline))
+    if 'Peak Memory (MB)' in results:
+        print('Peak Memory (MB): {}'.format(results['Peak Memory (MB)']))
+    if cliargs.o:
+        export.write_json_file(results, cliargs.o)
+        print('results saved to {}'.format(cliargs.o))
+
+
+if __name__ == '__main__':
+    main()
@@ -49,7 +49,8 @@ def open_file_generator(filepath):
             yield line
 
 
-def aistracker_from_csv(filepath, debug=True):
+def aistracker_from_csv(filepath, debug=True, compact=False,
+                        messagefilter=None):
     """
     get an aistracker object from a debug messages CSV that was previously
     exported from pyaisnmea
@@ -58,6 +59,8 @@ def aistracker_from_csv(filepath, debug=True):
         filepath(str): full path to csv file
         debug(bool): save all message payloads and decoded attributes into
                      messagelog
+        compact(bool): use a CompactAISMessageLog to reduce memory use
+        messagefilter(ais.MessageFilter): only import the messages it wants
 
     Raises:
         NoSuitableMessagesFound: if there are no AIS messages in the file
@@ -67,8 +70,10 @@ def aistracker_from_csv(filepath, debug=True):
                                     ships we have seen
         messagelog(allmessages.AISMessageLog): object with all the AIS messages
     """
-    messagelog = allmessages.AISMessageLog()
+    messagelog = allmessages.create_message_log(compact=compact)
     aistracker = ais.AISTracker()
+    aistracker.messagefilter = messagefilter
+    aistracker.decodecache = allmessages.DecodeCache()
     msgnumber = 1
     for line in open_file_generator(filepath):
         try:
@@ -81,6 +86,7 @@ def aistracker_from_csv(filepath, debug=True):
                     messagelog.store(msgnumber, payload, msg)
                 msgnumber += 1
         except (ais.UnknownMessageType, ais.InvalidMMSI,
+                ais.UnwantedMessage,
                 IndexError, binary.NoBinaryData) as err:
             AISLOGGER.debug(str(err))
             continue
@@ -89,7 +95,8 @@ def aistracker_from_csv(filepath, debug=True):
     return (aistracker, messagelog)
 
 
-def aistracker_from_json(filepath, debug=True):
+def aistracker_from_json(filepath, debug=True, compact=False,
+                         messagefilter=None):
     """
     get an aistracker object from a debug messages JSON that was previously
     exported from pyaisnmea
@@ -98,6 +105,8 @@ def aistracker_from_json(filepath, debug=True):
         filepath(str): full path to json file
         debug(bool): save all message payloads and decoded attributes into
                      messagelog
+        compact(bool): use a CompactAISMessageLog to reduce memory use
+        messagefilter(ais.MessageFilter): only import the messages it wants
 
     Raises:
         NoSuitableMessagesFound: if there are no AIS messages in the file
@@ -107,8 +116,10 @@ def aistracker_from_json(filepath, debug=True):
                                     ships we have seen
         messagelog(allmessages.AISMessageLog): object with all the AIS messages
     """
-    messagelog = allmessages.AISMessageLog()
+    messagelog = allmessages.create_message_log(compact=compact)
     aistracker = ais.AISTracker()
+    aistracker.messagefilter = messagefilter
+    aistracker.decodecache = allmessages.DecodeCache()
     msgnumber = 1
     for line in open_file_generator(filepath):
         try:
@@ -120,6 +131,7 @@ def aistracker_from_json(filepath, debug=True):
                 messagelog.store(msgnumber, payload, msg)
             msgnumber += 1
         except (ais.UnknownMessageType, ais.InvalidMMSI,
+                ais.UnwantedMessage,
                 json.decoder.JSONDecodeError, KeyError,
                 binary.NoBinaryData) as err:
             AISLOGGER.debug(str(err))
@@ -129,7 +141,8 @@ def aistracker_from_json(filepath, debug=True):
     return (aistracker, messagelog)
 
 
-def aistracker_from_file(filepath, debug=False, timingsource=None):
+def aistracker_from_file(filepath, debug=False, timingsource=None,
+                         compact=False, messagefilter=None):
     """
     open a file, read all nmea sentences and return an ais.AISTracker object
 
@@ -145,6 +158,8 @@ def aistracker_from_file(filepath, debug=False, timingsource=None):
                            from this base station will be used for times.
                            default is None and all base stations will be used
                            for times. list of strings
+        compact(bool): use a CompactAISMessageLog to reduce memory use
+        messagefilter(ais.MessageFilter): only import the messages it wants
 
     Raises:
         NoSuitableMessagesFound: if there are no AIS messages in the file
@@ -155,21 +170,26 @@ def aistracker_from_file(filepath, debug=False, timingsource=None):
         nmeatracker(nmea.NMEAtracker): object that organises the nmea sentences
         messagelog(allmessages.AISMessageLog): object with all the AIS messages
     """
-    messagelog = allmessages.AISMessageLog()
+    messagelog = allmessages.create_message_log(compact=compact)
     aistracker = ais.AISTracker()
     aistracker.timingsource = timingsource
+    aistracker.messagefilter = messagefilter
+    aistracker.decodecache = allmessages.DecodeCache()
     nmeatracker = nmea.NMEAtracker()
     msgnumber = 1
     for line in open_file_generator(filepath):
         try:
             payload = nmeatracker.process_sentence(line)
             if payload:
-                msg = aistracker.process_message(payload)
+                msg = aistracker.process_message(
+                    payload, timestamp=nmea.tag_block_timestamp(
+                        nmeatracker.lasttagblock))
                 if debug:
                     messagelog.store(msgnumber, payload, msg)
                 msgnumber += 1
         except (nmea.NMEAInvalidSentence, nmea.NMEACheckSumFailed,
                 ais.UnknownMessageType, ais.InvalidMMSI,
+                ais.UnwantedMessage,
                 binary.NoBinaryData, IndexError) as err:
             AISLOGGER.debug(str(err))
             continue
@@ -178,6 +198,35 @@ def aistracker_from_file(filepath, debug=False, timingsource=None):
     return (aistracker, nmeatracker, messagelog)
 
 
+def has_tag_block_times(filepath, maxlines=100):
+    """
+    check if the sentences in a NMEA text file have receiver times in
+    NMEA 4.x tag blocks
+
+    Note:
+        if they do there is no need to use AIS base stations for times
+
+    Args:
+        filepath(str): path to the nmea0183 text file
+        maxlines(int): how many lines at the start of the file to check
+
+    Returns:
+        hastimes(bool): True if a tag block with a time was found
+    """
+    for linecount, line in enumerate(open_file_generator(filepath)):
+        if linecount >= maxlines:
+            break
+        if not line.startswith('\\'):
+            continue
+        try:
+            _, tags = nmea.NMEAtracker.parse_line(line)
+        except (nmea.NMEAInvalidSentence, nmea.NMEACheckSumFailed):
+            continue
+        if nmea.tag_block_timestamp(tags):
+            return True
+    return False
+
+
 def extract_time_data_from_file(filepath):
     """
     find the base stations and timing data from NMEA text files
@@ -259,7 +308,7 @@ def print_table(tablelist):
 
 def read_from_file(
         filepath, outpath, everything=False, filetype='text', orderby='Types',
-        region='A'):
+        region='A', compact=False, workers=1, messagefilter=None):
     """
     read AIS NMEA sentences from a text file and save to various output formats
 
@@ -277,6 +326,10 @@ def read_from_file(
         orderby(str): order KML/KMZ output and Everything station folders by
                       'Types', 'Flags' or 'Class', default is 'Types'
         region(str): IALA region 'A' or 'B', default is 'A'
+        compact(bool): use a CompactAISMessageLog to reduce memory use
+        workers(int): number of AIS stations to export at the same time
+                      when everything is True
+        messagefilter(ais.MessageFilter): only import the messages it wants
     """
     if not os.path.exists(outpath):
         AISLOGGER.info('output path does not exist creating directories')
@@ -286,45 +339,52 @@ def read_from_file(
     timesources = []
     try:
         if filetype == 'text':
-            try:
-                AISLOGGER.info('importing as text file')
-                basestnchoices, basestntable = extract_time_data_from_file(
-                    filepath)
-                AISLOGGER.info('choose timing source')
-                choiceconfirmed = False
-                while not choiceconfirmed:
-                    print_table(basestntable)
-                    choice = input('enter timing source choice number: ')
-                    try:
-                        basestnmmsi = basestnchoices[choice.rstrip()]
-                        if basestnmmsi not in timesources:
-                            timesources.append(basestnmmsi)
-                    except KeyError:
-                        AISLOGGER.error('enter a choice no!')
-                        continue
-                    AISLOGGER.info('use %s as a time reference',
-                                   basestnmmsi)
-                    yesno = input('Y/N: ')
-                    if yesno.rstrip() in ('Y', 'y', 'yes', 'YES'):
-                        AISLOGGER.info(
-                            'timing sources to be used - %s', timesources)
-                        yesno2 = input('add another timing source? Y/N: ')
-                        if yesno2.rstrip() in ('N', 'n', 'no', 'NO'):
-                            basestntimingsource = timesources
-                            choiceconfirmed = True
-            except NoSuitableMessagesFound as err:
-                basestntimingsource = None
-                AISLOGGER.error(str(err))
+            AISLOGGER.info('importing as text file')
+            if has_tag_block_times(filepath):
+                AISLOGGER.info('using receiver times from tag blocks')
+                basestntimingsource = []
+            else:
+                try:
+                    basestnchoices, basestntable = extract_time_data_from_file(
+                        filepath)
+                    AISLOGGER.info('choose timing source')
+                    choiceconfirmed = False
+                    while not choiceconfirmed:
+                        print_table(basestntable)
+                        choice = input('enter timing source choice number: ')
+                        try:
+                            basestnmmsi = basestnchoices[choice.rstrip()]
+                            if basestnmmsi not in timesources:
+                                timesources.append(basestnmmsi)
+                        except KeyError:
+                            AISLOGGER.error('enter a choice no!')
+                            continue
+                        AISLOGGER.info('use %s as a time reference',
+                                       basestnmmsi)
+                        yesno = input('Y/N: ')
+                        if yesno.rstrip() in ('Y', 'y', 'yes', 'YES'):
+                            AISLOGGER.info(
+                                'timing sources to be used - %s', timesources)
+                            yesno2 = input('add another timing source? Y/N: ')
+                            if yesno2.rstrip() in ('N', 'n', 'no', 'NO'):
+                                basestntimingsource = timesources
+                                choiceconfirmed = True
+                except NoSuitableMessagesFound as err:
+                    basestntimingsource = None
+                    AISLOGGER.error(str(err))
             aistracker, nmeatracker, messagelog = aistracker_from_file(
-                filepath, debug=True, timingsource=basestntimingsource)
+                filepath, debug=True, timingsource=basestntimingsource,
+                compact=compact, messagefilter=messagefilter)
         elif filetype == 'csv':
             AISLOGGER.info('importing as CSV file')
             aistracker, messagelog = aistracker_from_csv(
-                filepath, debug=True)
+                filepath, debug=True, compact=compact,
+                messagefilter=messagefilter)
         elif filetype == 'jsonlines':
             AISLOGGER.info('importing as JSON lines file')
             aistracker, messagelog = aistracker_from_json(
-                filepath, debug=True)
+                filepath, debug=True, compact=compact,
+                messagefilter=messagefilter)
         if filetype in ('csv', 'jsonlines'):
             nmeatracker = nmea.NMEAtracker()
             nmeatracker.sentencecount = 'N/A'
@@ -334,8 +394,9 @@ def read_from_file(
         sys.exit(1)
     export.export_overview(
         aistracker, nmeatracker, messagelog, outpath, printsummary=True,
-        orderby=orderby, region=region)
+        orderby=orderby, region=region, messagedebug=not everything)
     if everything:
         export.export_everything(
-            aistracker, messagelog, outpath, orderby=orderby, region=region)
+            aistracker, messagelog, outpath, orderby=orderby, region=region,
+            workers=workers, overviewdebug=True)
     AISLOGGER.info('Finished')
@@ -2,6 +2,8 @@
 code for the export of data into various file formats
 """
 
+import collections
+import concurrent.futures
 import csv
 import json
 import logging
@@ -60,6 +62,132 @@ def write_csv_file(lines, outpath, dialect='excel'):
         csvwriter.writerows(lines)
 
 
+def write_debug_files(aismsglog, jsonlinespath, csvpath, mmsi=None):
+    """
+    write the AIS message debug JSON lines and csv files in a single pass
+    over the message log without building up lists of all the messages
+
+    Args:
+        aismsglog(allmessages.AISMessageLog): object to log all AIS messages
+        jsonlinespath(str): full path to write the JSON lines file to
+        csvpath(str): full path to write the csv file to
+        mmsi(str): only write the messages from this mmsi
+                   all messages are written if mmsi is None
+    """
+    with open(jsonlinespath, 'w') as jsonlines, \
+            open(csvpath, 'w') as outfile:
+        csvwriter = csv.writer(outfile, dialect='excel')
+        csvwriter.writerow(aismsglog.csvheaders)
+        for message, singlemsg in aismsglog.debug_output_generator(
+                mmsi=mmsi):
+            jsonlines.write(json.dumps(message) + '\n')
+            csvwriter.writerow(singlemsg)
+
+
+class DebugFileBuffer():
+    """
+    collect the lines of many AIS message debug JSON lines and csv files
+    in memory so messages can be written to many files in a single pass
+
+    Note:
+        the lines are grouped by file and written out when more than
+        maxbuffered messages are held, so each file is only opened once
+        every maxbuffered messages however the messages are mixed together
+
+    Args:
+        csvheaders(list): header row for the csv files
+        maxbuffered(int): maximum number of messages to hold before writing
+                          them all out
+
+    Attributes:
+        buffers(collections.defaultdict): keys are the file prefixes, values
+                                          are tuples of the list of JSON
+                                          lines and the list of csv rows
+        buffered(int): number of messages held in buffers
+        created(set): prefixes of the files that have already been created
+    """
+
+    def __init__(self, csvheaders, maxbuffered=100000):
+        self.csvheaders = csvheaders
+        self.maxbuffered = maxbuffered
+        self.buffers = collections.defaultdict(lambda: ([], []))
+        self.buffered = 0
+        self.created = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def write(self, prefix, jsonline, singlemsg):
+        """
+        add a single message to the files for a prefix
+
+        Args:
+            prefix(str): full path of the files without the file extension
+            jsonline(str): the message already serialised as JSON
+            singlemsg(list): the message as a row for the csv file
+        """
+        jsonlines, csvrows = self.buffers[prefix]
+        jsonlines.append(jsonline)
+        csvrows.append(singlemsg)
+        self.buffered += 1
+        if self.buffered >= self.maxbuffered:
+            self.flush()
+
+    def flush(self):
+        """
+        write all the buffered messages out to their files
+        """
+        for prefix, (jsonlines, csvrows) in self.buffers.items():
+            if prefix in self.created:
+                mode = 'a'
+            else:
+                mode = 'w'
+            with open(prefix + '.jsonl', mode) as jsonlinesfile, \
+                    open(prefix + '.csv', mode) as csvfile:
+                csvwriter = csv.writer(csvfile, dialect='excel')
+                if prefix not in self.created:
+                    csvwriter.writerow(self.csvheaders)
+                    self.created.add(prefix)
+                jsonlinesfile.writelines(jsonlines)
+                csvwriter.writerows(csvrows)
+        self.buffers.clear()
+        self.buffered = 0
+
+
+def write_partitioned_debug_files(
+        aismsglog, mmsipaths, overviewdir=None, maxbuffered=100000):
+    """
+    write the AIS message debug JSON lines and csv files for every AIS
+    station in a single pass over the message log
+
+    Args:
+        aismsglog(allmessages.AISMessageLog): object to log all AIS messages
+        mmsipaths(dict): keys are MMSIs, values are the directory to write
+                         that stations files to
+        overviewdir(str): if set, also write the files containing all the
+                          messages to this directory in the same pass
+        maxbuffered(int): maximum number of messages to hold in memory
+                          before writing them out
+    """
+    with DebugFileBuffer(
+            aismsglog.csvheaders, maxbuffered=maxbuffered) as debugfiles:
+        if overviewdir:
+            overviewprefix = os.path.join(overviewdir, 'ais-messages')
+        for message, singlemsg in aismsglog.debug_output_generator():
+            jsonline = json.dumps(message) + '\n'
+            if overviewdir:
+                debugfiles.write(overviewprefix, jsonline, singlemsg)
+            try:
+                mmsipath = mmsipaths[singlemsg[1]]
+            except KeyError:
+                continue
+            debugfiles.write(
+                os.path.join(mmsipath, 'ais-messages'), jsonline, singlemsg)
+
+
 def create_summary_text(summary):
     """
     format a dictionary so it can be printed to screen or written to a plain
@@ -78,7 +206,7 @@ def create_summary_text(summary):
 
 def export_overview(
         aistracker, nmeatracker, aismsglog, outputdir, printsummary=False,
-        orderby='Types', region='A'):
+        orderby='Types', region='A', messagedebug=True):
     """
     export the most popular file formats
     KMZ - map
@@ -94,6 +222,9 @@ def export_overview(
         orderby(str): order the stations by 'Types', 'Flags' or 'Class'
                       default is 'Types'
         region(str): IALA region 'A' or 'B', default is 'A'
+        messagedebug(bool): write the JSONLINES and CSV of all AIS messages
+                            set to False if export_everything will be
+                            writing them with overviewdebug
     """
     stnstats = aistracker.tracker_stats()
     sentencestats = nmeatracker.nmea_stats()
@@ -116,18 +247,49 @@ def export_overview(
     aistracker.create_kml_map(
         os.path.join(outputdir, 'map.kmz'), kmzoutput=True,
         orderby=orderby, region=region)
-    jsonlineslist, messagecsvlist = aismsglog.debug_output()
-    write_json_lines(
-        jsonlineslist, os.path.join(outputdir, 'ais-messages.jsonl'))
-    write_csv_file(
-        messagecsvlist, os.path.join(outputdir, 'ais-messages.csv'))
+    if messagedebug:
+        write_debug_files(
+            aismsglog, os.path.join(outputdir, 'ais-messages.jsonl'),
+            os.path.join(outputdir, 'ais-messages.csv'))
+
+
+def export_station(stnobj, mmsipath, region='A'):
+    """
+    export the map, details and positions of a single AIS Station
+
+    Note:
+        the AIS message debug files are written separately by
+        write_partitioned_debug_files
+
+    Args:
+        stnobj(ais.AISStation): the AIS station to export
+        mmsipath(str): directory path to export the station files to
+        region(str): IALA region 'A' or 'B', default is 'A'
+    """
+    stnobj.create_kml_map(
+        os.path.join(mmsipath, 'map.kmz'), kmzoutput=True,
+        region=region)
+    stninfo = stnobj.get_station_info(verbose=True, messagetally=True)
+    write_json_file(
+        stninfo, os.path.join(mmsipath, 'vessel-data.json'))
+    stnobj.create_positions_csv(
+        os.path.join(mmsipath, 'vessel-positions.csv'))
 
 
 def export_everything(
-        aistracker, aismsglog, outputdir, orderby='Types', region='A'):
+        aistracker, aismsglog, outputdir, orderby='Types', region='A',
+        workers=1, progress=None, processes=True, overviewdebug=False):
     """
     export everything we have on each AIS Station
 
+    Note:
+        the AIS messages are written to each stations debug files in a single
+        pass over the message log. if workers is more than 1 the rest of the
+        station files are exported by a pool of processes whilst this
+        happens. set processes to False to use a pool of threads instead,
+        this avoids starting new processes but only the compression and
+        writing to disk can happen at the same time
+
     Args:
         aistracker(ais.AISTracker): object tracking all AIS stations
         aismsglog(allmessages.AISMessageLog): object to log all AIS messages
@@ -135,6 +297,15 @@ def export_everything(
         orderby(str): order the stations by 'Types', 'Flags' or 'Class'
                           default is 'Types'
         region(str): IALA region 'A' or 'B', default is 'A'
+        workers(int): number of stations to export at the same time
+                      default is 1
+        progress(function): called with the number of stations exported so
+                            far, the total number of stations and the MMSI
+                            of the station just exported
+        processes(bool): use a pool of processes rather than threads when
+                         workers is more than 1, default is True
+        overviewdebug(bool): also write the JSONLINES and CSV of all AIS
+                             messages to outputdir in the same pass
     """
     AISLOGGER.info('outputting data for all AIS stations')
     mmsicatagories = aistracker.sort_mmsi_by_catagory()
@@ -143,8 +314,8 @@ def export_everything(
         os.mkdir(aisstndir)
     except FileExistsError:
         pass
+    stationpaths = []
     for catagory in mmsicatagories[orderby]:
-        AISLOGGER.info('processing %s', catagory)
         try:
             os.mkdir(os.path.join(aisstndir, catagory))
         except FileExistsError:
@@ -156,21 +327,47 @@ def export_everything(
                     mmsi, INVALIDDIRCHARSREGEX.sub('', stnobj.name))
             else:
                 foldername = mmsi
-            AISLOGGER.info('    processing %s', foldername)
             mmsipath = os.path.join(aisstndir, catagory, foldername)
             try:
                 os.mkdir(mmsipath)
             except FileExistsError:
                 pass
-            stnobj.create_kml_map(
-                os.path.join(mmsipath, 'map.kmz'), kmzoutput=True,
-                region=region)
-            stninfo = stnobj.get_station_info(verbose=True, messagetally=True)
-            write_json_file(
-                stninfo, os.path.join(mmsipath, 'vessel-data.json'))
-            stnobj.create_positions_csv(
-                os.path.join(mmsipath, 'vessel-positions.csv'))
-            msgsjsonlines, msgscsv = aismsglog.debug_output(mmsi=mmsi)
-            write_json_lines(msgsjsonlines,
-                             os.path.join(mmsipath, 'ais-messages.jsonl'))
-            write_csv_file(msgscsv, os.path.join(mmsipath, 'ais-messages.csv'))
+            stationpaths.append((stnobj, mmsipath))
+    mmsipaths = {stnobj.mmsi: mmsipath for stnobj, mmsipath in stationpaths}
+    if overviewdebug:
+        overviewdir = outputdir
+    else:
+        overviewdir = None
+    total = len(stationpaths)
+    if workers > 1:
+        if processes:
+            executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers)
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers)
+        with executor:
+            futures = {}
+            for stnobj, mmsipath in stationpaths:
+                future = executor.submit(
+                    export_station, stnobj, mmsipath, region)
+                futures[future] = stnobj.mmsi
+            AISLOGGER.info('writing AIS messages for all AIS stations')
+            write_partitioned_debug_files(
+                aismsglog, mmsipaths, overviewdir=overviewdir)
+            done = 0
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+                done += 1
+                AISLOGGER.info('    processed %s', futures[future])
+                if progress:
+                    progress(done, total, futures[future])
+    else:
+        AISLOGGER.info('writing AIS messages for all AIS stations')
+        write_partitioned_debug_files(
+            aismsglog, mmsipaths, overviewdir=overviewdir)
+        for done, (stnobj, mmsipath) in enumerate(stationpaths, start=1):
+            AISLOGGER.info('    processing %s', mmsipath)
+            export_station(stnobj, mmsipath, region=region)
+            if progress:
+                progress(done, total, stnobj.mmsi)
@@ -151,8 +151,8 @@ class AISMessageTab(tkinter.ttk.Frame):
         clickedmmsi = self.tree.item(item)['values'][3]
         messagewindow = MessageWindow(self, mmsi=clickedmmsi)
         msgsummary = export.create_summary_text(
-            self.tabs.window.messagelog.messagedict[
-                (clickedmsgno, clickednmea)].__dict__)
+            self.tabs.window.messagelog.get_message(
+                clickedmsgno, clickednmea).__dict__)
         messagewindow.msgdetailsbox.append_text(msgsummary)
 
     def create_message_table(self):
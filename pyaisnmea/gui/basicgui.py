@@ -5,6 +5,7 @@ A GUI for the AIS decoder written with tkinter
 import datetime
 import logging
 import multiprocessing
+import queue
 import threading
 import time
 import tkinter
@@ -19,6 +20,7 @@ import pyaisnmea.capturefile as capturefile
 import pyaisnmea.livekmlmap as livekmlmap
 import pyaisnmea.nmea as nmea
 import pyaisnmea.network as network
+import pyaisnmea.ringbuffer as ringbuffer
 import pyaisnmea.version as version
 
 import pyaisnmea.gui.aismessagetab as aismessagetab
@@ -32,6 +34,7 @@ import pyaisnmea.gui.networksettingswindow as networksettingswindow
 
 
 AISLOGGER = logging.getLogger(__name__)
+DUPLICATEWINDOW = 10
 
 
 class TabControl(tkinter.ttk.Notebook):
@@ -67,25 +70,35 @@ class BasicGUI(tkinter.Tk):
     Attributes:
         nmeatracker(nmea.NMEAtracker): deals with the NMEA sentences
         aistracker(ais.AISTracker): decodes the AIS messages
-        messagelog(dict): stores all the messages
+        messagelog(allmessages.AISMessageLog): stores all the messages
         statuslabel(tkinter.Label): forms the status bar at the top of the
                                     main window
-        mpq(multiprocessing.Queue): used to communicate with the
-                                      server process
+        mpq(multiprocessing.Queue): used to get lists of sentences from
+            the server process, a ringbuffer.SentenceRingBuffer if
+            sharedmemory is set
         updateguithread(threading.Thread): updates the GUI, is None on init
         refreshguithread(threading.Thread):refreshes the GUI, is None on init
         serverprocess(multiprocessing.Process): process that listens for AIS
             sentences on the network, is None on init
         serverrunning(bool): true if the server is running
         stopevent(threading.Event): stop even to stop the threads
+        trackerlock(threading.Lock): held whilst the aistracker processes
+                                     a message
         forwardsentences(tkinter.BooleanVar): should sentences be
                                               forwarded to another server
+        sharedmemory(tkinter.BooleanVar): pass sentences from the server
+            process through a ring buffer in shared memory
+        suppressduplicates(tkinter.BooleanVar): ignore messages already
+            received in the last DUPLICATEWINDOW seconds
         livemap(bool): should a live KML map be created
     """
 
     netsettings = {
         'Server IP': '127.0.0.1',
         'Server Port': 10110,
+        'Server Type': 'UDP',
+        'Extra Sources': '',
+        'UDP Receive Buffer': 4194304,
         'Remote Server IP': '127.0.0.1',
         'Remote Server Port': 10111,
         'Log File Path': '',
@@ -93,6 +106,11 @@ class BasicGUI(tkinter.Tk):
         'Order Stations By': 'Types',
         'IALA Region': 'A'}
 
+    servertypes = {
+        'UDP': 'udp',
+        'TCP Server': 'tcpserver',
+        'TCP Client': 'tcpclient'}
+
     def __init__(self):
         tkinter.Tk.__init__(self)
         self.nmeatracker = nmea.NMEAtracker()
@@ -111,10 +129,17 @@ class BasicGUI(tkinter.Tk):
         self.serverprocess = None
         self.serverrunning = False
         self.stopevent = threading.Event()
+        self.trackerlock = threading.Lock()
         self.forwardsentences = tkinter.BooleanVar()
         self.forwardsentences.set(0)
+        self.sharedmemory = tkinter.BooleanVar()
+        self.sharedmemory.set(0)
+        self.suppressduplicates = tkinter.BooleanVar()
+        self.suppressduplicates.set(0)
         self.kmzlivemap = tkinter.BooleanVar()
         self.kmzlivemap.set(0)
+        self.incrementallivemap = tkinter.BooleanVar()
+        self.incrementallivemap.set(0)
         self.livemap = None
         self.timingsources = []
         self.currentupdatethreadid = None
@@ -149,6 +174,7 @@ class BasicGUI(tkinter.Tk):
                 self.aistracker.stations.clear()
                 self.aistracker.messages.clear()
                 self.aistracker.timings.clear()
+                self.aistracker.timingset.clear()
                 self.aistracker.messagesprocessed = 0
                 self.nmeatracker.multiparts.clear()
                 self.nmeatracker.channelcounter.clear()
@@ -208,26 +234,47 @@ class BasicGUI(tkinter.Tk):
             text=datetime.datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S'))
         if self.netsettings['KML File Path'] != '':
             kmzoutput = bool(self.kmzlivemap.get() == 1)
+            incremental = bool(self.incrementallivemap.get() == 1)
             self.livemap = livekmlmap.LiveKMLMap(
                 self.netsettings['KML File Path'], kmzoutput=kmzoutput,
                 orderby=self.netsettings['Order Stations By'],
-                region=self.netsettings['IALA Region'])
+                region=self.netsettings['IALA Region'],
+                incremental=incremental)
             self.livemap.create_netlink_file()
+            self.livemap.start_renderer(
+                self.aistracker, self.trackerlock, livemaptimeout=480)
+        if self.suppressduplicates.get() == 1:
+            self.aistracker.duplicatefilter = ais.DuplicateFilter(
+                window=DUPLICATEWINDOW)
+        else:
+            self.aistracker.duplicatefilter = None
+        sources = [(self.servertypes[self.netsettings['Server Type']],
+                    self.netsettings['Server IP'],
+                    self.netsettings['Server Port'])]
+        for source in self.netsettings['Extra Sources'].split():
+            sources.append(network.parse_source(source))
+        serverkwargs = {'logpath': self.netsettings['Log File Path'],
+                        'rcvbuf': self.netsettings['UDP Receive Buffer']}
+        if self.sharedmemory.get() == 1:
+            self.mpq = ringbuffer.SentenceRingBuffer()
+        else:
+            self.mpq = multiprocessing.Queue()
         if self.forwardsentences.get() == 1:
             print('forwarding sentences')
+            serverkwargs['remotehost'] = self.netsettings['Remote Server IP']
+            serverkwargs['remoteport'] = \
+                self.netsettings['Remote Server Port']
+        if len(sources) == 1 and sources[0][0] == 'udp':
+            _, serverkwargs['host'], serverkwargs['port'] = sources[0]
+            if self.sharedmemory.get() == 1:
+                serverkwargs['batchsize'] = 1
             self.serverprocess = multiprocessing.Process(
-                target=network.mpserver,
-                args=[self.mpq, self.netsettings['Server IP'],
-                      self.netsettings['Server Port'],
-                      self.netsettings['Remote Server IP'],
-                      self.netsettings['Remote Server Port']],
-                kwargs={'logpath': self.netsettings['Log File Path']})
+                target=network.mpserver, args=[self.mpq],
+                kwargs=serverkwargs)
         else:
             self.serverprocess = multiprocessing.Process(
-                target=network.mpserver,
-                args=[self.mpq, self.netsettings['Server IP'],
-                      self.netsettings['Server Port']],
-                kwargs={'logpath': self.netsettings['Log File Path']})
+                target=network.mpmultiserver, args=[self.mpq, sources],
+                kwargs=serverkwargs)
         self.serverprocess.start()
         tkinter.messagebox.showinfo('Network', 'Server Started')
         self.updateguithread = threading.Thread(
@@ -241,7 +288,8 @@ class BasicGUI(tkinter.Tk):
         self.currentupdatethreadid = self.updateguithread.ident
         self.currentrefreshthreadid = self.refreshguithread.ident
         self.statuslabel.config(
-            text='AIS Server Listening on {} port {}'.format(
+            text='AIS Server ({}) on {} port {}'.format(
+                self.netsettings['Server Type'],
                 self.netsettings['Server IP'],
                 self.netsettings['Server Port']),
             fg='black', bg='green2')
@@ -252,10 +300,24 @@ class BasicGUI(tkinter.Tk):
         stop the server
         """
         self.serverrunning = False
-        self.serverprocess.terminate()
         self.stopevent.set()
-        self.updateguithread.join(timeout=1)
-        self.refreshguithread.join(timeout=1)
+        try:
+            self.serverprocess.terminate()
+            if self.livemap:
+                self.livemap.stop_renderer()
+            self.updateguithread.join(timeout=1)
+            self.refreshguithread.join(timeout=1)
+            if isinstance(self.mpq, ringbuffer.SentenceRingBuffer):
+                self.serverprocess.join()
+                AISLOGGER.info('%s sentences dropped by the ring buffer',
+                               self.mpq.dropped)
+        finally:
+            if isinstance(self.mpq, ringbuffer.SentenceRingBuffer):
+                try:
+                    self.mpq.close()
+                except BufferError:
+                    AISLOGGER.warning(
+                        'ring buffer unlinked but still being read')
         self.serverprocess = None
         self.updateguithread = None
         self.refreshguithread = None
@@ -294,6 +356,10 @@ class BasicGUI(tkinter.Tk):
                         capturefile.aistracker_from_json(inputfile)
                     self.nmeatracker.sentencecount = 'N/A'
                     self.nmeatracker.reassembled = 'N/A'
+                elif capturefile.has_tag_block_times(inputfile):
+                    self.aistracker, self.nmeatracker, self.messagelog = \
+                        capturefile.aistracker_from_file(
+                            inputfile, debug=True, timingsource=[])
                 else:
                     try:
                         _, basestntable = \
@@ -329,13 +395,7 @@ class BasicGUI(tkinter.Tk):
             self.tabcontrol.statstab.write_stats_verbose()
             self.tabcontrol.shipstab.create_ship_table()
             self.tabcontrol.messagetab.create_message_table()
-            for msg in self.messagelog.messagedict:
-                msgno = msg[0]
-                payload = msg[1]
-                latestmsg = [msgno, payload,
-                             self.messagelog.messagedict[msg].description,
-                             self.messagelog.messagedict[msg].mmsi,
-                             self.messagelog.messagedict[msg].rxtime]
+            for latestmsg in self.messagelog.message_table_generator():
                 self.tabcontrol.messagetab.add_new_line(latestmsg)
             self.statuslabel.config(
                 text='Loaded capture file - {}'.format(inputfile),
@@ -346,7 +406,9 @@ class BasicGUI(tkinter.Tk):
         update the nmea and ais trackers from the network
 
         run in another thread whist the server is running and
-        recieving packets, get NMEA sentences from the queue and process them
+        recieving packets, get lists of NMEA sentences and the name of
+        their source from the queue and process them, the stats are written
+        once per list
 
         Args:
             stopevent(threading.Event): a threading stop event
@@ -354,16 +416,25 @@ class BasicGUI(tkinter.Tk):
         msgno = 1
         while not stopevent.is_set():
             if threading.get_ident() == self.currentupdatethreadid:
-                qdata = self.mpq.get()
-                if qdata:
+                try:
+                    source, qdata = self.mpq.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                for sentence in qdata:
                     try:
-                        payload = self.nmeatracker.process_sentence(qdata)
+                        payload = self.nmeatracker.process_sentence(
+                            sentence, source=source)
                         if payload:
-                            currenttime = datetime.datetime.utcnow().strftime(
-                                '%Y/%m/%d %H:%M:%S')
+                            currenttime = nmea.tag_block_timestamp(
+                                self.nmeatracker.lasttagblock)
+                            if not currenttime:
+                                currenttime = datetime.datetime.utcnow(). \
+                                    strftime('%Y/%m/%d %H:%M:%S')
                             try:
-                                msg = self.aistracker.process_message(
-                                    payload, timestamp=currenttime)
+                                with self.trackerlock:
+                                    msg = self.aistracker.process_message(
+                                        payload, timestamp=currenttime,
+                                        source=source)
                             except (IndexError, KeyError) as err:
                                 errmsg = '{} - error with - {}'.format(
                                     str(err), payload)
@@ -373,19 +444,23 @@ class BasicGUI(tkinter.Tk):
                                          msg.mmsi, currenttime]
                             msgno += 1
                             self.tabcontrol.messagetab.add_new_line(latestmsg)
-                            self.tabcontrol.statstab.write_stats()
                     except (nmea.NMEAInvalidSentence, nmea.NMEACheckSumFailed,
-                            ais.UnknownMessageType, ais.InvalidMMSI) as err:
+                            ais.UnknownMessageType, ais.InvalidMMSI,
+                            ais.DuplicateMessage) as err:
                         AISLOGGER.debug(str(err))
                         continue
                     except IndexError:
                         AISLOGGER.debug('no data on line')
                         continue
+                self.tabcontrol.statstab.write_stats()
 
     def refreshgui(self, stopevent):
         """
         refresh and update the gui every 10 seconds, run in another thread
 
+        Note:
+            the live KML map is drawn by its own render thread
+
         Args:
             stopevent(threading.Event): a threading stop event
         """
@@ -398,15 +473,9 @@ class BasicGUI(tkinter.Tk):
                     self.tabcontrol.statstab.write_stats_verbose()
                     self.tabcontrol.stninfotab.stn_options()
                     self.tabcontrol.stninfotab.show_stn_info()
-                    if self.livemap:
-                        self.aistracker.create_kml_map(
-                            self.livemap.kmlpath,
-                            kmzoutput=self.livemap.kmzoutput,
-                            linestring=False, livemap=True,
-                            livemaptimeout=480,
-                            orderby=self.netsettings['Order Stations By'],
-                            region=self.netsettings['IALA Region'])
                     time.sleep(1)
+                else:
+                    stopevent.wait(0.2)
 
     def quit(self):
         """
@@ -4,6 +4,7 @@ tab to allow the user to export data in different formats
 
 import logging
 import os
+import threading
 import tkinter
 
 import pyaisnmea.export as export
@@ -11,6 +12,9 @@ import pyaisnmea.export as export
 
 AISLOGGER = logging.getLogger(__name__)
 
+# number of threads used to write the files for each AIS station
+EXPORTTHREADS = 4
+
 EXPORTHELP = {
     'OVERVIEW': 'export CSV, JSON, KMZ and DEBUG files to a directory',
     'EVERYTHING': 'export OVERVIEW and details for every AIS Station',
@@ -41,11 +45,21 @@ class ExportTab(tkinter.ttk.Frame):
 
     Args:
         tabcontrol(tkinter.ttk.Notebook): ttk notebook to add this tab to
+
+    Attributes:
+        exportthread(threading.Thread): thread exporting everything,
+                                        is None if no export is running
+        exportprogress(tuple): number of stations exported so far, total
+                               number of stations and the last MMSI
+        exporterror(Exception): error raised by the export thread
     """
 
     def __init__(self, tabcontrol):
         tkinter.ttk.Frame.__init__(self, tabcontrol)
         self.tabs = tabcontrol
+        self.exportthread = None
+        self.exportprogress = None
+        self.exporterror = None
         self.exportoptions = tkinter.ttk.Combobox(self, state='readonly')
         self.exporthelplabel = tkinter.Label(self)
         self.exporthelplabel.pack()
@@ -101,6 +115,9 @@ class ExportTab(tkinter.ttk.Frame):
         if self.tabs.window.serverrunning:
             tkinter.messagebox.showwarning(
                 'WARNING', 'Cannot export files whilst server is running')
+        elif self.exportthread:
+            tkinter.messagebox.showwarning(
+                'WARNING', 'An export is already running')
         elif self.tabs.window.aistracker.messagesprocessed == 0:
             tkinter.messagebox.showwarning(
                 'WARNING', 'Nothing to export.')
@@ -117,9 +134,9 @@ class ExportTab(tkinter.ttk.Frame):
                         'AIS MESSAGES (DEBUG)': self.export_debug}
             option = self.exportoptions.get()
             try:
-                commands[option]()
-                tkinter.messagebox.showinfo(
-                    'Export Files', 'Export Successful')
+                if not commands[option]():
+                    tkinter.messagebox.showinfo(
+                        'Export Files', 'Export Successful')
             except Exception as err:
                 AISLOGGER.exception('export error')
                 tkinter.messagebox.showerror(type(err).__name__, str(err))
@@ -271,12 +288,10 @@ class ExportTab(tkinter.ttk.Frame):
         """
         outpath = tkinter.filedialog.askdirectory()
         if outpath:
-            jsonlines, messagecsvlist = \
-                self.tabs.window.messagelog.debug_output()
-            export.write_json_lines(
-                jsonlines, os.path.join(outpath, 'ais-messages.jsonl'))
-            export.write_csv_file(
-                messagecsvlist, os.path.join(outpath, 'ais-messages.csv'))
+            export.write_debug_files(
+                self.tabs.window.messagelog,
+                os.path.join(outpath, 'ais-messages.jsonl'),
+                os.path.join(outpath, 'ais-messages.csv'))
         else:
             raise ExportAborted('Export cancelled by user.')
 
@@ -306,10 +321,81 @@ class ExportTab(tkinter.ttk.Frame):
             else:
                 raise ExportAborted('Export cancelled by user.')
 
+    def export_progress(self, done, total, mmsi):
+        """
+        record how many AIS stations have been exported
+
+        Note:
+            called from the export thread, the status bar is updated
+            from the tkinter thread by check_export
+
+        Args:
+            done(int): number of stations exported so far
+            total(int): total number of stations to export
+            mmsi(str): MMSI of the station just exported
+        """
+        self.exportprogress = (done, total, mmsi)
+
+    def check_export(self, previoustext):
+        """
+        show how many AIS stations have been exported in the status bar
+        and tell the user when the export thread has finished
+
+        Args:
+            previoustext(str): status bar text to restore when finished
+        """
+        if self.exportprogress:
+            self.tabs.window.statuslabel.config(
+                text='Exported AIS station {2} - {0} of {1}'.format(
+                    *self.exportprogress))
+        if self.exportthread.is_alive():
+            self.after(200, self.check_export, previoustext)
+            return
+        self.exportthread = None
+        self.exportprogress = None
+        self.tabs.window.statuslabel.config(
+            text=previoustext, bg='light grey')
+        if self.exporterror:
+            err = self.exporterror
+            self.exporterror = None
+            tkinter.messagebox.showerror(type(err).__name__, str(err))
+        else:
+            tkinter.messagebox.showinfo('Export Files', 'Export Successful')
+
+    def export_all_stations(self, outpath, orderby, region):
+        """
+        export overview and files for each individual station,
+        run in another thread so the GUI keeps responding
+
+        Args:
+            outpath(str): directory to export to
+            orderby(str): order the stations by 'Types', 'Flags' or 'Class'
+            region(str): IALA region 'A' or 'B'
+        """
+        try:
+            export.export_overview(
+                self.tabs.window.aistracker,
+                self.tabs.window.nmeatracker,
+                self.tabs.window.messagelog,
+                outpath, orderby=orderby, region=region,
+                messagedebug=False)
+            export.export_everything(
+                self.tabs.window.aistracker,
+                self.tabs.window.messagelog,
+                outpath, orderby=orderby, region=region,
+                workers=EXPORTTHREADS, processes=False,
+                progress=self.export_progress, overviewdebug=True)
+        except Exception as err:
+            AISLOGGER.exception('export error')
+            self.exporterror = err
+
     def export_everything(self):
         """
         export overview and files for each individual station
 
+        Returns:
+            True: the export carries on in another thread
+
         Raises:
             ExportAborted: if the user clicks cancel
         """
@@ -326,18 +412,13 @@ class ExportTab(tkinter.ttk.Frame):
                     text='Exporting all AIS station data to - {}'.format(
                         outpath),
                     fg='black', bg='gold')
-                self.update_idletasks()
-                export.export_overview(
-                    self.tabs.window.aistracker,
-                    self.tabs.window.nmeatracker,
-                    self.tabs.window.messagelog,
-                    outpath, orderby=orderby, region=currentregion)
-                export.export_everything(
-                    self.tabs.window.aistracker,
-                    self.tabs.window.messagelog,
-                    outpath, orderby=orderby, region=currentregion)
-                self.tabs.window.statuslabel.config(
-                    text=previoustext, bg='light grey')
+                self.exportthread = threading.Thread(
+                    target=self.export_all_stations,
+                    args=(outpath, orderby, currentregion))
+                self.exportthread.daemon = True
+                self.exportthread.start()
+                self.after(200, self.check_export, previoustext)
+                return True
             else:
                 raise ExportAborted(
                     'Export of all AIS data cancelled by user.')
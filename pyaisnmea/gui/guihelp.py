@@ -71,6 +71,8 @@ from the network.
 
 Server IP - ip of the interface to listen on, set to 0.0.0.0 for all interfaces
 Server Port - UDP port to listen on
+UDP Receive Buffer - size in bytes to ask for the UDP socket receive buffer to
+be, raise this if datagrams are being dropped in bursts of traffic
 
 To forward on the NMEA sentences to another network host, check the box
 'forward NMEA sentences to a remote host', then set the 'Remote Server IP' and
@@ -5,6 +5,8 @@ server
 
 import tkinter
 
+import pyaisnmea.network as network
+
 
 class NetworkSettingsWindow(tkinter.Toplevel):
     """
@@ -38,10 +40,37 @@ class NetworkSettingsWindow(tkinter.Toplevel):
         self.serverport = tkinter.Entry(netgroup)
         self.serverport.insert(0, self.window.netsettings['Server Port'])
         self.serverport.pack()
+        servertypelabel = tkinter.Label(netgroup, text='Server Type')
+        servertypelabel.pack()
+        self.servertype = tkinter.ttk.Combobox(netgroup, state='readonly')
+        self.servertype['values'] = tuple(self.window.servertypes)
+        self.servertype.set(self.window.netsettings['Server Type'])
+        self.servertype.pack()
+        extrasourceslabel = tkinter.Label(
+            netgroup, text=('Extra Sources (space seperated, e.g. '
+                            'udp://0.0.0.0:10111 tcpclient://HOST:PORT)'))
+        extrasourceslabel.pack()
+        self.extrasources = tkinter.Entry(netgroup, width=50)
+        self.extrasources.insert(0, self.window.netsettings['Extra Sources'])
+        self.extrasources.pack()
+        rcvbuflabel = tkinter.Label(
+            netgroup, text='UDP Receive Buffer (bytes)')
+        rcvbuflabel.pack()
+        self.rcvbuf = tkinter.Entry(netgroup)
+        self.rcvbuf.insert(0, self.window.netsettings['UDP Receive Buffer'])
+        self.rcvbuf.pack()
         self.chk = tkinter.Checkbutton(
             netgroup, text='forward NMEA Sentences to a remote host',
             var=self.window.forwardsentences)
         self.chk.pack()
+        self.sharedmemchk = tkinter.Checkbutton(
+            netgroup, text='pass sentences through shared memory',
+            var=self.window.sharedmemory)
+        self.sharedmemchk.pack()
+        self.duplicateschk = tkinter.Checkbutton(
+            netgroup, text='ignore duplicates from overlapping receivers',
+            var=self.window.suppressduplicates)
+        self.duplicateschk.pack()
         remotehostlabel = tkinter.Label(netgroup, text='Remote Server IP')
         remotehostlabel.pack()
         self.remotehost = tkinter.Entry(netgroup)
@@ -89,6 +118,10 @@ class NetworkSettingsWindow(tkinter.Toplevel):
             kmlgroup, text='KMZ map (full colour icons)',
             var=self.window.kmzlivemap)
         self.kmzchk.pack()
+        self.incrementalchk = tkinter.Checkbutton(
+            kmlgroup, text='only update stations that have changed',
+            var=self.window.incrementallivemap)
+        self.incrementalchk.pack()
         orderbylabel = tkinter.Label(kmlgroup)
         orderbylabel.configure(
             text='Order AIS Stations by...')
@@ -141,6 +174,18 @@ class NetworkSettingsWindow(tkinter.Toplevel):
         else:
             self.window.netsettings['Server IP'] = self.serverhost.get()
             self.window.netsettings['Server Port'] = int(self.serverport.get())
+            self.window.netsettings['Server Type'] = self.servertype.get()
+            try:
+                for source in self.extrasources.get().split():
+                    network.parse_source(source)
+            except ValueError as err:
+                tkinter.messagebox.showerror(
+                    'Network Settings', str(err), parent=self)
+                return
+            self.window.netsettings['Extra Sources'] = \
+                self.extrasources.get()
+            self.window.netsettings['UDP Receive Buffer'] = int(
+                self.rcvbuf.get())
             self.window.netsettings['Remote Server IP'] = self.remotehost.get()
             self.window.netsettings['Remote Server Port'] = int(
                 self.remoteport.get())
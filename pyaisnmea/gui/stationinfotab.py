@@ -206,19 +206,15 @@ class StationInfoTab(tkinter.ttk.Frame):
                 outpath = tkinter.filedialog.askdirectory()
                 if outpath:
                     lookupmmsi = self.stnlookup[dropdowntext]
-                    jsonlines, messagecsvlist = \
-                        self.tabs.window.messagelog.debug_output(
-                            mmsi=lookupmmsi)
-                    export.write_json_lines(
-                        jsonlines,
+                    export.write_debug_files(
+                        self.tabs.window.messagelog,
                         os.path.join(
                             outpath,
-                            dropdowntext + '-ais-messages.jsonl'))
-                    export.write_csv_file(
-                        messagecsvlist,
+                            dropdowntext + '-ais-messages.jsonl'),
                         os.path.join(
                             outpath,
-                            dropdowntext + '-ais-messages.csv'))
+                            dropdowntext + '-ais-messages.csv'),
+                        mmsi=lookupmmsi)
                     tkinter.messagebox.showinfo(
                         'Export Files', 'Export Successful')
                 else:
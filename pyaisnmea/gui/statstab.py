@@ -91,6 +91,21 @@ class StatsTab(tkinter.ttk.Frame):
         self.msgstatstxt.insert(
             tkinter.INSERT,
             export.create_summary_text(stats['Message Stats']))
+        if 'Duplicates' in stats:
+            self.msgstatstxt.insert(
+                tkinter.END,
+                export.create_summary_text(
+                    {'Duplicates': stats['Duplicates']}))
+        nmeastats = self.tabs.window.nmeatracker.nmea_stats()
+        if 'Sources' in nmeastats:
+            sourcestats = {}
+            for source, sentencestats in nmeastats['Sources'].items():
+                sourcestats[source] = dict(sentencestats)
+                sourcestats[source].update(
+                    stats.get('Sources', {}).get(source, {}))
+            self.msgstatstxt.insert(
+                tkinter.END,
+                export.create_summary_text({'Sources': sourcestats}))
         self.shiptypestxt.insert(
             tkinter.INSERT,
             export.create_summary_text(stats['Ship Types']))
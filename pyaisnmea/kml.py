@@ -3,8 +3,11 @@ a parser to generate Keyhole Markup Language (KML) for Google Earth
 """
 
 import datetime
+import hashlib
+import io
 import os
 import re
+import threading
 import zipfile
 
 import pyaisnmea.icons as icons
@@ -15,6 +18,9 @@ DATETIMEREGEX = re.compile(
     r'(0[0-9]|1[0-9]|2[0-3]):([0-5][0-9]):([0-5][0-9])')
 
 
+LIVEMAPDOCUMENTID = 'aisstations'
+
+
 class KMLOutputParser():
     """
     Class to parse KML into an output file.
@@ -103,6 +109,15 @@ class KMLOutputParser():
 </ListStyle>
 </Style>"""
 
+    def append_kml(self, kmlstr):
+        """
+        add a piece of KML to the document
+
+        Args:
+            kmlstr(str): the KML to add
+        """
+        self.kmldoc.append(kmlstr)
+
     @staticmethod
     def format_kml_placemark_description(placemarkdict):
         """
@@ -139,40 +154,60 @@ class KMLOutputParser():
         description = ''.join(descriptionlist)
         return description
 
-    def create_kml_header(self, kmz=True, iconsused='all', ialaregion='A'):
+    def create_kml_header(self, kmz=True, iconsused='all', ialaregion='A',
+                          headings=range(0, 360), cogs=range(0, 360),
+                          documentid=None):
         """
         Write the first part of the KML output file.
         This only needs to be called once at the start of the kml file.
 
+        Note:
+            only the styles for the icons and arrows listed are written,
+            pass just the ones the placemarks will use to keep the file small
+
         Args:
             kmz(bool): is this for a KMZ file or not?
             iconsused(str): do we use 'all' the icons (default)
-                            or specify a single icon?
+                            or specify a single icon? can also be a
+                            collection of station types
             ialaregion(str): which IALA region are we in A or B, default is A
+            headings(list): headings to write green arrow styles for
+            cogs(list): CoGs to write orange arrow styles for
+            documentid(str): id for the KML document, so features can be
+                             added to it later by a KML update
         """
-        self.kmldoc.append(self.kmlheader)
+        if documentid:
+            self.append_kml(self.kmlheader.replace(
+                '<Document>', '<Document id="{}">'.format(documentid)))
+        else:
+            self.append_kml(self.kmlheader)
         if kmz:
             icons.switch_IALA_region(ialaregion)
             if iconsused == 'all':
-                for icontype in icons.ICONS:
-                    iconkml = self.styletemplate % (icontype,
-                                                    icons.ICONS[icontype])
-                    self.kmldoc.append(iconkml)
+                iconsused = icons.ICONS
+            elif isinstance(iconsused, str):
+                iconsused = [iconsused]
             else:
+                iconsused = sorted(iconsused)
+            for icontype in iconsused:
                 try:
                     iconkml = self.styletemplate % (
-                        iconsused, icons.ICONS[iconsused])
+                        icontype, icons.ICONS[icontype])
                 except KeyError:
                     iconkml = self.styletemplate % (
-                        iconsused, icons.ICONS['Unknown'])
-                self.kmldoc.append(iconkml)
+                        icontype, icons.ICONS['Unknown'])
+                self.append_kml(iconkml)
+            headings = set(headings)
+            cogs = set(cogs)
             for heading in range(0, 360):
-                thiconkml = self.greenarrowtemplate % (
-                    str(heading) + 'TH', str(heading) + '.png')
-                cogiconkml = self.orangearrowtemplate % (
-                    str(heading) + 'CoG', str(heading) + '.png')
-                self.kmldoc.append(thiconkml)
-                self.kmldoc.append(cogiconkml)
+                if heading in headings:
+                    thiconkml = self.greenarrowtemplate % (
+                        str(heading) + 'TH', str(heading) + '.png')
+                    self.append_kml(thiconkml)
+                if heading in cogs:
+                    cogiconkml = self.orangearrowtemplate % (
+                        str(heading) + 'CoG', str(heading) + '.png')
+                    self.append_kml(cogiconkml)
 
     def add_kml_placemark(self, placemarkname, description, lon, lat, style,
                           altitude='0', kmz=True, timestamp=''):
@@ -196,25 +231,32 @@ class KMLOutputParser():
         placemark = self.placemarktemplate % (
             placemarkname, description, timestamp, lon, lat,
             altitude, style, coords)
-        self.kmldoc.append(placemark)
+        self.append_kml(placemark)
 
-    def open_folder(self, foldername):
+    def open_folder(self, foldername, folderid=None):
         """
         open a folder to store placemarks
 
         Args:
             foldername(str): the name of the folder
+            folderid(str): id for the folder, so it can be changed later
+                           by a KML update
         """
         cleanfoldername = remove_invalid_chars(foldername)
-        openfolderstr = "<Folder>\n<name>{}</name>".format(cleanfoldername)
-        self.kmldoc.append(openfolderstr)
+        if folderid:
+            openfolderstr = '<Folder id="{}">\n<name>{}</name>'.format(
+                folderid, cleanfoldername)
+        else:
+            openfolderstr = "<Folder>\n<name>{}</name>".format(
+                cleanfoldername)
+        self.append_kml(openfolderstr)
 
     def close_folder(self):
         """
         close the currently open folder
         """
         closefolderstr = "</Folder>"
-        self.kmldoc.append(closefolderstr)
+        self.append_kml(closefolderstr)
 
     def add_kml_placemark_linestring(self, placemarkname, coords):
         """
@@ -237,7 +279,7 @@ class KMLOutputParser():
             newcoordslist.append(coordsline)
         placemark = self.lineplacemarktemplate % (placemarkname,
                                                   '\n'.join(newcoordslist))
-        self.kmldoc.append(placemark)
+        self.append_kml(placemark)
 
     def close_kml_file(self):
         """
@@ -246,7 +288,7 @@ class KMLOutputParser():
         to ensure the tags are closed properly.
         """
         endtags = "\n</Document></kml>"
-        self.kmldoc.append(endtags)
+        self.append_kml(endtags)
 
     def write_kml_doc_file(self):
         """
@@ -257,46 +299,303 @@ class KMLOutputParser():
                 kmlout.write(kmltags)
 
 
+class KMLStreamWriter(KMLOutputParser):
+    """
+    Class to write KML straight to the output file as it is generated rather
+    than keeping the whole document in memory.
+
+    Note:
+        for a KMZ the KML is written straight into the doc.kml entry of the
+        zip file, call add_kmz_icons once the document has been written to
+        add the icons and close the KMZ
+
+        use it in a with statement so the file is closed if an error is
+        raised whilst the KML is written, the unfinished file is deleted
+
+    Args:
+        kmlfilepath(str): path to output KML or KMZ file
+        kmz(bool): write a KMZ file rather than a plain KML file
+
+    Attributes:
+        kmz(zipfile.ZipFile): the open KMZ file, None for a plain KML file
+        kmlout(io.TextIOWrapper): file the KML is written to
+    """
+
+    def __init__(self, kmlfilepath, kmz=False):
+        super().__init__(kmlfilepath)
+        if kmz:
+            self.kmz = zipfile.ZipFile(
+                kmlfilepath, 'w', zipfile.ZIP_DEFLATED, False)
+            self.kmlout = io.TextIOWrapper(
+                self.kmz.open('doc.kml', 'w'), encoding='utf-8')
+        else:
+            self.kmz = None
+            self.kmlout = open(kmlfilepath, 'w', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None:
+            try:
+                os.remove(self.kmlfilepath)
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        """
+        close the KML file or doc.kml entry and the KMZ file
+        """
+        self.write_kml_doc_file()
+        if self.kmz:
+            self.kmz.close()
+
+    def append_kml(self, kmlstr):
+        """
+        write a piece of KML to the output file
+
+        Args:
+            kmlstr(str): the KML to write
+        """
+        self.kmlout.write(kmlstr)
+
+    def write_kml_doc_file(self):
+        """
+        finish writing the KML and close the KML file or doc.kml entry
+        """
+        if not self.kmlout.closed:
+            self.kmlout.close()
+
+    def add_kmz_icons(self, iconslist=None,
+                      greenarrows=range(0, 360), orangearrows=range(0, 360)):
+        """
+        add the icons to the KMZ file and close it
+
+        Args:
+            iconslist(list): list of icons required
+            greenarrows(list): list of headings required
+            orangearrows(list): list of CoG required
+        """
+        self.write_kml_doc_file()
+        with self.kmz:
+            add_icons_to_kmz(self.kmz, iconslist, greenarrows, orangearrows)
+
+
+class KMLUpdateWriter(KMLStreamWriter):
+    """
+    Class to write a KML file containing a NetworkLinkControl Update to
+    create, change or delete features in a KML file that Google Earth has
+    already loaded.
+
+    Note:
+        the features created are written with the same methods as a
+        normal KML file, e.g. open_folder and add_kml_placemark, between
+        open_create and close_create
+
+    Args:
+        kmlfilepath(str): path to output the KML update file
+    """
+
+    def __init__(self, kmlfilepath):
+        super().__init__(kmlfilepath, kmz=False)
+
+    def create_update_header(self, targethref):
+        """
+        Write the start of the update, this needs to be called once at the
+        start of the file.
+
+        Args:
+            targethref(str): the KML file the update applies to, this must
+                             be the same as the href used to load it
+        """
+        updateheader = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<NetworkLinkControl>
+<Update>
+<targetHref>{}</targetHref>""".format(targethref)
+        self.append_kml(updateheader)
+
+    def delete_feature(self, targetid, featuretype='Folder'):
+        """
+        delete a feature from the target KML file
+
+        Note:
+            Google Earth ignores deletes for ids it does not have
+
+        Args:
+            targetid(str): id of the feature to delete
+            featuretype(str): KML element name of the feature
+        """
+        deletestr = '\n<Delete><{} targetId="{}"/></Delete>'.format(
+            featuretype, targetid)
+        self.append_kml(deletestr)
+
+    def open_create(self, targetid, containertype='Folder'):
+        """
+        start creating new features inside a container in the target KML
+
+        Args:
+            targetid(str): id of the folder or document to add features to
+            containertype(str): 'Folder' or 'Document'
+        """
+        createstr = '\n<Create><{} targetId="{}">'.format(
+            containertype, targetid)
+        self.append_kml(createstr)
+
+    def close_create(self, containertype='Folder'):
+        """
+        finish creating features
+
+        Args:
+            containertype(str): 'Folder' or 'Document', must be the same as
+                                the matching open_create
+        """
+        self.append_kml('</{}></Create>'.format(containertype))
+
+    def close_kml_file(self):
+        """
+        Write the end of the update file.
+        """
+        self.append_kml('\n</Update>\n</NetworkLinkControl>\n</kml>')
+
+
 class InvalidDateTimeString(Exception):
     """
     raise if timestamp is the wrong format
     """
 
 
-def make_kmz(kmzoutputfilename, iconslist=None,
-             greenarrows=range(0, 360), orangearrows=range(0, 360)):
+class IconCache():
     """
-    make a kmz file out of the doc.kml and symbols directory
+    cache of the icons and arrows, ready to be copied into KMZ files
+    without reading them from disk again
+
+    Note:
+        the same few hundred PNG files go into every KMZ we create, so
+        each one is only read the first time it is needed. PNG files are
+        already compressed so they are stored in the KMZ as they are.
+
+    Attributes:
+        entries(dict): keys are the path inside the KMZ, values are tuples
+                       of the modified time and the contents of the icon
+        lock(threading.Lock): stops two threads reading the same icon
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_entry(self, filepath, arcname):
+        """
+        get the icon, reading it from disk if it is not in the cache
+
+        Args:
+            filepath(str): path to the icon on disk
+            arcname(str): path of the icon inside the KMZ
+
+        Returns:
+            modified(tuple): modified time of the icon as used by zipfile
+            data(bytes): contents of the icon
+        """
+        with self.lock:
+            try:
+                return self.entries[arcname]
+            except KeyError:
+                pass
+            with open(filepath, 'rb') as iconfile:
+                data = iconfile.read()
+            zinfo = zipfile.ZipInfo.from_file(filepath, arcname)
+            self.entries[arcname] = (zinfo.date_time, data)
+            return self.entries[arcname]
+
+    def write(self, kmz, filepath, arcname):
+        """
+        copy an icon into an open KMZ file
+
+        Args:
+            kmz(zipfile.ZipFile): the kmz file open for writing
+            filepath(str): path to the icon on disk
+            arcname(str): path of the icon inside the KMZ
+        """
+        modified, data = self.get_entry(filepath, arcname)
+        zinfo = zipfile.ZipInfo(arcname, modified)
+        zinfo.external_attr = 0o644 << 16
+        kmz.writestr(zinfo, data, compress_type=zipfile.ZIP_STORED)
+
+
+ICONCACHE = IconCache()
+
+
+def create_feature_id(prefix, name):
+    """
+    create an id for a KML feature from its name
+
+    Note:
+        the name is hashed so the id is always valid in XML and stays the
+        same each time the map is written
 
     Args:
-        kmzoutputfilename(str): full path to the .kmz file to output
+        prefix(str): what sort of feature this is e.g. 'station'
+        name(str): name of the feature, a catagory or MMSI
+
+    Returns:
+        featureid(str): the id to use
+    """
+    namehash = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+    return '{}-{}'.format(prefix, namehash)
+
+
+def add_icons_to_kmz(kmz, iconslist=None,
+                     greenarrows=range(0, 360), orangearrows=range(0, 360)):
+    """
+    add the icons and arrows to an open kmz file
+
+    Args:
+        kmz(zipfile.ZipFile): the kmz file open for writing
         iconslist(list): list of icons required
         greenarrows(list): list of headings required
         orangearrows(list): list of CoG required
     """
     if iconslist is None:
         iconslist = icons.all_icons()
-    docpath = os.path.join(os.path.dirname(kmzoutputfilename), 'doc.kml')
     iconspath = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                              'static', 'icons')
     greenarrowspath = os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                    'static', 'green_arrows')
     orangearrowspath = os.path.join(
         os.path.dirname(os.path.realpath(__file__)), 'static', 'orange_arrows')
+    for icon in iconslist:
+        ICONCACHE.write(kmz, os.path.join(iconspath, icon),
+                        os.path.join('icons', icon))
+    for arrow in greenarrows:
+        ICONCACHE.write(kmz,
+                        os.path.join(greenarrowspath, str(arrow) + '.png'),
+                        os.path.join('green_arrows', str(arrow) + '.png'))
+    for arrow in orangearrows:
+        ICONCACHE.write(kmz,
+                        os.path.join(orangearrowspath, str(arrow) + '.png'),
+                        os.path.join('orange_arrows', str(arrow) + '.png'))
+
+
+def make_kmz(kmzoutputfilename, iconslist=None,
+             greenarrows=range(0, 360), orangearrows=range(0, 360)):
+    """
+    make a kmz file out of the doc.kml and symbols directory
+
+    Args:
+        kmzoutputfilename(str): full path to the .kmz file to output
+        iconslist(list): list of icons required
+        greenarrows(list): list of headings required
+        orangearrows(list): list of CoG required
+    """
+    docpath = os.path.join(os.path.dirname(kmzoutputfilename), 'doc.kml')
     with zipfile.ZipFile(kmzoutputfilename,
                          'w', zipfile.ZIP_DEFLATED, False) as kmz:
         try:
             kmz.debug = 3
             kmz.write(docpath, 'doc.kml')
-            for icon in iconslist:
-                kmz.write(os.path.join(iconspath, icon),
-                          os.path.join('icons', icon))
-            for arrow in greenarrows:
-                kmz.write(os.path.join(greenarrowspath, str(arrow) + '.png'),
-                          os.path.join('green_arrows', str(arrow) + '.png'))
-            for arrow in orangearrows:
-                kmz.write(os.path.join(orangearrowspath, str(arrow) + '.png'),
-                          os.path.join('orange_arrows', str(arrow) + '.png'))
+            add_icons_to_kmz(kmz, iconslist, greenarrows, orangearrows)
             os.remove(docpath)
         except (NotImplementedError, RuntimeError, zipfile.BadZipFile) as err:
             print('zip error')
@@ -0,0 +1,285 @@
+"""
+serve a live GeoJSON map of AIS stations over HTTP
+
+web map clients can poll the server for all the stations, only the stations
+in a bounding box or only the stations that have changed or been removed
+since they last asked
+"""
+
+import http.server
+import json
+import logging
+import threading
+import time
+import urllib.parse
+import zlib
+
+import pyaisnmea.geojson as geojson
+
+
+AISLOGGER = logging.getLogger(__name__)
+
+
+class InvalidQuery(Exception):
+    """
+    raise if the query parameters of a request cannot be understood
+    """
+
+
+class LiveGeoJSON():
+    """
+    keeps a GeoJSON feature for every station on the live map
+
+    Note:
+        each feature is converted to JSON once when its station changes and
+        kept in the fragment cache of the station, a request only has to
+        join the features it needs together
+
+    Args:
+        livemaptimeout(int): leave out stations not heard from for
+                             this many seconds
+
+    Attributes:
+        features(dict): keys are MMSIs, values are tuples of the time the
+                        feature last changed and a tuple of the longitude,
+                        latitude and the feature as JSON
+        removed(dict): keys are MMSIs of stations taken off the map, values
+                       are the time they were removed, kept for
+                       livemaptimeout seconds
+        generation(int): goes up by 1 every time a station changes
+        timestamp(float): time the features last changed
+        lock(threading.Lock): held whilst features are being replaced
+        httpserver(http.server.ThreadingHTTPServer): the HTTP server,
+                                                     None if not started
+        serverthread(threading.Thread): thread running the HTTP server
+    """
+
+    def __init__(self, livemaptimeout=480):
+        self.livemaptimeout = livemaptimeout
+        self.features = {}
+        self.removed = {}
+        self.generation = 0
+        self.timestamp = time.time()
+        self.lock = threading.Lock()
+        self.httpserver = None
+        self.serverthread = None
+
+    def update(self, aistracker):
+        """
+        update the features from the tracker, only stations that have sent
+        messages since the last update are converted to JSON again
+
+        Note:
+            call this with a snapshot of the tracker if another thread is
+            processing messages
+
+        Args:
+            aistracker(ais.AISTracker): the tracker to get stations from
+        """
+        currenttime = time.time()
+        mapstns = aistracker.get_map_stations(
+            livemap=True, livemaptimeout=self.livemaptimeout)
+        features = {}
+        changed = False
+        for catagory in mapstns:
+            for stn, lastpos in mapstns[catagory]:
+                fragment = stn.get_fragment(
+                    'livegeojson',
+                    lambda: self.render_feature(stn, lastpos))
+                try:
+                    feature = self.features[stn.mmsi]
+                    if feature[1] is fragment:
+                        features[stn.mmsi] = feature
+                        continue
+                except KeyError:
+                    pass
+                features[stn.mmsi] = (currenttime, fragment)
+                changed = True
+        if changed or features.keys() != self.features.keys():
+            removed = {
+                mmsi: removedtime for mmsi, removedtime in self.removed.items()
+                if mmsi not in features and
+                currenttime - removedtime < self.livemaptimeout}
+            for mmsi in self.features.keys() - features.keys():
+                removed[mmsi] = currenttime
+            with self.lock:
+                self.features = features
+                self.removed = removed
+                self.generation += 1
+                self.timestamp = currenttime
+
+    @staticmethod
+    def render_feature(stn, lastpos):
+        """
+        render the GeoJSON point for a station
+
+        Args:
+            stn(ais.AISStation): the station
+            lastpos(dict): the position report the point is for
+
+        Returns:
+            feature(tuple): longitude, latitude and the point as JSON
+        """
+        point = geojson.GeoJsonParser.create_feature_point(
+            lastpos['Longitude'], lastpos['Latitude'],
+            stn.get_geojson_properties(lastpos))
+        return (lastpos['Longitude'], lastpos['Latitude'], json.dumps(point))
+
+    @staticmethod
+    def parse_query(query):
+        """
+        read the bbox and since parameters from a query string
+
+        Args:
+            query(str): the query string from the URL
+
+        Raises:
+            InvalidQuery: if bbox or since are not numbers
+
+        Returns:
+            bbox(list): min longitude, min latitude, max longitude and
+                        max latitude, None if not given
+            since(float): only return stations changed after this time in
+                          seconds since the epoch, None if not given
+        """
+        params = urllib.parse.parse_qs(query)
+        bbox = None
+        since = None
+        try:
+            if 'bbox' in params:
+                bbox = [float(x) for x in params['bbox'][0].split(',')]
+                if len(bbox) != 4:
+                    raise InvalidQuery(
+                        'bbox must be minlon,minlat,maxlon,maxlat')
+            if 'since' in params:
+                since = float(params['since'][0])
+        except ValueError as err:
+            raise InvalidQuery(str(err))
+        return bbox, since
+
+    def get_geojson(self, query=''):
+        """
+        get the GeoJSON FeatureCollection for a request
+
+        Args:
+            query(str): query string containing bbox and since parameters
+
+        Raises:
+            InvalidQuery: if the query string cannot be understood
+
+        Note:
+            if since is given the response also has a removed member
+            listing the MMSIs of stations that have timed out since then,
+            or that have moved out of the bounding box
+
+        Returns:
+            etag(str): ETag for the response
+            geojsontxt(str): the GeoJSON FeatureCollection
+        """
+        bbox, since = self.parse_query(query)
+        with self.lock:
+            features = self.features
+            removed = self.removed
+            generation = self.generation
+            timestamp = self.timestamp
+        etag = '"{}-{:08x}"'.format(
+            generation, zlib.crc32(query.encode('utf-8')))
+        fragments = []
+        removedmmsis = []
+        for mmsi, (changed, (lon, lat, fragment)) in features.items():
+            if since is not None and changed <= since:
+                continue
+            if bbox and not (bbox[0] <= lon <= bbox[2] and
+                             bbox[1] <= lat <= bbox[3]):
+                if since is not None:
+                    removedmmsis.append(mmsi)
+                continue
+            fragments.append(fragment)
+        if since is None:
+            geojsontxt = (
+                '{{"type": "FeatureCollection", "timestamp": {}, '
+                '"features": [{}]}}'.format(timestamp, ', '.join(fragments)))
+        else:
+            removedmmsis.extend(
+                mmsi for mmsi, removedtime in removed.items()
+                if removedtime > since)
+            geojsontxt = (
+                '{{"type": "FeatureCollection", "timestamp": {}, '
+                '"removed": {}, "features": [{}]}}'.format(
+                    timestamp, json.dumps(removedmmsis),
+                    ', '.join(fragments)))
+        return etag, geojsontxt
+
+    def start_server(self, host='127.0.0.1', port=8080):
+        """
+        start serving the GeoJSON over HTTP in another thread
+
+        Args:
+            host(str): address to listen on
+            port(int): port to listen on
+        """
+        self.httpserver = http.server.ThreadingHTTPServer(
+            (host, port), GeoJSONRequestHandler)
+        self.httpserver.livegeojson = self
+        self.serverthread = threading.Thread(
+            target=self.httpserver.serve_forever, daemon=True)
+        self.serverthread.start()
+        AISLOGGER.info('serving live GeoJSON on http://%s:%s/', host, port)
+
+    def stop_server(self):
+        """
+        stop the HTTP server
+        """
+        if self.httpserver:
+            self.httpserver.shutdown()
+            self.httpserver.server_close()
+            self.serverthread.join()
+            self.httpserver = None
+            self.serverthread = None
+
+
+class GeoJSONRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    answer requests for the live GeoJSON
+
+    Note:
+        GET / or /stations.geojson with optional query parameters
+        bbox=minlon,minlat,maxlon,maxlat and since=seconds since the epoch,
+        the timestamp in each response can be sent back as since to only
+        get the stations that have changed, the MMSIs of stations to take
+        off the map are in removed
+    """
+
+    def do_GET(self):
+        """
+        send the GeoJSON or 304 Not Modified if the client already has it
+        """
+        url = urllib.parse.urlsplit(self.path)
+        if url.path not in ('/', '/stations.geojson'):
+            self.send_error(404)
+            return
+        try:
+            etag, geojsontxt = self.server.livegeojson.get_geojson(url.query)
+        except InvalidQuery as err:
+            self.send_error(400, explain=str(err))
+            return
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = geojsontxt.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/geo+json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        log requests to the module logger rather than stderr
+        """
+        AISLOGGER.debug(format, *args)
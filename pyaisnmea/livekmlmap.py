@@ -2,16 +2,22 @@
 self updating KML map
 """
 
+import asyncio
 import datetime
+import hashlib
 import logging
 import os
 import multiprocessing
 import shutil
+import threading
 import time
 
 import pyaisnmea.ais as ais
+import pyaisnmea.kml as kml
+import pyaisnmea.livegeojson as livegeojson
 import pyaisnmea.network as network
 import pyaisnmea.nmea as nmea
+import pyaisnmea.ringbuffer as ringbuffer
 
 AISLOGGER = logging.getLogger(__name__)
 
@@ -26,16 +32,56 @@ class LiveKMLMap():
         orderby(str): order the stations by 'Types', 'Flags' or 'Class'
                       default is 'Types'
         region(str): IALA region, default is A
+        incremental(bool): only send Google Earth the stations that have
+                           changed as KML updates rather than the whole map
+        fullrewriteinterval(int): seconds between rewriting the whole map
+                                  when incremental is True
+        sharedmemory(bool): get sentences from the server process through a
+                            ring buffer in shared memory rather than a
+                            multiprocessing.Queue
+        forwardto(list): tuples of host and port to forward the received
+                         sentences to
+        forwardbatch(bool): pack many forwarded sentences into each datagram
+        duplicatewindow(float): ignore messages already received in the
+                                last this many seconds, default is to
+                                process every message
+        rcvbuf(int): size to ask for the UDP socket receive buffer to be
 
     Attributes:
         kmlnetlink(str): the KML for a netlink file
+        kmlupdatenetlink(str): the KML for a netlink file that loads the map
+            then applies the updates to it
         kmzoutput(bool): output KMZ file?
-        mpq(multiprocessing.Queue): queue to get sentences from
+        mpq(multiprocessing.Queue): queue to get lists of sentences from,
+            a ringbuffer.SentenceRingBuffer if sharedmemory is True,
+            None until start_server is called
         serverprocess(None): placeholder for a multiprocessing.Process object
         netlinkpath(str): path to write the KML netlink file
         kmlpath(str): path to write the actual KML map data to
         logpath(str): path to write the received NMEA sentences to
         aistracker(ais.AISTracker): AIS tracker object to handle the stations
+        updatepath(str): path to write the KML updates to
+        lastfullrewrite(float): time.monotonic() of the last time the whole
+                                map was written, None if never written
+        mappedstns(dict): keys are MMSIs of the stations in the last full
+                          map, values are what they looked like on it
+        mappedcatagories(set): catagory folders in the last full map
+        previousmappedstns(dict): mappedstns for the full map before the
+                                  last one
+        previousmappedcatagories(set): mappedcatagories for the full map
+                                       before the last one
+        mapstate(dict): what the stations looked like on the last map
+                        written, the same form as mappedstns
+        filehashes(dict): keys are paths of live files, values are SHA1
+                          hashes of what was last written to them
+        trackerlock(threading.Lock): hold this whilst processing messages
+                                     so the map is drawn from a consistent
+                                     copy of the tracker
+        renderthread(threading.Thread): draws the map in the background,
+                                        None if not started
+        renderstop(threading.Event): set to stop the render thread
+        livegeojson(livegeojson.LiveGeoJSON): serves the map as GeoJSON
+                                              over HTTP, None if not started
     """
 
     kmlnetlink = """<?xml version="1.0" encoding="UTF-8"?>
@@ -52,13 +98,47 @@ class LiveKMLMap():
     </NetworkLink>
 </kml>"""
 
+    kmlupdatenetlink = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+  <Document>
+    <name>Live AIS Traffic</name>
+    <NetworkLink>
+      <name>AIS Stations</name>
+      <description>show AIS stations on a map</description>
+      <Link>
+        <href>{}</href>
+        <refreshVisibility>1</refreshVisibility>
+        <refreshMode>onInterval</refreshMode>
+        <refreshInterval>{}</refreshInterval>
+      </Link>
+    </NetworkLink>
+    <NetworkLink>
+      <name>AIS Station Updates</name>
+      <Link>
+        <href>{}</href>
+        <refreshMode>onInterval</refreshMode>
+        <refreshInterval>1</refreshInterval>
+      </Link>
+    </NetworkLink>
+  </Document>
+</kml>"""
+
     def __init__(self, outputpath, kmzoutput=False,
-                 orderby='Types', region='A'):
+                 orderby='Types', region='A', incremental=False,
+                 fullrewriteinterval=60, sharedmemory=False,
+                 forwardto=None, forwardbatch=False, duplicatewindow=None,
+                 rcvbuf=4194304):
         self.kmzoutput = kmzoutput
         self.orderby = orderby
         self.region = region
+        self.incremental = incremental
+        self.fullrewriteinterval = fullrewriteinterval
         self.outputpath = outputpath
-        self.mpq = multiprocessing.Queue()
+        self.sharedmemory = sharedmemory
+        self.forwardto = forwardto
+        self.forwardbatch = forwardbatch
+        self.rcvbuf = rcvbuf
+        self.mpq = None
         self.serverprocess = None
         if not os.path.exists(outputpath):
             AISLOGGER.info('output path does not exist creating directories')
@@ -66,7 +146,22 @@ class LiveKMLMap():
         self.netlinkpath = os.path.join(outputpath, 'open_this.kml')
         self.kmlpath = os.path.join(outputpath, 'livemapdata.kml')
         self.logpath = os.path.join(outputpath, 'nmea-sentence-log.txt')
+        self.updatepath = os.path.join(outputpath, 'livemapupdate.kml')
+        self.lastfullrewrite = None
+        self.mappedstns = {}
+        self.mappedcatagories = set()
+        self.previousmappedstns = {}
+        self.previousmappedcatagories = set()
+        self.mapstate = None
+        self.filehashes = {}
+        self.trackerlock = threading.Lock()
+        self.renderthread = None
+        self.renderstop = threading.Event()
+        self.livegeojson = None
         self.aistracker = ais.AISTracker()
+        if duplicatewindow:
+            self.aistracker.duplicatefilter = ais.DuplicateFilter(
+                window=duplicatewindow)
         self.nmeatracker = nmea.NMEAtracker()
         if kmzoutput:
             self.copy_icons()
@@ -98,16 +193,315 @@ class LiveKMLMap():
         """
         write the netlink file
         """
-        with open(os.path.join(self.netlinkpath), 'w') as netlinkfile:
-            netlinkfile.write(self.kmlnetlink.format(self.kmlpath))
+        temppath = self.netlinkpath + '.tmp'
+        with open(temppath, 'w') as netlinkfile:
+            if self.incremental:
+                netlinkfile.write(self.kmlupdatenetlink.format(
+                    os.path.basename(self.kmlpath), self.fullrewriteinterval,
+                    os.path.basename(self.updatepath)))
+            else:
+                netlinkfile.write(self.kmlnetlink.format(self.kmlpath))
+        self.replace_file(temppath, self.netlinkpath)
+
+    def replace_file(self, temppath, outputpath):
+        """
+        move a newly written file over the live one in one step, so Google
+        Earth never reads a half written file
+
+        Note:
+            if the new file is the same as the live one it is deleted
+            instead and the live file is left alone
+
+        Args:
+            temppath(str): path to the newly written file
+            outputpath(str): path to the live file
+
+        Returns:
+            replaced(bool): False if the file had not changed
+        """
+        with open(temppath, 'rb') as newfile:
+            filehash = hashlib.sha1(newfile.read()).hexdigest()
+        if (self.filehashes.get(outputpath) == filehash and
+                os.path.exists(outputpath)):
+            os.remove(temppath)
+            return False
+        os.replace(temppath, outputpath)
+        self.filehashes[outputpath] = filehash
+        return True
+
+    @staticmethod
+    def station_map_key(catagory, stn):
+        """
+        a key that changes whenever the station needs redrawing on the map
+
+        Args:
+            catagory(str): the catagory folder the station is in
+            stn(ais.AISStation): the station
+
+        Returns:
+            mapkey(tuple): catagory, name, type and number of positions
+        """
+        return (catagory, stn.name, stn.stntype, len(stn.posrep))
+
+    def write_kml_map(self, aistracker=None, livemaptimeout=480):
+        """
+        write the live map, either the whole map or in incremental mode
+        just the stations that have changed since the last full map
+
+        Note:
+            nothing is drawn if none of the stations on the map have changed
+            since it was last written
+
+        Args:
+            aistracker(ais.AISTracker): tracker to draw the map from,
+                                        default is self.aistracker
+            livemaptimeout(int): leave out stations not heard from for
+                                 this many seconds
+
+        Returns:
+            written(bool): False if the map had not changed
+        """
+        if aistracker is None:
+            aistracker = self.aistracker
+        mapstns = aistracker.get_map_stations(
+            orderby=self.orderby, livemap=True, livemaptimeout=livemaptimeout)
+        mapstate = {}
+        for catagory in mapstns:
+            for stn, _ in mapstns[catagory]:
+                mapstate[stn.mmsi] = self.station_map_key(catagory, stn)
+        currenttime = time.monotonic()
+        fullrewrite = (
+            self.lastfullrewrite is None or
+            currenttime - self.lastfullrewrite >= self.fullrewriteinterval)
+        if mapstate == self.mapstate and not (
+                self.incremental and fullrewrite):
+            return False
+        self.mapstate = mapstate
+        if not self.incremental:
+            temppath = self.kmlpath + '.tmp'
+            aistracker.create_kml_map(
+                temppath, kmzoutput=self.kmzoutput,
+                linestring=False, livemap=True, orderby=self.orderby,
+                region=self.region, mapstns=mapstns)
+            return self.replace_file(temppath, self.kmlpath)
+        written = False
+        if fullrewrite:
+            temppath = self.kmlpath + '.tmp'
+            aistracker.create_kml_map(
+                temppath, kmzoutput=self.kmzoutput,
+                linestring=False, livemap=True, orderby=self.orderby,
+                region=self.region, incremental=True, mapstns=mapstns)
+            written = self.replace_file(temppath, self.kmlpath)
+            self.lastfullrewrite = currenttime
+            self.previousmappedcatagories = self.mappedcatagories
+            self.previousmappedstns = self.mappedstns
+            self.mappedcatagories = set(mapstns)
+            self.mappedstns = mapstate
+        return self.write_kml_update(mapstns) or written
+
+    def start_renderer(self, aistracker=None, trackerlock=None,
+                       interval=10, livemaptimeout=480):
+        """
+        start drawing the map in another thread every interval seconds
+
+        Note:
+            the map is drawn from a snapshot of the tracker so messages can
+            carry on being processed whilst the map is written, trackerlock
+            is only held whilst the snapshot is taken
+
+        Args:
+            aistracker(ais.AISTracker): tracker to draw the map from,
+                                        default is self.aistracker
+            trackerlock(threading.Lock): lock held whilst aistracker is
+                                         processing messages,
+                                         default is self.trackerlock
+            interval(int): seconds between each map
+            livemaptimeout(int): leave out stations not heard from for
+                                 this many seconds
+        """
+        if aistracker is None:
+            aistracker = self.aistracker
+        if trackerlock is None:
+            trackerlock = self.trackerlock
+        self.renderstop.clear()
+        self.renderthread = threading.Thread(
+            target=self.render_kml_map,
+            args=(aistracker, trackerlock, interval, livemaptimeout),
+            daemon=True)
+        self.renderthread.start()
 
-    def start_server(self):
+    def stop_renderer(self):
         """
-        start listening for sentences
+        stop the render thread
         """
-        self.serverprocess = multiprocessing.Process(
-            target=network.mpserver, args=[self.mpq],
-            kwargs={'logpath': self.logpath})
+        if self.renderthread:
+            self.renderstop.set()
+            self.renderthread.join()
+            self.renderthread = None
+
+    def render_kml_map(self, aistracker, trackerlock, interval,
+                       livemaptimeout):
+        """
+        draw the map from a snapshot of the tracker on a fixed interval
+        until renderstop is set, run in another thread
+
+        Note:
+            if the GeoJSON server is running it is updated every second
+            from a snapshot of just the last position of each station.
+            a new snapshot is only taken if messages have been processed
+            since the last one, otherwise the last one is used again so
+            stations can still time out
+
+        Args:
+            aistracker(ais.AISTracker): tracker to draw the map from
+            trackerlock(threading.Lock): lock held whilst aistracker is
+                                         processing messages
+            interval(int): seconds between each map
+            livemaptimeout(int): leave out stations not heard from for
+                                 this many seconds
+        """
+        if self.livegeojson:
+            tick = min(interval, 1)
+        else:
+            tick = interval
+        nexttick = time.monotonic() + tick
+        nextrender = time.monotonic() + interval
+        snapshot = None
+        snapshotmessages = None
+        fullsnapshot = False
+        while not self.renderstop.wait(max(0, nexttick - time.monotonic())):
+            nexttick += tick
+            render = time.monotonic() >= nextrender
+            with trackerlock:
+                if (aistracker.messagesprocessed != snapshotmessages or
+                        (render and not fullsnapshot)):
+                    snapshot = aistracker.snapshot(latestonly=not render)
+                    snapshotmessages = aistracker.messagesprocessed
+                    fullsnapshot = render
+            try:
+                if self.livegeojson:
+                    self.livegeojson.update(snapshot)
+                if render:
+                    nextrender += interval
+                    self.write_kml_map(
+                        snapshot, livemaptimeout=livemaptimeout)
+            except Exception:
+                AISLOGGER.exception('error writing live map')
+
+    def start_geojson_server(self, host='127.0.0.1', port=8080,
+                             livemaptimeout=480):
+        """
+        serve the live map as GeoJSON over HTTP, call this before
+        start_renderer
+
+        Args:
+            host(str): address to listen on
+            port(int): port to listen on
+            livemaptimeout(int): leave out stations not heard from for
+                                 this many seconds
+        """
+        self.livegeojson = livegeojson.LiveGeoJSON(
+            livemaptimeout=livemaptimeout)
+        self.livegeojson.start_server(host=host, port=port)
+
+    def write_kml_update(self, mapstns):
+        """
+        write a KML update with all the changes since the full map that
+        Google Earth has loaded
+
+        Note:
+            Google Earth applies the update file every time it reloads it,
+            so each station that has changed is deleted and created again
+            rather than created or changed, this way applying the same
+            update twice gives the same map.
+            Google Earth only reloads the full map every
+            fullrewriteinterval seconds, until then it may still have the
+            full map before the last one, so the update is made against
+            that one instead
+
+        Args:
+            mapstns(collections.OrderedDict): stations currently on the map
+                from ais.AISTracker.get_map_stations
+
+        Returns:
+            replaced(bool): False if the update had not changed
+        """
+        if (self.lastfullrewrite is not None and
+                time.monotonic() - self.lastfullrewrite <
+                self.fullrewriteinterval):
+            mappedcatagories = self.previousmappedcatagories
+            mappedstns = self.previousmappedstns
+        else:
+            mappedcatagories = self.mappedcatagories
+            mappedstns = self.mappedstns
+        temppath = self.updatepath + '.tmp'
+        with kml.KMLUpdateWriter(temppath) as updatemap:
+            updatemap.create_update_header(os.path.basename(self.kmlpath))
+            currentstns = set()
+            for catagory in mapstns:
+                catagoryid = kml.create_feature_id('catagory', catagory)
+                if catagory not in mappedcatagories:
+                    updatemap.delete_feature(catagoryid)
+                    updatemap.open_create(
+                        kml.LIVEMAPDOCUMENTID, containertype='Document')
+                    updatemap.open_folder(catagory, folderid=catagoryid)
+                    updatemap.close_folder()
+                    updatemap.close_create(containertype='Document')
+                for stn, lastpos in mapstns[catagory]:
+                    currentstns.add(stn.mmsi)
+                    mapkey = self.station_map_key(catagory, stn)
+                    if mappedstns.get(stn.mmsi) == mapkey:
+                        continue
+                    stnid = kml.create_feature_id('station', stn.mmsi)
+                    updatemap.delete_feature(stnid)
+                    updatemap.open_create(catagoryid)
+                    stn.create_kml_folder(
+                        updatemap, lastpos['Time'],
+                        kmzoutput=self.kmzoutput, linestring=False,
+                        folderid=stnid)
+                    updatemap.close_create()
+            for mmsi in mappedstns:
+                if mmsi not in currentstns:
+                    updatemap.delete_feature(
+                        kml.create_feature_id('station', mmsi))
+            updatemap.close_kml_file()
+        return self.replace_file(temppath, self.updatepath)
+
+    def start_server(self, sources=None):
+        """
+        start listening for sentences in another process
+
+        Note:
+            a single UDP source is read by network.mpserver, anything else
+            by network.mpmultiserver with all the sources in one event loop
+
+        Args:
+            sources(list): tuples of servertype, host and port,
+                           servertype is 'udp' to listen for UDP datagrams,
+                           'tcpserver' to listen for TCP feeders or
+                           'tcpclient' to connect to a TCP server,
+                           default is UDP on 127.0.0.1 port 10110
+        """
+        if not sources:
+            sources = [('udp', '127.0.0.1', 10110)]
+        if self.sharedmemory:
+            self.mpq = ringbuffer.SentenceRingBuffer()
+        else:
+            self.mpq = multiprocessing.Queue()
+        serverkwargs = {'logpath': self.logpath, 'forwardto': self.forwardto,
+                        'forwardbatch': self.forwardbatch,
+                        'rcvbuf': self.rcvbuf}
+        if len(sources) == 1 and sources[0][0] == 'udp':
+            _, serverkwargs['host'], serverkwargs['port'] = sources[0]
+            if self.sharedmemory:
+                serverkwargs['batchsize'] = 1
+            self.serverprocess = multiprocessing.Process(
+                target=network.mpserver, args=[self.mpq],
+                kwargs=serverkwargs)
+        else:
+            self.serverprocess = multiprocessing.Process(
+                target=network.mpmultiserver, args=[self.mpq, sources],
+                kwargs=serverkwargs)
         self.serverprocess.start()
 
     def stop_server(self):
@@ -116,6 +510,57 @@ class LiveKMLMap():
         """
         AISLOGGER.info('stopping server process')
         self.serverprocess.terminate()
+        self.serverprocess.join()
+
+    def process_sentences(self, sentences, source=None):
+        """
+        process NMEA sentences received from the network
+
+        Args:
+            sentences(list): NMEA 0183 sentences
+            source(str): name of where the sentences came from
+        """
+        for sentence in sentences:
+            try:
+                payload = self.nmeatracker.process_sentence(
+                    sentence, source=source)
+                if payload:
+                    currenttime = nmea.tag_block_timestamp(
+                        self.nmeatracker.lasttagblock)
+                    if not currenttime:
+                        currenttime = datetime.datetime.utcnow().strftime(
+                            '%Y/%m/%d %H:%M:%S')
+                    with self.trackerlock:
+                        msg = self.aistracker.process_message(
+                            payload, timestamp=currenttime, source=source)
+                    AISLOGGER.info(msg.__str__())
+            except (nmea.NMEAInvalidSentence, nmea.NMEACheckSumFailed,
+                    ais.UnknownMessageType, ais.InvalidMMSI,
+                    ais.DuplicateMessage) as err:
+                AISLOGGER.debug(str(err))
+                continue
+            except IndexError:
+                AISLOGGER.debug('no data on line')
+                continue
+
+    def stop_live_map(self):
+        """
+        stop the render thread and the GeoJSON server and close the queue
+        from the server process
+
+        Note:
+            call stop_server first, closing a ring buffer unlinks its
+            shared memory
+        """
+        self.stop_renderer()
+        if self.livegeojson:
+            self.livegeojson.stop_server()
+        if self.mpq is not None:
+            if self.sharedmemory:
+                AISLOGGER.info('%s sentences dropped by the ring buffer',
+                               self.mpq.dropped)
+            self.mpq.close()
+            self.mpq = None
 
     def get_nmea_sentences(self):
         """
@@ -123,30 +568,40 @@ class LiveKMLMap():
         """
         AISLOGGER.info('live KML map, open %s to track vessels',
                        os.path.realpath(self.netlinkpath))
+        self.start_renderer()
         while True:
-            qdata = self.mpq.get()
-            if qdata:
-                try:
-                    payload = self.nmeatracker.process_sentence(qdata)
-                    if payload:
-                        currenttime = datetime.datetime.utcnow().strftime(
-                            '%Y/%m/%d %H:%M:%S')
-                        msg = self.aistracker.process_message(
-                            payload, timestamp=currenttime)
-                        AISLOGGER.info(msg.__str__())
-                        if currenttime.endswith('5'):
-                            self.aistracker.create_kml_map(
-                                self.kmlpath, kmzoutput=self.kmzoutput,
-                                linestring=False, livemap=True,
-                                orderby=self.orderby, region=self.region)
-                            time.sleep(1)
-                except (nmea.NMEAInvalidSentence, nmea.NMEACheckSumFailed,
-                        ais.UnknownMessageType, ais.InvalidMMSI) as err:
-                    AISLOGGER.debug(str(err))
-                    continue
-                except IndexError:
-                    AISLOGGER.debug('no data on line')
-                    continue
-                except KeyboardInterrupt:
-                    self.stop_server()
-                    break
+            try:
+                source, sentences = self.mpq.get()
+                self.process_sentences(sentences, source=source)
+            except KeyboardInterrupt:
+                self.stop_server()
+                self.stop_live_map()
+                break
+
+    def run_async_server(self, sources=None):
+        """
+        listen for nmea sentences with asyncio in this process and write to
+        kml file, sentences are processed as soon as they arrive with no
+        server process or queue in between
+
+        Args:
+            sources(list): tuples of servertype, host and port, all read in
+                           one event loop, servertype is 'udp' to listen
+                           for UDP datagrams, 'tcpserver' to listen for TCP
+                           feeders or 'tcpclient' to connect to a TCP
+                           server, default is UDP on 127.0.0.1 port 10110
+        """
+        if not sources:
+            sources = [('udp', '127.0.0.1', 10110)]
+        AISLOGGER.info('live KML map, open %s to track vessels',
+                       os.path.realpath(self.netlinkpath))
+        self.start_renderer()
+        try:
+            asyncio.run(network.multiserver(
+                self.process_sentences, sources, logpath=self.logpath,
+                forwardto=self.forwardto, forwardbatch=self.forwardbatch,
+                rcvbuf=self.rcvbuf))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_live_map()
@@ -2,14 +2,23 @@
 module to deal with getting NMEA 0183 sentences from the network
 """
 
+import asyncio
+import errno
+import functools
 import logging
 import logging.handlers
+import os
 import socket
+import struct
+import sys
+import time
 
 import pyaisnmea.nmea as nmea
 
 AISLOGGER = logging.getLogger(__name__)
 SENTENCELOGGER = logging.getLogger('sentences')
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+WSAEMSGSIZE = getattr(errno, 'WSAEMSGSIZE', 10040)
 
 
 def network_send(sentence, rhost, rport):
@@ -25,13 +34,313 @@ def network_send(sentence, rhost, rport):
     sock.sendto(sentence, (rhost, rport))
 
 
+def source_name(servertype, host, port):
+    """
+    the name sentences from a server are counted under in the stats
+
+    Args:
+        servertype(str): 'udp', 'tcpserver' or 'tcpclient'
+        host(str): host interface ip or server
+        port(int): port
+
+    Returns:
+        name(str): the name of the source as servertype://host:port
+    """
+    return '{}://{}:{}'.format(servertype, host, port)
+
+
+def parse_source(name):
+    """
+    read a source in the form servertype://host:port
+
+    Args:
+        name(str): the source
+
+    Raises:
+        ValueError: if the source is not in the right form or the
+                    servertype is unknown
+
+    Returns:
+        source(tuple): servertype, host and port as an int
+    """
+    servertype, seperator, hostport = name.partition('://')
+    host, _, port = hostport.rpartition(':')
+    if not seperator or not host or servertype not in MPSERVERS:
+        raise ValueError('{} is not udp|tcpserver|tcpclient://HOST:PORT'
+                         .format(name))
+    return (servertype, host, int(port))
+
+
+class SentenceForwarder():
+    """
+    forward NMEA sentences to one or more remote servers over UDP
+
+    Note:
+        each destination has its own socket that is kept open, each
+        sentence is sent once with a CR LF on the end, if batch is True
+        sentences are packed together into datagrams of up to mtu bytes
+
+    Args:
+        destinations(list): tuples of host and port to forward to
+        batch(bool): pack many sentences into each datagram
+        mtu(int): largest datagram to send when batch is True
+
+    Attributes:
+        sockets(dict): keys are destinations, values are sockets
+                       connected to them
+        sentcount(int): number of sentences forwarded to each destination
+        errorcount(int): number of datagrams that could not be sent
+    """
+
+    def __init__(self, destinations, batch=False, mtu=1472):
+        self.batch = batch
+        self.mtu = mtu
+        self.sockets = {}
+        self.sentcount = 0
+        self.errorcount = 0
+        for host, port in destinations:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((host, port))
+            self.sockets[(host, port)] = sock
+            AISLOGGER.info('forwarding sentences to %s port %s', host, port)
+
+    def create_datagrams(self, sentences):
+        """
+        turn sentences into the datagrams to send
+
+        Args:
+            sentences(list): NMEA sentences
+
+        Returns:
+            datagrams(list): ASCII encoded bytes
+        """
+        if not self.batch:
+            return [(sentence + '\r\n').encode('ascii')
+                    for sentence in sentences]
+        datagrams = []
+        current = []
+        currentsize = 0
+        for sentence in sentences:
+            line = (sentence + '\r\n').encode('ascii')
+            if current and currentsize + len(line) > self.mtu:
+                datagrams.append(b''.join(current))
+                current = []
+                currentsize = 0
+            current.append(line)
+            currentsize += len(line)
+        if current:
+            datagrams.append(b''.join(current))
+        return datagrams
+
+    def forward(self, sentences):
+        """
+        forward sentences to all the destinations
+
+        Args:
+            sentences(list): NMEA sentences
+        """
+        datagrams = self.create_datagrams(sentences)
+        for destination, sock in self.sockets.items():
+            for datagram in datagrams:
+                try:
+                    sock.send(datagram)
+                except OSError as err:
+                    self.errorcount += 1
+                    AISLOGGER.debug('cannot forward to %s - %s',
+                                    destination, err)
+        self.sentcount += len(sentences)
+
+    def close(self):
+        """
+        close all the sockets
+        """
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+
+def create_forwarder(remotehost=None, remoteport=None, forwardto=None,
+                     forwardbatch=False):
+    """
+    make a SentenceForwarder for all the places to forward sentences to
+
+    Args:
+        remotehost(str): ip of server to forward NMEA sentences to
+        remoteport(int): port of remote server
+        forwardto(list): more tuples of host and port to forward to
+        forwardbatch(bool): pack many sentences into each datagram
+
+    Returns:
+        forwarder(SentenceForwarder): None if there is nowhere to forward to
+    """
+    destinations = list(forwardto or [])
+    if remotehost and remoteport:
+        destinations.insert(0, (remotehost, remoteport))
+    if not destinations:
+        return None
+    return SentenceForwarder(destinations, batch=forwardbatch)
+
+
+class UDPReceiver():
+    """
+    receive UDP datagrams into one buffer that is made once
+
+    Note:
+        each call to receive waits for a datagram then takes any others
+        already queued on the socket without waiting, so a burst of
+        datagrams is read in one go
+
+        on Linux the kernel tells us how many datagrams it dropped because
+        the socket receive buffer was full along with the next datagram it
+        accepts, elsewhere dropped stays at 0
+
+        on Windows a datagram bigger than the buffer fills the buffer then
+        raises WSAEMSGSIZE, this is counted as truncated the same as on
+        other platforms rather than stopping the server
+
+    Args:
+        host(str): host interface ip to listen on
+        port(int): UDP port to listen on
+        buffersize(int): largest datagram we can receive in bytes
+        rcvbuf(int): size to ask for the socket receive buffer to be
+        maxdatagrams(int): most datagrams to read in one call to receive
+
+    Attributes:
+        sock(socket.socket): the UDP socket
+        buffer(bytearray): every datagram is received into this
+        received(int): number of datagrams received
+        truncated(int): number of datagrams bigger than buffersize,
+                        the end of them is lost
+        dropped(int): number of datagrams dropped by the kernel
+        undecodable(int): number of datagrams that were not UTF-8
+    """
+
+    def __init__(self, host='127.0.0.1', port=10110, buffersize=65535,
+                 rcvbuf=4194304, maxdatagrams=64):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        set_receive_buffer(self.sock, rcvbuf)
+        self.sock.bind((host, port))
+        self.buffer = bytearray(buffersize)
+        self.view = memoryview(self.buffer)
+        self.maxdatagrams = maxdatagrams
+        self.received = 0
+        self.truncated = 0
+        self.dropped = 0
+        self.undecodable = 0
+        self.ancbufsize = 0
+        if sys.platform.startswith('linux') and hasattr(
+                self.sock, 'recvmsg_into'):
+            try:
+                self.sock.setsockopt(
+                    socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self.ancbufsize = socket.CMSG_SPACE(4)
+            except OSError:
+                pass
+
+    def receive_one(self):
+        """
+        receive a datagram into the buffer
+
+        Returns:
+            nbytes(int): length of the datagram
+        """
+        if not self.ancbufsize:
+            try:
+                nbytes, _ = self.sock.recvfrom_into(self.view)
+            except OSError as err:
+                if WSAEMSGSIZE not in (err.errno,
+                                       getattr(err, 'winerror', None)):
+                    raise
+                self.truncated += 1
+                return len(self.buffer)
+            if nbytes == len(self.buffer):
+                self.truncated += 1
+            return nbytes
+        nbytes, ancdata, flags, _ = self.sock.recvmsg_into(
+            [self.view], self.ancbufsize)
+        if flags & socket.MSG_TRUNC:
+            self.truncated += 1
+        for level, cmsgtype, cmsgdata in ancdata:
+            if level == socket.SOL_SOCKET and cmsgtype == SO_RXQ_OVFL:
+                dropped = struct.unpack('=I', cmsgdata[:4])[0]
+                if dropped > self.dropped:
+                    AISLOGGER.warning(
+                        '%s datagrams dropped, socket receive buffer full',
+                        dropped - self.dropped)
+                    self.dropped = dropped
+        return nbytes
+
+    def receive(self, timeout=None):
+        """
+        wait for datagrams and decode them
+
+        Args:
+            timeout(float): seconds to wait for the first datagram,
+                            default is to wait forever
+
+        Returns:
+            datagrams(list): the datagrams as str, empty if the timeout
+                             ran out
+        """
+        datagrams = []
+        self.sock.settimeout(timeout)
+        try:
+            nbytes = self.receive_one()
+        except socket.timeout:
+            return datagrams
+        self.sock.settimeout(0.0)
+        while True:
+            self.received += 1
+            try:
+                datagrams.append(str(self.view[:nbytes], 'utf-8'))
+            except UnicodeDecodeError:
+                self.undecodable += 1
+            if len(datagrams) >= self.maxdatagrams:
+                break
+            try:
+                nbytes = self.receive_one()
+            except (BlockingIOError, socket.timeout):
+                break
+        return datagrams
+
+    def close(self):
+        """
+        close the socket
+        """
+        self.view.release()
+        self.sock.close()
+
+
+def set_receive_buffer(sock, rcvbuf):
+    """
+    ask for a bigger socket receive buffer so bursts of datagrams are not
+    dropped, the operating system may give us less than we ask for
+
+    Args:
+        sock(socket.socket): the socket
+        rcvbuf(int): size in bytes to ask for
+    """
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    except OSError as err:
+        AISLOGGER.warning('cannot set socket receive buffer - %s', err)
+    AISLOGGER.debug(
+        'socket receive buffer is %s bytes',
+        sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+
+
 def setup_logger(outputpath):
     """
-    setup the logger to save NMEA sentences to a file
+    setup the logger to save NMEA sentences to a file, nothing is done if
+    we are already saving to this file
 
     Args:
         outputpath(str): path to save to
     """
+    for handler in SENTENCELOGGER.handlers:
+        if getattr(handler, 'baseFilename', None) == os.path.abspath(
+                outputpath):
+            return
     logformatstr = '%(message)s'
     logformatter = logging.Formatter(fmt=logformatstr)
     rotatinghandler = logging.handlers.RotatingFileHandler(
@@ -43,7 +352,9 @@ def setup_logger(outputpath):
 
 
 def mpserver(dataqueue, host='127.0.0.1', port=10110,
-             remotehost=None, remoteport=None, logpath=None):
+             remotehost=None, remoteport=None, logpath=None,
+             batchsize=100, batchlatency=0.005, forwardto=None,
+             forwardbatch=False, rcvbuf=4194304):
     """
     listen for and put data onto the queue
     can also forward sentences to a remote server if specified
@@ -52,30 +363,481 @@ def mpserver(dataqueue, host='127.0.0.1', port=10110,
         This is designed to be run in another thread or process to the main
         program
 
+        sentences are put onto the queue in lists so the cost of each put
+        is shared between many sentences, a list is put onto the queue when
+        it has batchsize sentences in it or batchlatency seconds after its
+        first sentence arrived, whichever is sooner
+
+        each item put onto the queue is a tuple of the source name from
+        source_name and the list of sentences
+
     Args:
-        dataqueue(Queue): queue to put data recieved onto
+        dataqueue(Queue): queue to put lists of sentences recieved onto,
+                          or a ringbuffer.SentenceRingBuffer
         host(str): host interface ip to listen on
         port(int): UDP port to listen on
         remotehost(str): ip of server to forward NMEA sentences to
         remoteport(int): port of remote server
         logpath(str): full file path to save nmea logs to
+        batchsize(int): most sentences to put onto the queue at once,
+                        1 puts each sentence on as soon as it arrives
+        batchlatency(float): longest time in seconds to hold a sentence
+                             before putting it onto the queue
+        forwardto(list): more tuples of host and port to forward to
+        forwardbatch(bool): pack many forwarded sentences into each datagram
+        rcvbuf(int): size to ask for the socket receive buffer to be
     """
-    serversock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    serversock.bind((host, port))
+    forwarder = create_forwarder(remotehost, remoteport, forwardto,
+                                 forwardbatch)
+    receiver = UDPReceiver(host, port, rcvbuf=rcvbuf)
+    source = source_name('udp', host, port)
     AISLOGGER.info('listening on ip %s port %s', host, port)
     if logpath and logpath != '':
         setup_logger(logpath)
+    batch = []
+    batchstart = 0
     while True:
-        data, _ = serversock.recvfrom(1024)
+        timeout = None
+        if batch:
+            timeout = batchlatency - (time.monotonic() - batchstart)
+            if timeout <= 0:
+                dataqueue.put((source, batch))
+                batch = []
+                continue
+        truncated = receiver.truncated
+        for decodeddata in receiver.receive(timeout):
+            multi = nmea.NMEALINEREGEX.findall(decodeddata)
+            for part in multi:
+                if not batch:
+                    batchstart = time.monotonic()
+                batch.append(part)
+                if len(batch) >= batchsize:
+                    dataqueue.put((source, batch))
+                    batch = []
+                if logpath:
+                    SENTENCELOGGER.info(part)
+            if forwarder and multi:
+                forwarder.forward(multi)
+        if receiver.truncated > truncated:
+            AISLOGGER.warning(
+                '%s datagrams bigger than %s bytes have been truncated',
+                receiver.truncated, len(receiver.buffer))
+
+
+class NMEAServerProtocol(asyncio.DatagramProtocol):
+    """
+    asyncio protocol to receive NMEA sentences over UDP and pass them
+    straight to a function in the same process
+
+    Args:
+        sentencehandler(function): called with a list of all the NMEA
+                                   sentences in each datagram
+        forwarder(SentenceForwarder): forwards the sentences to remote
+                                      servers, None to not forward them
+        logpath(str): full file path to save nmea logs to
+
+    Attributes:
+        transport(asyncio.DatagramTransport): the transport we are
+                                              listening on
+    """
+
+    def __init__(self, sentencehandler, forwarder=None, logpath=None):
+        self.sentencehandler = sentencehandler
+        self.forwarder = forwarder
+        self.logpath = logpath
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        """
+        find the NMEA sentences in a datagram and hand them on together
+
+        Args:
+            data(bytes): the datagram
+            addr(tuple): address it came from
+        """
         try:
-            if data:
-                decodeddata = data.decode('utf-8')
-                multi = nmea.NMEASENTENCEREGEX.findall(decodeddata)
-                for part in multi:
-                    dataqueue.put(part)
-                    if logpath:
-                        SENTENCELOGGER.info(part)
-                    if remotehost and remoteport:
-                        network_send(data, remotehost, remoteport)
+            decodeddata = data.decode('utf-8')
         except UnicodeDecodeError:
+            return
+        sentences = nmea.NMEALINEREGEX.findall(decodeddata)
+        if not sentences:
+            return
+        if self.logpath:
+            for sentence in sentences:
+                SENTENCELOGGER.info(sentence)
+        if self.forwarder:
+            self.forwarder.forward(sentences)
+        try:
+            self.sentencehandler(sentences)
+        except Exception:
+            AISLOGGER.exception('error handling NMEA sentences')
+
+    def error_received(self, exc):
+        AISLOGGER.error('error receiving NMEA sentences - %s', exc)
+
+
+async def asyncserver(sentencehandler, host='127.0.0.1', port=10110,
+                      remotehost=None, remoteport=None, logpath=None,
+                      stopevent=None, forwardto=None, forwardbatch=False,
+                      rcvbuf=4194304):
+    """
+    listen for NMEA sentences with asyncio in this process until stopevent
+    is set, an alternative to mpserver that does not need a queue
+
+    Note:
+        sentencehandler is called in the event loop so it should not block
+        for long
+
+    Args:
+        sentencehandler(function): called with a list of all the NMEA
+                                   sentences in each datagram
+        host(str): host interface ip to listen on
+        port(int): UDP port to listen on
+        remotehost(str): ip of server to forward NMEA sentences to
+        remoteport(int): port of remote server
+        logpath(str): full file path to save nmea logs to
+        stopevent(asyncio.Event): set this to stop listening,
+                                  default is to listen forever
+        forwardto(list): more tuples of host and port to forward to
+        forwardbatch(bool): pack many forwarded sentences into each datagram
+        rcvbuf(int): size to ask for the socket receive buffer to be
+    """
+    if logpath and logpath != '':
+        setup_logger(logpath)
+    forwarder = create_forwarder(remotehost, remoteport, forwardto,
+                                 forwardbatch)
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: NMEAServerProtocol(
+            sentencehandler, forwarder=forwarder, logpath=logpath),
+        local_addr=(host, port))
+    set_receive_buffer(transport.get_extra_info('socket'), rcvbuf)
+    AISLOGGER.info('listening on ip %s port %s', host, port)
+    if stopevent is None:
+        stopevent = asyncio.Event()
+    try:
+        await stopevent.wait()
+    finally:
+        transport.close()
+        if forwarder:
+            forwarder.close()
+
+
+async def read_sentences(reader, sentencehandler, forwarder=None,
+                         logpath=None, readsize=65536):
+    """
+    read lines of NMEA sentences from a TCP stream until it is closed
+
+    Note:
+        the stream is read in large chunks rather than a line at a time,
+        all the sentences on the complete lines in each chunk are handed
+        on together, a partial line at the end is kept for the next chunk
+
+        an error from sentencehandler is logged and only loses that
+        chunk, the stream carries on being read
+
+    Args:
+        reader(asyncio.StreamReader): the stream to read from
+        sentencehandler(function): called with a list of NMEA sentences
+        forwarder(SentenceForwarder): forwards the sentences to remote
+                                      servers, None to not forward them
+        logpath(str): full file path to save nmea logs to
+        readsize(int): most bytes to read at once
+    """
+    remainder = ''
+    while True:
+        data = await reader.read(readsize)
+        if not data:
+            return
+        text = remainder + data.decode('utf-8', errors='replace')
+        lineend = text.rfind('\n')
+        if lineend == -1:
+            remainder = text[-readsize:]
+            continue
+        remainder = text[lineend + 1:]
+        sentences = nmea.NMEALINEREGEX.findall(text, 0, lineend)
+        if not sentences:
             continue
+        if logpath:
+            for sentence in sentences:
+                SENTENCELOGGER.info(sentence)
+        if forwarder:
+            forwarder.forward(sentences)
+        try:
+            sentencehandler(sentences)
+        except Exception:
+            AISLOGGER.exception('error handling NMEA sentences')
+
+
+async def run_until_stopped(coroutine, stopevent):
+    """
+    run a coroutine until it finishes or stopevent is set
+
+    Args:
+        coroutine(coroutine): the coroutine to run
+        stopevent(asyncio.Event): cancel the coroutine if this is set
+    """
+    task = asyncio.ensure_future(coroutine)
+    stoptask = asyncio.ensure_future(stopevent.wait())
+    try:
+        await asyncio.wait(
+            {task, stoptask}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        stoptask.cancel()
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+    if task.done() and not task.cancelled():
+        task.result()
+
+
+async def tcpclient(sentencehandler, host='127.0.0.1', port=10110,
+                    remotehost=None, remoteport=None, logpath=None,
+                    stopevent=None, forwardto=None, forwardbatch=False,
+                    reconnectmin=1, reconnectmax=60):
+    """
+    connect to a TCP server that sends NMEA sentences and keep reading
+    from it until stopevent is set, reconnecting if the connection is lost
+
+    Note:
+        the wait before trying to connect again doubles after each
+        failure up to reconnectmax, it goes back to reconnectmin once we
+        are connected
+
+    Args:
+        sentencehandler(function): called with a list of NMEA sentences
+        host(str): ip or hostname of the server sending sentences
+        port(int): TCP port of the server sending sentences
+        remotehost(str): ip of server to forward NMEA sentences to
+        remoteport(int): port of remote server
+        logpath(str): full file path to save nmea logs to
+        stopevent(asyncio.Event): set this to stop reading,
+                                  default is to read forever
+        forwardto(list): more tuples of host and port to forward to
+        forwardbatch(bool): pack many forwarded sentences into each datagram
+        reconnectmin(float): seconds to wait before reconnecting
+        reconnectmax(float): longest time in seconds to wait before
+                             reconnecting
+    """
+    if logpath and logpath != '':
+        setup_logger(logpath)
+    forwarder = create_forwarder(remotehost, remoteport, forwardto,
+                                 forwardbatch)
+    if stopevent is None:
+        stopevent = asyncio.Event()
+    delay = reconnectmin
+    try:
+        while not stopevent.is_set():
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+            except OSError as err:
+                AISLOGGER.warning('cannot connect to %s port %s - %s',
+                                  host, port, err)
+            else:
+                AISLOGGER.info('connected to %s port %s', host, port)
+                delay = reconnectmin
+                try:
+                    await run_until_stopped(read_sentences(
+                        reader, sentencehandler, forwarder=forwarder,
+                        logpath=logpath), stopevent)
+                except OSError as err:
+                    AISLOGGER.warning('error reading from %s port %s - %s',
+                                      host, port, err)
+                finally:
+                    writer.close()
+                if stopevent.is_set():
+                    break
+                AISLOGGER.warning('disconnected from %s port %s',
+                                  host, port)
+            AISLOGGER.info('reconnecting in %s seconds', delay)
+            try:
+                await asyncio.wait_for(stopevent.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, reconnectmax)
+    finally:
+        if forwarder:
+            forwarder.close()
+
+
+async def tcpserver(sentencehandler, host='127.0.0.1', port=10110,
+                    remotehost=None, remoteport=None, logpath=None,
+                    stopevent=None, forwardto=None, forwardbatch=False):
+    """
+    listen for TCP connections from any number of feeders sending NMEA
+    sentences until stopevent is set
+
+    Args:
+        sentencehandler(function): called with a list of NMEA sentences
+        host(str): host interface ip to listen on
+        port(int): TCP port to listen on
+        remotehost(str): ip of server to forward NMEA sentences to
+        remoteport(int): port of remote server
+        logpath(str): full file path to save nmea logs to
+        stopevent(asyncio.Event): set this to stop listening,
+                                  default is to listen forever
+        forwardto(list): more tuples of host and port to forward to
+        forwardbatch(bool): pack many forwarded sentences into each datagram
+    """
+    if logpath and logpath != '':
+        setup_logger(logpath)
+    forwarder = create_forwarder(remotehost, remoteport, forwardto,
+                                 forwardbatch)
+    if stopevent is None:
+        stopevent = asyncio.Event()
+    feeders = set()
+
+    async def read_feeder(reader, writer):
+        peer = writer.get_extra_info('peername')
+        AISLOGGER.info('feeder connected from %s', peer)
+        feeders.add(writer)
+        try:
+            await read_sentences(reader, sentencehandler,
+                                 forwarder=forwarder, logpath=logpath)
+        except OSError as err:
+            AISLOGGER.warning('error reading from %s - %s', peer, err)
+        finally:
+            feeders.discard(writer)
+            writer.close()
+        AISLOGGER.info('feeder disconnected from %s', peer)
+
+    server = await asyncio.start_server(read_feeder, host, port)
+    AISLOGGER.info('listening for TCP connections on ip %s port %s',
+                   host, port)
+    try:
+        await stopevent.wait()
+    finally:
+        server.close()
+        for writer in list(feeders):
+            writer.close()
+        await server.wait_closed()
+        if forwarder:
+            forwarder.close()
+
+
+def queue_handler(dataqueue, source):
+    """
+    make a sentence handler that puts sentences onto a queue
+
+    Args:
+        dataqueue(Queue): queue to put lists of sentences recieved onto,
+                          or a ringbuffer.SentenceRingBuffer
+        source(str): name of the source to put on with the sentences
+
+    Returns:
+        sentencehandler(function): puts a tuple of the source and a list
+                                   of sentences onto the queue
+    """
+    def put_sentences(sentences):
+        dataqueue.put((source, sentences))
+    return put_sentences
+
+
+def mptcpclient(dataqueue, host='127.0.0.1', port=10110, **kwargs):
+    """
+    connect to a TCP server and put lists of the sentences read onto the
+    queue, designed to be run in another process like mpserver
+
+    Args:
+        dataqueue(Queue): queue to put lists of sentences recieved onto,
+                          or a ringbuffer.SentenceRingBuffer
+        host(str): ip or hostname of the server sending sentences
+        port(int): TCP port of the server sending sentences
+        kwargs(dict): passed on to tcpclient
+    """
+    asyncio.run(tcpclient(
+        queue_handler(dataqueue, source_name('tcpclient', host, port)),
+        host=host, port=port, **kwargs))
+
+
+def mptcpserver(dataqueue, host='127.0.0.1', port=10110, **kwargs):
+    """
+    listen for TCP feeders and put lists of the sentences read onto the
+    queue, designed to be run in another process like mpserver
+
+    Args:
+        dataqueue(Queue): queue to put lists of sentences recieved onto,
+                          or a ringbuffer.SentenceRingBuffer
+        host(str): host interface ip to listen on
+        port(int): TCP port to listen on
+        kwargs(dict): passed on to tcpserver
+    """
+    asyncio.run(tcpserver(
+        queue_handler(dataqueue, source_name('tcpserver', host, port)),
+        host=host, port=port, **kwargs))
+
+
+async def multiserver(sentencehandler, sources, stopevent=None,
+                      rcvbuf=4194304, **kwargs):
+    """
+    get NMEA sentences from several sources at once in one event loop
+
+    Note:
+        if one source fails the error is logged and the other sources
+        carry on
+
+    Args:
+        sentencehandler(function): called with a list of NMEA sentences
+                                   and the name of their source as source
+        sources(list): tuples of servertype, host and port, servertype is
+                       'udp', 'tcpserver' or 'tcpclient'
+        stopevent(asyncio.Event): set this to stop all the sources,
+                                  default is to run forever
+        rcvbuf(int): size to ask for the socket receive buffer of each UDP
+                     source to be
+        kwargs(dict): passed on to the server for each source
+    """
+    if stopevent is None:
+        stopevent = asyncio.Event()
+
+    async def supervise(server, name):
+        try:
+            await server
+        except Exception:
+            AISLOGGER.exception('%s stopped', name)
+
+    servers = []
+    for servertype, host, port in sources:
+        name = source_name(servertype, host, port)
+        serverkwargs = dict(kwargs)
+        if servertype == 'udp':
+            serverkwargs['rcvbuf'] = rcvbuf
+        servers.append(supervise(ASYNCSERVERS[servertype](
+            functools.partial(sentencehandler, source=name),
+            host=host, port=port, stopevent=stopevent, **serverkwargs),
+            name))
+    await asyncio.gather(*servers)
+
+
+def mpmultiserver(dataqueue, sources, **kwargs):
+    """
+    get NMEA sentences from several sources and put lists of them onto the
+    queue with the name of their source, designed to be run in another
+    process like mpserver
+
+    Args:
+        dataqueue(Queue): queue to put lists of sentences recieved onto,
+                          or a ringbuffer.SentenceRingBuffer
+        sources(list): tuples of servertype, host and port
+        kwargs(dict): passed on to the server for each source
+    """
+    def put_sentences(sentences, source):
+        dataqueue.put((source, sentences))
+    asyncio.run(multiserver(put_sentences, sources, **kwargs))
+
+
+MPSERVERS = {
+    'udp': mpserver,
+    'tcpserver': mptcpserver,
+    'tcpclient': mptcpclient}
+
+ASYNCSERVERS = {
+    'udp': asyncserver,
+    'tcpserver': tcpserver,
+    'tcpclient': tcpclient}
@@ -4,12 +4,24 @@ module to parse nmea 0183 sentences
 
 
 import collections
+import datetime
 import re
+import time
 
 
 NMEASENTENCEREGEX = re.compile(
     r'!AIVD[MO],\d,\d,\d?,[AB12],[A-Za-z0-9`:;<=>?@]{1,56},'
     r'[0-5][*][0-9A-F]{2}')
+NMEALINEREGEX = re.compile(
+    r'(?:\\[^\\!]*\\)?' + NMEASENTENCEREGEX.pattern)
+TAGBLOCKFIELDS = {
+    'c': 'time',
+    'd': 'destination',
+    'g': 'group',
+    'n': 'linecount',
+    'r': 'relativetime',
+    's': 'source',
+    't': 'text'}
 
 
 def calculate_nmea_checksum(sentence, start='!', seperator=','):
@@ -39,6 +51,72 @@ def calculate_nmea_checksum(sentence, start='!', seperator=','):
     return bool(csum == chksum)
 
 
+def parse_tag_block(tagblock):
+    """
+    read an NMEA 4.x tag block
+
+    Note:
+        c, n and r are converted to integers, g to a tuple of the sentence
+        number, total sentences and group id, unknown fields are kept
+        under their own letter
+
+    Args:
+        tagblock(str): the tag block without the backslashes either side
+                       e.g. s:rcv1,c:1690000000*hh
+
+    Raises:
+        NMEAInvalidSentence: if the tag block cannot be understood
+        NMEACheckSumFailed: if the tag block checksum does not match
+
+    Returns:
+        tags(dict): keys are names from TAGBLOCKFIELDS
+    """
+    fields, _, checksum = tagblock.partition('*')
+    chksum = 0
+    for char in fields:
+        chksum ^= ord(char)
+    try:
+        if chksum != int(checksum, 16):
+            raise NMEACheckSumFailed(
+                'tag block checksum does not match ' + checksum)
+        tags = {}
+        for field in fields.split(','):
+            code, _, value = field.partition(':')
+            if code in ('c', 'n', 'r'):
+                value = int(value)
+            elif code == 'g':
+                value = tuple(int(part) for part in value.split('-'))
+            tags[TAGBLOCKFIELDS.get(code, code)] = value
+    except ValueError:
+        raise NMEAInvalidSentence('invalid tag block - ' + tagblock)
+    return tags
+
+
+def tag_block_timestamp(tags):
+    """
+    get the time a receiver put in a tag block in the same format as other
+    message times
+
+    Note:
+        c is seconds since the epoch, some receivers send milliseconds
+
+    Args:
+        tags(dict): tag block from parse_tag_block, can be None
+
+    Returns:
+        timestamp(str): UTC time as %Y/%m/%d %H:%M:%S, None if there is
+                        no time in the tag block
+    """
+    try:
+        unixtime = tags['time']
+    except (KeyError, TypeError):
+        return None
+    if unixtime > 100000000000:
+        unixtime /= 1000
+    return datetime.datetime.fromtimestamp(
+        unixtime, datetime.timezone.utc).strftime('%Y/%m/%d %H:%M:%S')
+
+
 class NMEAInvalidSentence(Exception):
     """
     raise when the nmea sentence isn't valid
@@ -107,18 +185,65 @@ class NMEA0183Sentence():
                                  self.checksum)
 
 
+class SourceStats():
+    """
+    count the sentences and errors from one source of NMEA sentences
+
+    Attributes:
+        sentences(int): number of sentences received
+        errors(int): number of sentences that were invalid or failed the
+                     checksum
+        firstseen(float): time.time() the first sentence was received
+        lastseen(float): time.time() the latest sentence was received
+    """
+
+    def __init__(self):
+        self.sentences = 0
+        self.errors = 0
+        self.firstseen = time.time()
+        self.lastseen = self.firstseen
+
+    def stats(self):
+        """
+        work out the rates for this source
+
+        Returns:
+            stats(dict): sentence and error counts, sentences per second
+                         and the percentage of sentences with errors
+        """
+        duration = self.lastseen - self.firstseen
+        stats = {}
+        stats['Sentences'] = self.sentences
+        stats['Errors'] = self.errors
+        if duration > 0:
+            stats['Sentences per Second'] = round(
+                self.sentences / duration, 2)
+        else:
+            stats['Sentences per Second'] = 'N/A'
+        stats['Error Rate %'] = round(
+            100 * self.errors / self.sentences, 2)
+        return stats
+
+
 class NMEAtracker():
     """
     class to process NMEA sentences and track multipart sentences
 
     Attributes:
         multiparts(dict): dictionary to track ais messages spread over multiple
-                          sentences
+                          sentences, keys are tuples of the source and the
+                          message sequence id so fragments from different
+                          sources are never joined together
         sentencecount(int): the number of sentences that have been processed
         reassembled(int): the number of multipart messages that have been
                           assembled
         channelcounter(collections.Counter): count sentences recieved on each
                                              channel
+        sources(dict): keys are the names of where sentences came from,
+                       values are SourceStats
+        multiparttags(dict): tag blocks of the sentences in multiparts
+        lasttagblock(dict): tag block for the payload last returned by
+                            process_sentence, None if it had no tag block
     """
 
     def __init__(self):
@@ -126,6 +251,9 @@ class NMEAtracker():
         self.sentencecount = 0
         self.reassembled = 0
         self.channelcounter = collections.Counter()
+        self.sources = {}
+        self.multiparttags = {}
+        self.lasttagblock = None
 
     def __str__(self):
         strtext = ('NMEA 0183 sentence Tracker - {} sentences processed,'
@@ -151,9 +279,38 @@ class NMEAtracker():
         stats['Total Sentences Processed'] = self.sentencecount
         stats['Multipart Messages Reassembled'] = self.reassembled
         stats['Messages Recieved on Channel'] = dict(self.channelcounter)
+        if self.sources:
+            stats['Sources'] = {
+                source: sourcestats.stats()
+                for source, sourcestats in self.sources.items()}
         return stats
 
-    def process_sentence(self, sentence):
+    @staticmethod
+    def parse_line(line):
+        """
+        split a line into its tag block and NMEA 0183 sentence
+
+        Args:
+            line(str): the nmea sentence with or without a tag block
+
+        Raises:
+            NMEAInvalidSentence: if the sentence or tag block is not valid
+            NMEACheckSumFailed: if either checksum does not match
+
+        Returns:
+            newsen(NMEA0183Sentence): the sentence
+            tags(dict): the tag block, None if there is no tag block
+        """
+        tags = None
+        if line.startswith('\\'):
+            tagend = line.find('\\', 1)
+            if tagend == -1:
+                raise NMEAInvalidSentence('unterminated tag block - ' + line)
+            tags = parse_tag_block(line[1:tagend])
+            line = line[tagend + 1:]
+        return NMEA0183Sentence(line), tags
+
+    def process_sentence(self, sentence, source=None):
         """
         takes a nmea sentence creates a NMEA0183Sentence object
         determines if it is part of a multipart message, if a single message
@@ -161,35 +318,65 @@ class NMEAtracker():
         part of a larger message then it is stored in the multiparts dict until
         all parts are recieved.
 
+        Note:
+            the sentence can start with an NMEA 4.x tag block, the tag block
+            for the payload returned is in lasttagblock, for multipart
+            messages it is made from the tag blocks of all the parts
+
         Args:
             sentence(str): the nmea sentence as a string
+            source(str): where the sentence came from, sentences and errors
+                         are counted for each source
 
         Returns:
             newsen.data(str): the data payload of the sentence as a string
                               this is returned if its a 1 part message
             completemessage(str): the data payload of several sentences joined
                                   together as a string
-            multiparts[newsen.msgsequenceid][1](str): returned if failed to
-                                                      reassemble a multipart
-                                                      message
+            multiparts[msgkey][1](str): returned if failed to reassemble a
+                                        multipart message
             None: returned if no sentence data to process
         """
-        newsen = NMEA0183Sentence(sentence)
+        self.lasttagblock = None
+        if source is None:
+            newsen, tags = self.parse_line(sentence)
+        else:
+            try:
+                sourcestats = self.sources[source]
+            except KeyError:
+                sourcestats = self.sources[source] = SourceStats()
+            sourcestats.sentences += 1
+            sourcestats.lastseen = time.time()
+            try:
+                newsen, tags = self.parse_line(sentence)
+            except (NMEAInvalidSentence, NMEACheckSumFailed):
+                sourcestats.errors += 1
+                raise
         self.channelcounter[newsen.channel] += 1
         self.sentencecount += 1
         if newsen.fragmentno == 1 and newsen.fragmentcount == 1:
+            self.lasttagblock = tags
             return newsen.data
-        self.multiparts[newsen.msgsequenceid][newsen.fragmentno] = newsen.data
-        msglength = len(self.multiparts[newsen.msgsequenceid].keys())
+        msgkey = (source, newsen.msgsequenceid)
+        if newsen.fragmentno == 1:
+            self.multiparttags.pop(msgkey, None)
+        self.multiparts[msgkey][newsen.fragmentno] = newsen.data
+        if tags:
+            msgtags = self.multiparttags.setdefault(msgkey, {})
+            for tag, value in tags.items():
+                msgtags.setdefault(tag, value)
+        msglength = len(self.multiparts[msgkey].keys())
         if msglength == newsen.fragmentcount:
             msg = []
             for i in range(1, msglength + 1):
                 try:
-                    msg.append(self.multiparts[newsen.msgsequenceid][i])
+                    msg.append(self.multiparts[msgkey][i])
                 except KeyError:
                     print('missing part of message, returning 1st part')
-                    return self.multiparts[newsen.msgsequenceid][1]
+                    self.lasttagblock = self.multiparttags.pop(msgkey, None)
+                    return self.multiparts.pop(msgkey)[1]
             completemessage = ''.join(msg)
             self.reassembled += 1
-            del self.multiparts[newsen.msgsequenceid]
+            del self.multiparts[msgkey]
+            self.lasttagblock = self.multiparttags.pop(msgkey, None)
             return completemessage
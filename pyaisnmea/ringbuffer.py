@@ -0,0 +1,298 @@
+"""
+pass NMEA sentences between processes through a ring buffer in shared memory
+
+there must only be one process putting sentences in and one process getting
+them out, neither side takes a lock, each side only ever writes its own
+position in the buffer
+"""
+
+import logging
+import multiprocessing.resource_tracker
+import multiprocessing.shared_memory
+import queue
+import struct
+import time
+
+
+AISLOGGER = logging.getLogger(__name__)
+
+COUNTER = struct.Struct('<Q')
+LENGTH = struct.Struct('<H')
+HEADOFFSET = 0
+TAILOFFSET = 64
+WRITTENOFFSET = 128
+DROPPEDOFFSET = 136
+HEADERSIZE = 192
+SOURCEFLAG = 0x8000
+
+
+class SentenceRingBuffer():
+    """
+    single producer single consumer ring buffer of NMEA sentences in
+    shared memory
+
+    Note:
+        has the same put and get methods as the multiprocessing.Queue
+        used by network.mpserver, put takes and get returns a tuple of the
+        source name and a list of sentences but nothing is pickled, each
+        sentence is copied into the buffer as bytes with a 2 byte length in
+        front of it, when the source changes a record with the new source
+        name is written first, its length has the top bit set
+
+        the head and tail are counts of all the bytes ever written and
+        read, the producer only writes the head and the consumer only
+        writes the tail, they are on different cache lines
+
+        if there is not enough room for a sentence it is dropped and the
+        dropped counter goes up by 1
+
+        the buffer can be passed to another process as an argument, the
+        other process attaches to the same shared memory
+
+    Args:
+        capacity(int): size of the buffer in bytes
+        name(str): name of existing shared memory to attach to,
+                   default is to create new shared memory
+
+    Attributes:
+        sharedmem(multiprocessing.shared_memory.SharedMemory):
+            the shared memory holding the header and the buffer
+        owner(bool): True if this object created the shared memory
+            and should unlink it
+        putsource(str): source of the last sentences put in, only used by
+            the producer
+        getsource(str): source of the last sentences got out, only used by
+            the consumer
+    """
+
+    def __init__(self, capacity=1048576, name=None):
+        self.capacity = capacity
+        if name is None:
+            self.sharedmem = multiprocessing.shared_memory.SharedMemory(
+                create=True, size=HEADERSIZE + capacity)
+            self.sharedmem.buf[:HEADERSIZE] = bytes(HEADERSIZE)
+            self.owner = True
+        else:
+            self.sharedmem = self.attach(name)
+            self.owner = False
+        self.buf = self.sharedmem.buf
+        self.putsource = None
+        self.getsource = None
+
+    @staticmethod
+    def attach(name):
+        """
+        attach to existing shared memory without registering it with the
+        resource tracker, so it is not unlinked when this process exits
+
+        Args:
+            name(str): name of the shared memory
+
+        Returns:
+            sharedmem(multiprocessing.shared_memory.SharedMemory):
+                the shared memory
+        """
+        try:
+            return multiprocessing.shared_memory.SharedMemory(
+                name=name, track=False)
+        except TypeError:
+            sharedmem = multiprocessing.shared_memory.SharedMemory(name=name)
+            multiprocessing.resource_tracker.unregister(
+                sharedmem._name, 'shared_memory')
+            return sharedmem
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'name': self.sharedmem.name}
+
+    def __setstate__(self, state):
+        self.__init__(capacity=state['capacity'], name=state['name'])
+
+    def read_counter(self, offset):
+        """
+        read one of the counters in the header
+
+        Args:
+            offset(int): where the counter is in the header
+
+        Returns:
+            value(int): the counter
+        """
+        return COUNTER.unpack_from(self.buf, offset)[0]
+
+    def write_counter(self, offset, value):
+        """
+        write one of the counters in the header
+
+        Args:
+            offset(int): where the counter is in the header
+            value(int): the new value
+        """
+        COUNTER.pack_into(self.buf, offset, value)
+
+    @property
+    def written(self):
+        """
+        number of sentences put into the buffer
+        """
+        return self.read_counter(WRITTENOFFSET)
+
+    @property
+    def dropped(self):
+        """
+        number of sentences dropped because the buffer was full
+        """
+        return self.read_counter(DROPPEDOFFSET)
+
+    def write_bytes(self, position, data):
+        """
+        copy bytes into the buffer, wrapping round at the end
+
+        Args:
+            position(int): head position to write at
+            data(bytes): bytes to write
+        """
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.buf[HEADERSIZE + start:HEADERSIZE + start + first] = \
+            data[:first]
+        if first < len(data):
+            self.buf[HEADERSIZE:HEADERSIZE + len(data) - first] = \
+                data[first:]
+
+    def read_bytes(self, position, length):
+        """
+        copy bytes out of the buffer, wrapping round at the end
+
+        Args:
+            position(int): tail position to read from
+            length(int): number of bytes to read
+
+        Returns:
+            data(bytes): the bytes read
+        """
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        data = bytes(self.buf[HEADERSIZE + start:HEADERSIZE + start + first])
+        if first < length:
+            data += bytes(self.buf[HEADERSIZE:HEADERSIZE + length - first])
+        return data
+
+    def put(self, item):
+        """
+        put sentences into the buffer, only call from the producer
+
+        Note:
+            the head is only moved on once all the sentences are in
+
+        Args:
+            item(tuple): the source name and a list of NMEA sentences as
+                         str or ASCII encoded bytes
+        """
+        source, sentences = item
+        head = self.read_counter(HEADOFFSET)
+        tail = self.read_counter(TAILOFFSET)
+        written = 0
+        dropped = 0
+        for sentence in sentences:
+            if isinstance(sentence, str):
+                sentence = sentence.encode('ascii')
+            record = LENGTH.pack(len(sentence)) + sentence
+            if source != self.putsource:
+                sourcename = (source or '').encode('utf-8')
+                record = LENGTH.pack(
+                    SOURCEFLAG | len(sourcename)) + sourcename + record
+            if head + len(record) - tail > self.capacity:
+                tail = self.read_counter(TAILOFFSET)
+                if head + len(record) - tail > self.capacity:
+                    dropped += 1
+                    continue
+            self.write_bytes(head, record)
+            head += len(record)
+            written += 1
+            self.putsource = source
+        self.write_counter(HEADOFFSET, head)
+        if written:
+            self.write_counter(WRITTENOFFSET, self.written + written)
+        if dropped:
+            self.write_counter(DROPPEDOFFSET, self.dropped + dropped)
+            AISLOGGER.warning(
+                'ring buffer full, %s sentences dropped', dropped)
+
+    def get_nowait(self):
+        """
+        get all the sentences in the buffer from the same source, only call
+        from the consumer
+
+        Raises:
+            queue.Empty: if the buffer is empty
+
+        Returns:
+            item(tuple): the source name and a list of NMEA sentences as str
+        """
+        head = self.read_counter(HEADOFFSET)
+        tail = self.read_counter(TAILOFFSET)
+        if head == tail:
+            raise queue.Empty
+        sentences = []
+        while tail < head:
+            length = LENGTH.unpack(self.read_bytes(tail, LENGTH.size))[0]
+            if length & SOURCEFLAG:
+                if sentences:
+                    break
+                length &= ~SOURCEFLAG
+                self.getsource = self.read_bytes(
+                    tail + LENGTH.size, length).decode('utf-8') or None
+                tail += LENGTH.size + length
+                continue
+            tail += LENGTH.size
+            sentences.append(self.read_bytes(tail, length).decode('ascii'))
+            tail += length
+        self.write_counter(TAILOFFSET, tail)
+        return (self.getsource, sentences)
+
+    def get(self, timeout=None):
+        """
+        wait for sentences and get all of them from the same source, only
+        call from the consumer
+
+        Note:
+            the buffer is polled, waiting longer between each poll up to
+            10 milliseconds whilst it stays empty
+
+        Args:
+            timeout(float): seconds to wait, default is to wait forever
+
+        Raises:
+            queue.Empty: if there are no sentences before the timeout
+
+        Returns:
+            item(tuple): the source name and a list of NMEA sentences as str
+        """
+        if timeout is not None:
+            endtime = time.monotonic() + timeout
+        pollinterval = 0.0001
+        while True:
+            try:
+                return self.get_nowait()
+            except queue.Empty:
+                if timeout is not None and time.monotonic() >= endtime:
+                    raise
+            time.sleep(pollinterval)
+            pollinterval = min(pollinterval * 2, 0.01)
+
+    def close(self):
+        """
+        unlink the shared memory if we created it and detach from it
+
+        Note:
+            the shared memory is unlinked first so it is not left behind
+            if detaching fails because another thread is still reading it
+
+        Raises:
+            BufferError: if another thread is still reading the buffer
+        """
+        if self.owner:
+            self.sharedmem.unlink()
+            self.owner = False
+        self.buf.release()
+        self.sharedmem.close()
@@ -8,20 +8,37 @@ Unit tests for the AIS Decoder
 # pylint: disable=invalid-name
 
 
+import asyncio
 import copy
 import datetime
+import json
+import multiprocessing
 import os
+import queue
+import socket
+import sys
+import tempfile
+import time
 import unittest
+import urllib.error
+import urllib.request
 import xml.etree.ElementTree
+import zipfile
 
 import pyaisnmea.ais as ais
+import pyaisnmea.allmessages as allmessages
+import pyaisnmea.bench as bench
 import pyaisnmea.binary as binary
 import pyaisnmea.capturefile as capturefile
 import pyaisnmea.export as export
 import pyaisnmea.geojson as geojson
 import pyaisnmea.icons as icons
 import pyaisnmea.kml as kml
+import pyaisnmea.livegeojson as livegeojson
+import pyaisnmea.livekmlmap as livekmlmap
+import pyaisnmea.network as network
 import pyaisnmea.nmea as nmea
+import pyaisnmea.ringbuffer as ringbuffer
 import pyaisnmea.messages.t123 as t123
 import pyaisnmea.messages.t4 as t4
 import pyaisnmea.messages.t5 as t5
@@ -249,6 +266,31 @@ class NMEATests(unittest.TestCase):
                 binarypayload = binary.ais_sentence_payload_binary(processed)
         self.assertEqual(expected, binarypayload)
 
+    def test_multipart_from_two_sources(self):
+        """
+        multipart messages with the same sequence id from different sources
+        are not joined together
+        """
+        testsentences = [
+            ('rx1', '!AIVDM,2,1,5,A,53P6>F42;si4mPhOJ208Dr0mV0<Q8DF22222'
+                    '220t41H;==8cN<R1FDj0,0*39'),
+            ('rx2', '!AIVDM,2,1,5,B,537QR042Ci8kD9PsB20HT'
+                    '@DhTv2222222222221I:0H?24pW0ChPDTQB,0*4E'),
+            ('rx1', '!AIVDM,2,2,5,A,CH8888888888880,2*2A'),
+            ('rx2', '!AIVDM,2,2,5,B,DSp888888888880,2*7D')]
+        testtracker = nmea.NMEAtracker()
+        payloads = []
+        for source, sentence in testsentences:
+            payload = testtracker.process_sentence(sentence, source=source)
+            if payload:
+                payloads.append(payload)
+        self.assertEqual(payloads, [
+            ('53P6>F42;si4mPhOJ208Dr0mV0<Q8DF22222220t41H;==8cN<R1FDj0'
+             'CH8888888888880'),
+            ('537QR042Ci8kD9PsB20HT@DhTv2222222222221I:0H?24pW0ChPDTQB'
+             'DSp888888888880')])
+        self.assertEqual(testtracker.reassembled, 2)
+
 
 class AISStationTests(unittest.TestCase):
     """
@@ -604,6 +646,43 @@ class AISTrackerTests(unittest.TestCase):
         self.assertIsInstance(
             msg, t27.Type27LongRangeAISPositionReport)
 
+    def test_cached_fragments_updated(self):
+        """
+        cached station output should be reused until the station sends
+        another message
+        """
+        self.process_sentence('13P;Ruhvj1wj=0bNTU;up;=T80Rd')
+        stn = self.aistracker.stations['235070199']
+        firsttable = self.aistracker.create_nav_table()
+        self.assertIs(self.aistracker.create_nav_table()[0], firsttable[0])
+        self.assertIs(self.aistracker.all_station_info()['235070199'],
+                      self.aistracker.all_station_info()['235070199'])
+        version = stn.version
+        self.process_sentence('13P;RuhvjIwj7blNUOPtIr1n8000')
+        self.assertGreater(stn.version, version)
+        secondtable = self.aistracker.create_nav_table()
+        self.assertNotEqual(firsttable, secondtable)
+        self.assertEqual(secondtable[0], stn.create_nav_table_line())
+
+
+    def test_cached_fragments_positions(self):
+        """
+        a cached fragment should not be used by a copy of the station with
+        a different number of positions
+        """
+        self.process_sentence('13P;Ruhvj1wj=0bNTU;up;=T80Rd')
+        self.process_sentence('13P;RuhvjIwj7blNUOPtIr1n8000')
+        stn = self.aistracker.stations['235070199']
+        coords = stn.get_fragment('coords', lambda: list(stn.posrep))
+        truncated = copy.copy(stn)
+        truncated.posrep = stn.posrep[-1:]
+        self.assertEqual(
+            len(truncated.get_fragment(
+                'coords', lambda: list(truncated.posrep))), 1)
+        self.assertIsNot(
+            stn.get_fragment('coords', lambda: list(stn.posrep)), coords)
+        self.assertEqual(
+            len(stn.get_fragment('coords', lambda: list(stn.posrep))), 2)
 
 class AISTrackerandStationTests(unittest.TestCase):
     """
@@ -778,6 +857,21 @@ class AISTrackerTimingTests(unittest.TestCase):
                 data, timestamp=currenttime)
         self.assertEqual(times, self.aistracker.timings)
 
+    def test_live_times_seen_before(self):
+        """
+        a timestamp already recorded is not recorded again even if other
+        timestamps came in between
+        """
+        payloads = [
+            '13P6>F002bwhDQ:NbBIdAqmeH5pl',
+            'E>jHC=c6:W2h22R`@1:WdP00000Opa@a?KTP010888e?N0',
+            '13P;Ruhvh0wjA=NNSjD:C500880L']
+        times = ['2023/07/22 04:26:40', '2023/07/22 04:26:41',
+                 '2023/07/22 04:26:40']
+        for data, currenttime in zip(payloads, times):
+            self.aistracker.process_message(data, timestamp=currenttime)
+        self.assertEqual(self.aistracker.timings, times[:2])
+
     def test_str_no_times_no_ships(self):
         """
         get the str for the AIS object on an empty tracker
@@ -1292,6 +1386,1429 @@ TYPE 21 - AID TO NAVIGATION REPORT - 15<br  />
         expected = '&quot;&lt;hello world&gt;&quot; &amp;    test'
         self.assertEqual(clean, expected)
 
+    def test_stream_writer(self):
+        """
+        the stream writer should write the same KML as the parser keeps in
+        memory, both as a plain KML file and inside a KMZ
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            kmlpath = os.path.join(tempdir, 'test.kml')
+            kmzpath = os.path.join(tempdir, 'test.kmz')
+            kmlwriter = kml.KMLStreamWriter(kmlpath)
+            kmzwriter = kml.KMLStreamWriter(kmzpath, kmz=True)
+            for parser in (self.parser, kmlwriter, kmzwriter):
+                parser.create_kml_header(kmz=False)
+                parser.open_folder('Blackpool')
+                parser.add_kml_placemark(
+                    'Blackpool Tower', '', '-3.055468', '53.815964', '',
+                    kmz=False)
+                parser.close_folder()
+                parser.close_kml_file()
+            kmlwriter.write_kml_doc_file()
+            kmzwriter.add_kmz_icons(
+                iconslist=[], greenarrows=[], orangearrows=[])
+            expected = ''.join(self.parser.kmldoc)
+            with open(kmlpath, encoding='utf-8') as kmlfile:
+                self.assertEqual(kmlfile.read(), expected)
+            with zipfile.ZipFile(kmzpath) as kmzfile:
+                self.assertEqual(
+                    kmzfile.read('doc.kml').decode('utf-8'), expected)
+
+
+    def test_header_only_used_styles(self):
+        """
+        only the icon and arrow styles asked for should be in the header
+        """
+        self.parser.create_kml_header(
+            iconsused={'Class A', 'Tug'}, headings=[90], cogs=[45, 90])
+        header = ''.join(self.parser.kmldoc)
+        xml.etree.ElementTree.fromstring(header + '</Document></kml>')
+        self.assertEqual(header.count('<Style id='), 5)
+        for styleid in ('Class A', 'Tug', '90TH', '45CoG', '90CoG'):
+            self.assertIn('<Style id="{}">'.format(styleid), header)
+        self.assertNotIn('<Style id="0TH">', header)
+
+    def test_stream_writer_error(self):
+        """
+        if an error is raised whilst a KMZ is written the file should be
+        closed and deleted
+        """
+        stn = ais.AISStation('002320717')
+        stn.stnclass = 'Base Station'
+        with tempfile.TemporaryDirectory() as tempdir:
+            kmzpath = os.path.join(tempdir, 'map.kmz')
+            with self.assertRaises(ais.NoSuitablePositionReport):
+                stn.create_kml_map(kmzpath, kmzoutput=True)
+            self.assertFalse(os.path.exists(kmzpath))
+
+    def test_cached_icons(self):
+        """
+        icons copied from the cache should be the same as the files on disk
+        and readable once extracted, and the KMZ should still be a valid
+        zip file
+        """
+        iconspath = os.path.join(
+            os.path.dirname(os.path.realpath(kml.__file__)), 'static')
+        with tempfile.TemporaryDirectory() as tempdir:
+            kmzpath = os.path.join(tempdir, 'test.kmz')
+            for _ in range(2):
+                with zipfile.ZipFile(
+                        kmzpath, 'w', zipfile.ZIP_DEFLATED) as kmz:
+                    kmz.writestr('doc.kml', 'test')
+                    kml.add_icons_to_kmz(
+                        kmz, ['tug.png'], greenarrows=[90], orangearrows=[0])
+            with zipfile.ZipFile(kmzpath) as kmz:
+                self.assertIsNone(kmz.testzip())
+                for member in ('icons/tug.png', 'green_arrows/90.png',
+                               'orange_arrows/0.png'):
+                    with open(os.path.join(iconspath, member), 'rb') as icon:
+                        self.assertEqual(kmz.read(member), icon.read())
+                    self.assertEqual(kmz.getinfo(member).compress_type,
+                                     zipfile.ZIP_STORED)
+                    self.assertEqual(kmz.getinfo(member).external_attr,
+                                     0o644 << 16)
+                self.assertEqual(kmz.read('doc.kml'), b'test')
+
+
+class CompactAISMessageLogTests(unittest.TestCase):
+    """
+    test the compact message log gives the same output as the normal one
+    """
+
+    def setUp(self):
+        self.aistracker = ais.AISTracker()
+        self.messagelog = allmessages.AISMessageLog()
+        self.compactlog = allmessages.CompactAISMessageLog(cachesize=2)
+        payloads = [
+            '13P;Ruhvj1wj=0bNTU;up;=T80Rd',
+            ('53P;Rul2<10S89PgN20l4p4pp4r222222222220'
+             '`8@N==57nN9A3mAk0Dp8888888888880'),
+            '402=a`1v:Df0TOi>SHNu0wA020S:',
+            '13P;RuhvjIwj7blNUOPtIr1n8000']
+        for msgno, payload in enumerate(payloads, start=1):
+            msg = self.aistracker.process_message(
+                payload, timestamp='2021/01/01 00:00:0{}'.format(msgno))
+            self.messagelog.store(msgno, payload, msg)
+            self.compactlog.store(msgno, payload, msg)
+
+    def test_debug_output(self):
+        """
+        debug output should be identical for all messages
+        """
+        self.assertEqual(self.messagelog.debug_output(),
+                         self.compactlog.debug_output())
+
+    def test_debug_output_mmsi(self):
+        """
+        debug output should be identical for a single mmsi
+        """
+        self.assertEqual(self.messagelog.debug_output(mmsi='235070199'),
+                         self.compactlog.debug_output(mmsi='235070199'))
+
+    def test_message_table(self):
+        """
+        the GUI table rows should be the same without decoding
+        """
+        self.assertEqual(list(self.messagelog.message_table_generator()),
+                         list(self.compactlog.message_table_generator()))
+        self.assertEqual(len(self.compactlog.decodecache), 0)
+
+    def test_get_message(self):
+        """
+        get a single message and check the cache does not grow too large
+        """
+        msg = self.compactlog.get_message(
+            4, '13P;RuhvjIwj7blNUOPtIr1n8000')
+        self.assertEqual(msg.mmsi, '235070199')
+        self.assertEqual(msg.rxtime, '2021/01/01 00:00:04')
+        list(self.compactlog.messages_generator())
+        self.assertEqual(len(self.compactlog.decodecache), 2)
+        with self.assertRaises(KeyError):
+            self.compactlog.get_message(4, '13P;Ruhvj1wj=0bNTU;up;=T80Rd')
+
+
+class DebugExportTests(unittest.TestCase):
+    """
+    test writing the AIS message debug files
+    """
+
+    def setUp(self):
+        self.aistracker = ais.AISTracker()
+        self.messagelog = allmessages.AISMessageLog()
+        self.tempdir = tempfile.TemporaryDirectory()
+        payloads = [
+            '13P;Ruhvj1wj=0bNTU;up;=T80Rd',
+            '402=a`1v:Df0TOi>SHNu0wA020S:',
+            '13P;RuhvjIwj7blNUOPtIr1n8000']
+        for msgno, payload in enumerate(payloads, start=1):
+            msg = self.aistracker.process_message(
+                payload, timestamp='2021/01/01 00:00:0{}'.format(msgno))
+            self.messagelog.store(msgno, payload, msg)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def read_files(self, prefix):
+        """
+        read back the JSON lines and csv files
+
+        Args:
+            prefix(str): start of the filenames
+
+        Returns:
+            contents(tuple): the text of the JSON lines and csv files
+        """
+        contents = []
+        for ext in ('.jsonl', '.csv'):
+            with open(os.path.join(self.tempdir.name, prefix + ext)) as f:
+                contents.append(f.read())
+        return tuple(contents)
+
+    def test_streamed_debug_files_match_lists(self):
+        """
+        writing the files in a single pass should give the same output as
+        writing out the lists from debug_output
+        """
+        for mmsi in (None, '235070199'):
+            jsonlines, csvlist = self.messagelog.debug_output(mmsi=mmsi)
+            export.write_json_lines(
+                jsonlines, os.path.join(self.tempdir.name, 'lists.jsonl'))
+            export.write_csv_file(
+                csvlist, os.path.join(self.tempdir.name, 'lists.csv'))
+            export.write_debug_files(
+                self.messagelog,
+                os.path.join(self.tempdir.name, 'stream.jsonl'),
+                os.path.join(self.tempdir.name, 'stream.csv'), mmsi=mmsi)
+            self.assertEqual(self.read_files('lists'),
+                             self.read_files('stream'))
+
+
+class ExportEverythingTests(unittest.TestCase):
+    """
+    test exporting the files for every AIS station
+    """
+
+    def setUp(self):
+        self.aistracker = ais.AISTracker()
+        self.messagelog = allmessages.AISMessageLog()
+        self.tempdir = tempfile.TemporaryDirectory()
+        payloads = [
+            '13P;Ruhvj1wj=0bNTU;up;=T80Rd',
+            '402=a`1v:Df0TOi>SHNu0wA020S:',
+            '13P;RuhvjIwj7blNUOPtIr1n8000',
+            '13P6>F002bwhDQ:NbBIdAqmeH5pl']
+        for msgno, payload in enumerate(payloads, start=1):
+            msg = self.aistracker.process_message(
+                payload, timestamp='2021/01/01 00:00:0{}'.format(msgno))
+            self.messagelog.store(msgno, payload, msg)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def list_output_files(self, outputdir):
+        """
+        get all the files that were exported
+
+        Args:
+            outputdir(str): the directory that was exported to
+
+        Returns:
+            outputfiles(list): paths of all the files relative to outputdir
+        """
+        outputfiles = []
+        for dirpath, _, filenames in os.walk(outputdir):
+            for filename in filenames:
+                outputfiles.append(os.path.relpath(
+                    os.path.join(dirpath, filename), outputdir))
+        return sorted(outputfiles)
+
+    def test_parallel_export_matches_sequential(self):
+        """
+        exporting with several workers should create the same files and
+        report progress for every station
+        """
+        sequentialdir = os.path.join(self.tempdir.name, 'sequential')
+        os.mkdir(sequentialdir)
+        export.export_everything(
+            self.aistracker, self.messagelog, sequentialdir)
+        for processes in (True, False):
+            paralleldir = os.path.join(
+                self.tempdir.name, 'parallel{}'.format(processes))
+            os.mkdir(paralleldir)
+            progress = []
+            export.export_everything(
+                self.aistracker, self.messagelog, paralleldir, workers=3,
+                processes=processes,
+                progress=lambda done, total, mmsi: progress.append(
+                    (done, total)))
+            self.assertEqual(self.list_output_files(sequentialdir),
+                             self.list_output_files(paralleldir))
+            self.assertEqual(progress, [(1, 3), (2, 3), (3, 3)])
+
+    def test_partitioned_debug_files(self):
+        """
+        writing every stations debug files in one pass should give the same
+        files as writing them one station at a time, even when files have to
+        be written out several times
+        """
+        mmsipaths = {}
+        for mmsi in self.aistracker.stations:
+            mmsipath = os.path.join(self.tempdir.name, mmsi)
+            os.mkdir(mmsipath)
+            mmsipaths[mmsi] = mmsipath
+        export.write_partitioned_debug_files(
+            self.messagelog, mmsipaths, overviewdir=self.tempdir.name,
+            maxbuffered=2)
+        expecteddir = os.path.join(self.tempdir.name, 'expected')
+        os.mkdir(expecteddir)
+        for mmsi in list(mmsipaths) + [None]:
+            export.write_debug_files(
+                self.messagelog, os.path.join(expecteddir, 'msgs.jsonl'),
+                os.path.join(expecteddir, 'msgs.csv'), mmsi=mmsi)
+            for ext in ('.jsonl', '.csv'):
+                if mmsi:
+                    actualpath = os.path.join(
+                        mmsipaths[mmsi], 'ais-messages' + ext)
+                else:
+                    actualpath = os.path.join(
+                        self.tempdir.name, 'ais-messages' + ext)
+                with open(os.path.join(expecteddir, 'msgs' + ext)) as f:
+                    expected = f.read()
+                with open(actualpath) as f:
+                    self.assertEqual(expected, f.read())
+
+
+class LiveKMLMapTests(unittest.TestCase):
+    """
+    test the incremental live KML map
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.livemap = livekmlmap.LiveKMLMap(
+            self.tempdir.name, incremental=True)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def process_payloads(self, payloads):
+        """
+        process payloads as if they had just been received
+
+        Args:
+            payloads(list): AIS payloads to process
+        """
+        currenttime = datetime.datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S')
+        for payload in payloads:
+            self.livemap.aistracker.process_message(
+                payload, timestamp=currenttime)
+
+    def get_update_ids(self):
+        """
+        read the update file
+
+        Returns:
+            deleted(list): target ids of the deleted features
+            created(list): ids of the folders created
+        """
+        kmlns = '{http://www.opengis.net/kml/2.2}'
+        update = xml.etree.ElementTree.parse(self.livemap.updatepath)
+        deleted = [feature.get('targetId') for feature in update.iterfind(
+            './/{0}Delete/*'.format(kmlns))]
+        created = [feature.get('id') for feature in update.iterfind(
+            './/{0}Create/*/{0}Folder'.format(kmlns))]
+        return deleted, created
+
+    def test_only_changed_stations_updated(self):
+        """
+        the update should only contain the stations that have changed since
+        the whole map was written
+        """
+        self.process_payloads(
+            ['13P;Ruhvj1wj=0bNTU;up;=T80Rd', '13P6>F002bwhDQ:NbBIdAqmeH5pl'])
+        self.livemap.write_kml_map()
+        fullmap = xml.etree.ElementTree.parse(self.livemap.kmlpath)
+        self.assertEqual(fullmap.getroot()[0].get('id'),
+                         kml.LIVEMAPDOCUMENTID)
+        self.assertEqual(len(self.get_update_ids()[1]), 3)
+        self.livemap.lastfullrewrite -= self.livemap.fullrewriteinterval
+        self.livemap.write_kml_update(
+            self.livemap.aistracker.get_map_stations(livemap=True))
+        self.assertEqual(self.get_update_ids(), ([], []))
+        self.process_payloads(['13P;RuhvjIwj7blNUOPtIr1n8000'])
+        self.livemap.write_kml_update(
+            self.livemap.aistracker.get_map_stations(livemap=True))
+        stnid = kml.create_feature_id('station', '235070199')
+        self.assertEqual(self.get_update_ids(), ([stnid], [stnid]))
+
+    def test_update_after_full_rewrite(self):
+        """
+        until Google Earth has had time to reload a new full map the update
+        should be made against the full map before it
+        """
+        self.process_payloads(['13P;Ruhvj1wj=0bNTU;up;=T80Rd'])
+        self.livemap.write_kml_map()
+        self.livemap.lastfullrewrite -= self.livemap.fullrewriteinterval
+        self.process_payloads(['13P;RuhvjIwj7blNUOPtIr1n8000'])
+        self.livemap.write_kml_map()
+        stnid = kml.create_feature_id('station', '235070199')
+        self.assertEqual(self.get_update_ids(), ([stnid], [stnid]))
+        self.livemap.lastfullrewrite -= self.livemap.fullrewriteinterval
+        self.livemap.write_kml_update(
+            self.livemap.aistracker.get_map_stations(livemap=True))
+        self.assertEqual(self.get_update_ids(), ([], []))
+
+    def test_unchanged_map_not_written(self):
+        """
+        the live files should only be replaced when the map has changed and
+        no temporary files should be left behind
+        """
+        self.livemap.incremental = False
+        self.process_payloads(['13P;Ruhvj1wj=0bNTU;up;=T80Rd'])
+        self.assertTrue(self.livemap.write_kml_map())
+        self.assertFalse(self.livemap.write_kml_map())
+        self.livemap.mapstate = None
+        self.assertFalse(self.livemap.write_kml_map())
+        self.process_payloads(['13P;RuhvjIwj7blNUOPtIr1n8000'])
+        self.assertTrue(self.livemap.write_kml_map())
+        self.assertEqual(os.listdir(self.tempdir.name), ['livemapdata.kml'])
+
+    def test_snapshot_not_updated(self):
+        """
+        a snapshot of the tracker should not change as new messages are
+        processed
+        """
+        self.process_payloads(['13P;Ruhvj1wj=0bNTU;up;=T80Rd'])
+        snapshot = self.livemap.aistracker.snapshot()
+        self.process_payloads(
+            ['13P;RuhvjIwj7blNUOPtIr1n8000', '13P6>F002bwhDQ:NbBIdAqmeH5pl'])
+        self.assertEqual(len(snapshot), 1)
+        self.assertEqual(snapshot.messagesprocessed, 1)
+        self.assertEqual(len(snapshot.stations['235070199'].posrep), 1)
+        self.assertEqual(
+            len(self.livemap.aistracker.stations['235070199'].posrep), 2)
+
+    def test_latest_only_snapshot(self):
+        """
+        a snapshot of just the latest positions should give the same
+        GeoJSON features as a full snapshot
+        """
+        self.process_payloads(
+            ['13P;Ruhvj1wj=0bNTU;up;=T80Rd', '13P;RuhvjIwj7blNUOPtIr1n8000',
+             '13P6>F002bwhDQ:NbBIdAqmeH5pl'])
+        snapshot = self.livemap.aistracker.snapshot(latestonly=True)
+        self.assertEqual(len(snapshot.stations['235070199'].posrep), 1)
+        features = []
+        for aistracker in (self.livemap.aistracker, snapshot):
+            geojsonmap = livegeojson.LiveGeoJSON()
+            geojsonmap.update(aistracker)
+            features.append(geojsonmap.get_geojson()[1].split('"features"'))
+        self.assertEqual(features[0][1], features[1][1])
+
+    def test_latest_only_snapshot_cache(self):
+        """
+        maps drawn from a snapshot of just the latest positions should not
+        be reused for maps of the full tracks
+        """
+        self.process_payloads(
+            ['13P;Ruhvj1wj=0bNTU;up;=T80Rd', '13P;RuhvjIwj7blNUOPtIr1n8000'])
+        aistracker = self.livemap.aistracker
+        snapshot = aistracker.snapshot(latestonly=True)
+        snapshot.create_geojson_map()
+        snapshot.all_station_info(verbose=True)
+        kmlpath = os.path.join(self.tempdir.name, 'map.kml')
+        snapshot.create_kml_map(kmlpath, kmzoutput=False)
+        geojsonmap = aistracker.create_geojson_map()
+        coords = [feature['geometry']['coordinates']
+                  for feature in geojsonmap.main['features']
+                  if feature['geometry']['type'] == 'LineString']
+        self.assertEqual(len(coords[0]), 2)
+        stninfo = aistracker.all_station_info(verbose=True)
+        self.assertEqual(len(stninfo['235070199']['Position Reports']), 2)
+        aistracker.create_kml_map(kmlpath, kmzoutput=False)
+        with open(kmlpath) as kmlfile:
+            self.assertIn('<LineString>', kmlfile.read())
+
+    def test_renderer_reuses_snapshot(self):
+        """
+        the render thread should not take another snapshot of the tracker
+        if no messages have been processed since the last one
+        """
+        self.process_payloads(['13P;Ruhvj1wj=0bNTU;up;=T80Rd'])
+        aistracker = self.livemap.aistracker
+        snapshots = []
+
+        def snapshot(latestonly=False):
+            snapshots.append(latestonly)
+            return ais.AISTracker.snapshot(aistracker, latestonly=latestonly)
+
+        aistracker.snapshot = snapshot
+        self.livemap.livegeojson = livegeojson.LiveGeoJSON()
+        self.livemap.start_renderer(interval=0.01)
+        time.sleep(0.2)
+        self.livemap.stop_renderer()
+        self.assertEqual(snapshots, [False])
+        self.assertEqual(len(self.livemap.livegeojson.features), 1)
+
+    def test_renderer(self):
+        """
+        the render thread should write the map in the background and stop
+        when asked
+        """
+        self.process_payloads(['13P;Ruhvj1wj=0bNTU;up;=T80Rd'])
+        self.livemap.start_renderer(interval=0.01)
+        for _ in range(500):
+            if os.path.exists(self.livemap.updatepath):
+                break
+            time.sleep(0.01)
+        self.livemap.stop_renderer()
+        self.assertIsNone(self.livemap.renderthread)
+        xml.etree.ElementTree.parse(self.livemap.kmlpath)
+
+
+class LiveGeoJSONTests(unittest.TestCase):
+    """
+    test serving the live GeoJSON map over HTTP
+    """
+
+    def setUp(self):
+        self.aistracker = ais.AISTracker()
+        currenttime = datetime.datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S')
+        for payload in ('13P;Ruhvj1wj=0bNTU;up;=T80Rd',
+                        '13P6>F002bwhDQ:NbBIdAqmeH5pl'):
+            self.aistracker.process_message(payload, timestamp=currenttime)
+        self.livegeojson = livegeojson.LiveGeoJSON()
+        self.livegeojson.update(self.aistracker)
+        self.livegeojson.start_server(port=0)
+        self.url = 'http://{}:{}/'.format(
+            *self.livegeojson.httpserver.server_address)
+
+    def tearDown(self):
+        self.livegeojson.stop_server()
+
+    def get_geojson(self, query='', headers=None):
+        """
+        request the GeoJSON from the server
+
+        Args:
+            query(str): query string to add to the URL
+            headers(dict): extra request headers
+
+        Returns:
+            response(http.client.HTTPResponse): the response
+            geojsondict(dict): the decoded GeoJSON
+        """
+        request = urllib.request.Request(self.url + query,
+                                         headers=headers or {})
+        with urllib.request.urlopen(request) as response:
+            return response, json.loads(response.read())
+
+    def test_all_stations(self):
+        """
+        all stations with a position should be returned
+        """
+        response, geojsondict = self.get_geojson()
+        self.assertEqual(response.headers['Content-Type'],
+                         'application/geo+json')
+        self.assertEqual(geojsondict['type'], 'FeatureCollection')
+        self.assertEqual(
+            sorted(f['properties']['MMSI'] for f in geojsondict['features']),
+            sorted(self.aistracker.stations))
+
+    def test_bbox_and_since(self):
+        """
+        stations outside the bounding box or not changed since the given
+        time should be left out
+        """
+        _, geojsondict = self.get_geojson('?bbox=-180,-90,180,90')
+        self.assertEqual(len(geojsondict['features']), 2)
+        _, geojsondict = self.get_geojson('?bbox=0,0,1,1')
+        self.assertEqual(geojsondict['features'], [])
+        _, geojsondict = self.get_geojson(
+            '?since={}'.format(geojsondict['timestamp']))
+        self.assertEqual(geojsondict['features'], [])
+        with self.assertRaises(urllib.error.HTTPError) as err:
+            self.get_geojson('?bbox=1,2,3')
+        self.assertEqual(err.exception.code, 400)
+
+    def test_removed(self):
+        """
+        stations that have gone from the map should be listed as removed
+        in responses with since
+        """
+        _, geojsondict = self.get_geojson()
+        self.assertNotIn('removed', geojsondict)
+        since = geojsondict['timestamp']
+        remaining = ais.AISTracker()
+        remaining.stations['235070199'] = \
+            self.aistracker.stations['235070199']
+        self.livegeojson.update(remaining)
+        _, geojsondict = self.get_geojson('?since={}'.format(since))
+        self.assertEqual(geojsondict['removed'], ['234983000'])
+        self.assertEqual(geojsondict['features'], [])
+        _, geojsondict = self.get_geojson(
+            '?since={}'.format(geojsondict['timestamp']))
+        self.assertEqual(geojsondict['removed'], [])
+
+    def test_etag(self):
+        """
+        a 304 should be sent if the client already has the latest GeoJSON
+        and the ETag should change when a station does
+        """
+        response, _ = self.get_geojson()
+        etag = response.headers['ETag']
+        with self.assertRaises(urllib.error.HTTPError) as err:
+            self.get_geojson(headers={'If-None-Match': etag})
+        self.assertEqual(err.exception.code, 304)
+        currenttime = datetime.datetime.utcnow().strftime('%Y/%m/%d %H:%M:%S')
+        self.aistracker.process_message(
+            '13P;RuhvjIwj7blNUOPtIr1n8000', timestamp=currenttime)
+        self.livegeojson.update(self.aistracker)
+        response, _ = self.get_geojson(headers={'If-None-Match': etag})
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class NetworkTests(unittest.TestCase):
+    """
+    test receiving NMEA sentences from the network
+    """
+
+    sentences = [
+        '!AIVDM,1,1,,B,14V?r<0024OilDhNWM5=5bNJ00Rr,0*48',
+        '!AIVDM,1,1,,B,1C@enF000VOVUadOEggV6llJ0P00,0*35']
+
+    def test_protocol_datagram(self):
+        """
+        all the sentences in a datagram are handed on together
+        """
+        received = []
+        protocol = network.NMEAServerProtocol(received.append)
+        protocol.datagram_received(
+            '\r\n'.join(self.sentences).encode('utf-8'), ('127.0.0.1', 1))
+        protocol.datagram_received(b'\xff\xfe', ('127.0.0.1', 1))
+        protocol.datagram_received(b'nothing here', ('127.0.0.1', 1))
+        self.assertEqual(received, [self.sentences])
+
+    def test_protocol_handler_error(self):
+        """
+        an error handling a datagram is logged rather than closing the
+        transport
+        """
+        def handle_sentences(sentences):
+            raise ValueError('bad sentences')
+
+        protocol = network.NMEAServerProtocol(handle_sentences)
+        with self.assertLogs('pyaisnmea.network', level='ERROR'):
+            protocol.datagram_received(
+                self.sentences[0].encode('utf-8'), ('127.0.0.1', 1))
+
+    def test_mpserver_batches(self):
+        """
+        sentences are put onto the queue in lists of batchsize, with the
+        rest put on after batchlatency
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        mpq = multiprocessing.Queue()
+        serverprocess = multiprocessing.Process(
+            target=network.mpserver, args=[mpq],
+            kwargs={'port': port, 'batchsize': 4, 'batchlatency': 0.2})
+        serverprocess.start()
+        try:
+            time.sleep(0.5)
+            datagram = '\r\n'.join(self.sentences).encode('utf-8')
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for _ in range(3):
+                    sock.sendto(datagram, ('127.0.0.1', port))
+            source = network.source_name('udp', '127.0.0.1', port)
+            self.assertEqual(mpq.get(timeout=5),
+                             (source, self.sentences * 2))
+            self.assertEqual(mpq.get(timeout=5), (source, self.sentences))
+        finally:
+            serverprocess.terminate()
+            serverprocess.join()
+
+    def test_receiver_truncated_and_batched(self):
+        """
+        datagrams too big for the buffer are counted, and datagrams
+        already waiting are read in one call
+        """
+        receiver = network.UDPReceiver(port=0, buffersize=64)
+        try:
+            address = receiver.sock.getsockname()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto('\r\n'.join(self.sentences).encode('utf-8'),
+                            address)
+                for sentence in self.sentences:
+                    sock.sendto(sentence.encode('utf-8'), address)
+            time.sleep(0.1)
+            datagrams = receiver.receive(timeout=1)
+            self.assertEqual(datagrams[1:], self.sentences)
+            self.assertEqual(receiver.received, 3)
+            self.assertEqual(receiver.truncated, 1)
+            self.assertEqual(receiver.receive(timeout=0.01), [])
+        finally:
+            receiver.close()
+
+    def test_receiver_oversized_windows(self):
+        """
+        a datagram too big for the buffer raising WSAEMSGSIZE like it does
+        on Windows is counted as truncated instead of stopping the server
+        """
+
+        class OversizedSocket():
+
+            def __init__(self, sock):
+                self.sock = sock
+
+            def settimeout(self, timeout):
+                self.sock.settimeout(timeout)
+
+            def recvfrom_into(self, view):
+                view[:4] = b'!AIV'
+                raise OSError(network.WSAEMSGSIZE, 'message too long')
+
+            def close(self):
+                self.sock.close()
+
+        receiver = network.UDPReceiver(port=0, buffersize=64)
+        receiver.ancbufsize = 0
+        receiver.sock = OversizedSocket(receiver.sock)
+        try:
+            self.assertEqual(receiver.receive_one(), 64)
+            self.assertEqual(receiver.truncated, 1)
+        finally:
+            receiver.close()
+
+    @unittest.skipUnless(sys.platform.startswith('linux'),
+                         'kernel drop counts are only available on Linux')
+    def test_receiver_dropped(self):
+        """
+        datagrams dropped because the receive buffer is full are counted,
+        the kernel sends the count with the next datagram it accepts
+        """
+        receiver = network.UDPReceiver(port=0, rcvbuf=1024)
+        try:
+            address = receiver.sock.getsockname()
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for _ in range(200):
+                    sock.sendto(self.sentences[0].encode('utf-8'), address)
+                while receiver.receive(timeout=0.1):
+                    pass
+                sock.sendto(self.sentences[0].encode('utf-8'), address)
+                receiver.receive(timeout=1)
+            self.assertGreater(receiver.dropped, 0)
+            self.assertEqual(receiver.received + receiver.dropped, 201)
+        finally:
+            receiver.close()
+
+    def test_forwarder(self):
+        """
+        each sentence is forwarded once to every destination, packed into
+        datagrams no bigger than the mtu when batching
+        """
+        receivers = []
+        for _ in range(2):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(('127.0.0.1', 0))
+            sock.settimeout(1)
+            receivers.append(sock)
+        destinations = [sock.getsockname() for sock in receivers]
+        try:
+            forwarder = network.SentenceForwarder(destinations)
+            forwarder.forward(self.sentences)
+            forwarder.close()
+            for sock in receivers:
+                self.assertEqual(
+                    [sock.recv(2048).decode('ascii') for _ in range(2)],
+                    [sentence + '\r\n' for sentence in self.sentences])
+            forwarder = network.SentenceForwarder(
+                destinations[:1], batch=True, mtu=100)
+            forwarder.forward(self.sentences * 2)
+            forwarder.close()
+            datagram = ''.join(sentence + '\r\n'
+                               for sentence in self.sentences)
+            for _ in range(2):
+                self.assertEqual(
+                    receivers[0].recv(2048).decode('ascii'), datagram)
+            self.assertEqual(forwarder.sentcount, 4)
+        finally:
+            for sock in receivers:
+                sock.close()
+
+    def test_tcpclient_reconnects(self):
+        """
+        lines split across reads are put back together and the client
+        connects again when the server closes the connection
+        """
+        received = []
+        connections = []
+
+        async def send_sentences(reader, writer):
+            connections.append(writer)
+            data = '\r\n'.join(self.sentences).encode('utf-8') + b'\r\n'
+            writer.write(data[:20])
+            await writer.drain()
+            await asyncio.sleep(0.05)
+            writer.write(data[20:])
+            await writer.drain()
+            writer.close()
+
+        async def run_client():
+            server = await asyncio.start_server(
+                send_sentences, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            stopevent = asyncio.Event()
+            client = asyncio.create_task(network.tcpclient(
+                received.extend, port=port, stopevent=stopevent,
+                reconnectmin=0.05))
+            for _ in range(100):
+                if len(connections) >= 2 and len(received) >= 4:
+                    break
+                await asyncio.sleep(0.02)
+            stopevent.set()
+            await client
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run_client())
+        self.assertGreaterEqual(len(connections), 2)
+        self.assertEqual(received[:4], self.sentences * 2)
+
+    def test_tcpserver_feeders(self):
+        """
+        sentences from more than one feeder are all read
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        received = []
+
+        async def run_server():
+            stopevent = asyncio.Event()
+            server = asyncio.create_task(network.tcpserver(
+                received.extend, port=port, stopevent=stopevent))
+            await asyncio.sleep(0.1)
+            writers = []
+            for sentence in self.sentences:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(sentence.encode('utf-8') + b'\n')
+                await writer.drain()
+                writers.append(writer)
+            for _ in range(50):
+                if len(received) == 2:
+                    break
+                await asyncio.sleep(0.02)
+            stopevent.set()
+            await server
+            for writer in writers:
+                writer.close()
+
+        asyncio.run(run_server())
+        self.assertEqual(sorted(received), sorted(self.sentences))
+
+    def test_read_sentences_handler_error(self):
+        """
+        an error handling one chunk of sentences is logged and the rest
+        of the stream is still read
+        """
+        received = []
+
+        def handle_sentences(sentences):
+            if not received:
+                received.append(None)
+                raise ValueError('bad sentences')
+            received.extend(sentences)
+
+        async def read_stream():
+            reader = asyncio.StreamReader()
+            for sentence in self.sentences:
+                reader.feed_data(sentence.encode('utf-8') + b'\n')
+            reader.feed_eof()
+            await network.read_sentences(
+                reader, handle_sentences,
+                readsize=len(self.sentences[0]) + 1)
+
+        with self.assertLogs('pyaisnmea.network', level='ERROR'):
+            asyncio.run(read_stream())
+        self.assertEqual(received, [None, self.sentences[1]])
+
+    def test_multiserver_source_fails(self):
+        """
+        a source that cannot start is logged and the others carry on
+        """
+        received = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            udpport = sock.getsockname()[1]
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as inuse:
+            inuse.bind(('127.0.0.1', 0))
+            inuse.listen()
+            sources = [('tcpserver', '127.0.0.1', inuse.getsockname()[1]),
+                       ('udp', '127.0.0.1', udpport)]
+
+            async def send_sentences():
+                stopevent = asyncio.Event()
+                server = asyncio.create_task(network.multiserver(
+                    lambda sentences, source: received.extend(sentences),
+                    sources, stopevent=stopevent))
+                await asyncio.sleep(0.1)
+                with socket.socket(
+                        socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.sendto(self.sentences[0].encode('utf-8'),
+                                ('127.0.0.1', udpport))
+                for _ in range(50):
+                    if received:
+                        break
+                    await asyncio.sleep(0.02)
+                stopevent.set()
+                await server
+
+            with self.assertLogs('pyaisnmea.network', level='ERROR'):
+                asyncio.run(send_sentences())
+        self.assertEqual(received, self.sentences[:1])
+
+    def test_multiserver_sources(self):
+        """
+        sentences from several sources are read in one event loop and
+        counted for each source
+        """
+        ports = []
+        for _ in range(2):
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.bind(('127.0.0.1', 0))
+                ports.append(sock.getsockname()[1])
+        sources = [('udp', '127.0.0.1', port) for port in ports]
+        with tempfile.TemporaryDirectory() as tempdir:
+            livemap = livekmlmap.LiveKMLMap(tempdir)
+
+            async def send_sentences():
+                stopevent = asyncio.Event()
+                server = asyncio.create_task(network.multiserver(
+                    livemap.process_sentences, sources,
+                    stopevent=stopevent))
+                await asyncio.sleep(0.1)
+                with socket.socket(
+                        socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    for sentence in self.sentences:
+                        sock.sendto(sentence.encode('utf-8'),
+                                    ('127.0.0.1', ports[0]))
+                    sock.sendto(b'!AIVDM,1,1,,B,bad,0*00',
+                                ('127.0.0.1', ports[0]))
+                    sock.sendto(self.sentences[0].encode('utf-8'),
+                                ('127.0.0.1', ports[1]))
+                for _ in range(50):
+                    if livemap.aistracker.messagesprocessed == 3:
+                        break
+                    await asyncio.sleep(0.02)
+                stopevent.set()
+                await server
+
+            asyncio.run(send_sentences())
+            names = [network.source_name(*source) for source in sources]
+            nmeastats = livemap.nmeatracker.nmea_stats()['Sources']
+            aisstats = livemap.aistracker.tracker_stats()['Sources']
+            self.assertEqual(nmeastats[names[0]]['Sentences'], 3)
+            self.assertEqual(nmeastats[names[0]]['Errors'], 1)
+            self.assertEqual(nmeastats[names[1]]['Sentences'], 1)
+            self.assertEqual(
+                aisstats[names[0]],
+                {'Messages': 2, 'Duplicates': 0, 'Unique Stations': 2})
+            self.assertEqual(
+                aisstats[names[1]],
+                {'Messages': 1, 'Duplicates': 0, 'Unique Stations': 1})
+
+    def test_multiserver_rcvbuf(self):
+        """
+        the receive buffer size is only passed on to the UDP sources
+        """
+        sources = []
+        for servertype, socktype in (('udp', socket.SOCK_DGRAM),
+                                     ('tcpserver', socket.SOCK_STREAM)):
+            with socket.socket(socket.AF_INET, socktype) as sock:
+                sock.bind(('127.0.0.1', 0))
+                sources.append(
+                    (servertype, '127.0.0.1', sock.getsockname()[1]))
+
+        async def start_and_stop():
+            stopevent = asyncio.Event()
+            server = asyncio.create_task(network.multiserver(
+                lambda sentences, source: None, sources,
+                stopevent=stopevent, rcvbuf=65536))
+            await asyncio.sleep(0.1)
+            stopevent.set()
+            await server
+
+        asyncio.run(start_and_stop())
+
+    def test_asyncserver_live_map(self):
+        """
+        sentences sent over UDP are processed by the live map in this
+        process
+        """
+        with tempfile.TemporaryDirectory() as tempdir:
+            livemap = livekmlmap.LiveKMLMap(tempdir)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.bind(('127.0.0.1', 0))
+                port = sock.getsockname()[1]
+
+            async def send_sentences():
+                stopevent = asyncio.Event()
+                server = asyncio.create_task(network.asyncserver(
+                    livemap.process_sentences, port=port,
+                    stopevent=stopevent))
+                await asyncio.sleep(0.1)
+                with socket.socket(
+                        socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.sendto('\r\n'.join(self.sentences).encode('utf-8'),
+                                ('127.0.0.1', port))
+                for _ in range(50):
+                    if livemap.aistracker.messagesprocessed == 2:
+                        break
+                    await asyncio.sleep(0.02)
+                stopevent.set()
+                await server
+
+            asyncio.run(send_sentences())
+            self.assertEqual(livemap.aistracker.messagesprocessed, 2)
+            self.assertEqual(set(livemap.aistracker.stations),
+                             {'218855000', '308542000'})
+
+    def test_live_map_ring_buffer(self):
+        """
+        the ring buffer should only be created when the server process is
+        started and unlinked when the live map is stopped
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        with tempfile.TemporaryDirectory() as tempdir:
+            livemap = livekmlmap.LiveKMLMap(tempdir, sharedmemory=True)
+            self.assertIsNone(livemap.mpq)
+            livemap.start_server(sources=[('udp', '127.0.0.1', port)])
+            try:
+                name = livemap.mpq.sharedmem.name
+                time.sleep(0.5)
+                with socket.socket(
+                        socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                    sock.sendto(self.sentences[0].encode('utf-8'),
+                                ('127.0.0.1', port))
+                _, sentences = livemap.mpq.get(timeout=5)
+                self.assertEqual(sentences, self.sentences[:1])
+            finally:
+                livemap.stop_server()
+                livemap.stop_live_map()
+            self.assertIsNone(livemap.mpq)
+            with self.assertRaises(FileNotFoundError):
+                ringbuffer.SentenceRingBuffer(name=name)
+
+
+def put_sentences(ring, sentences):
+    """
+    put sentences into a ring buffer from another process
+
+    Args:
+        ring(ringbuffer.SentenceRingBuffer): the ring buffer
+        sentences(list): sentences to put
+    """
+    ring.put(('test', sentences))
+
+
+class RingBufferTests(unittest.TestCase):
+    """
+    test the shared memory ring buffer
+    """
+
+    sentences = [
+        '!AIVDM,1,1,,B,14V?r<0024OilDhNWM5=5bNJ00Rr,0*48',
+        '!AIVDM,1,1,,B,1C@enF000VOVUadOEggV6llJ0P00,0*35']
+
+    def setUp(self):
+        self.ring = ringbuffer.SentenceRingBuffer(capacity=128)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_close_whilst_reading(self):
+        """
+        the shared memory is unlinked even if it cannot be detached from
+        because it is still being read
+        """
+        ring = ringbuffer.SentenceRingBuffer(capacity=128)
+        name = ring.sharedmem.name
+        reading = ring.buf[0:8]
+        with self.assertRaises(BufferError):
+            ring.close()
+        with self.assertRaises(FileNotFoundError):
+            ringbuffer.SentenceRingBuffer(name=name)
+        reading.release()
+        ring.close()
+
+    def test_wrap_around(self):
+        """
+        sentences come out the same after the buffer wraps round
+        """
+        for _ in range(5):
+            self.ring.put(('test', self.sentences[:1]))
+            self.assertEqual(self.ring.get(timeout=1),
+                             ('test', self.sentences[:1]))
+        self.assertEqual(self.ring.written, 5)
+        self.assertEqual(self.ring.dropped, 0)
+        with self.assertRaises(queue.Empty):
+            self.ring.get(timeout=0.01)
+
+    def test_overflow(self):
+        """
+        sentences that do not fit are dropped and counted
+        """
+        self.ring.put(('test', self.sentences * 2))
+        self.assertEqual(self.ring.written, 2)
+        self.assertEqual(self.ring.dropped, 2)
+        self.assertEqual(self.ring.get(timeout=1), ('test', self.sentences))
+
+    def test_other_process(self):
+        """
+        sentences put in by another process can be read
+        """
+        producer = multiprocessing.Process(
+            target=put_sentences, args=[self.ring, self.sentences])
+        producer.start()
+        producer.join()
+        self.assertEqual(self.ring.get(timeout=1), ('test', self.sentences))
+
+    def test_sources(self):
+        """
+        sentences from different sources come out seperately
+        """
+        ring = ringbuffer.SentenceRingBuffer(capacity=1024)
+        try:
+            ring.put(('a', self.sentences[:1]))
+            ring.put(('b', self.sentences[1:]))
+            ring.put(('b', self.sentences[:1]))
+            self.assertEqual(ring.get(timeout=1), ('a', self.sentences[:1]))
+            self.assertEqual(ring.get(timeout=1),
+                             ('b', self.sentences[1:] + self.sentences[:1]))
+        finally:
+            ring.close()
+
+
+class DuplicateFilterTests(unittest.TestCase):
+    """
+    test suppressing duplicate messages from overlapping receivers
+    """
+
+    def test_window(self):
+        """
+        a payload is only a duplicate within the window
+        """
+        dupfilter = ais.DuplicateFilter(window=10)
+        self.assertFalse(dupfilter.is_duplicate('abc', currenttime=100))
+        self.assertTrue(dupfilter.is_duplicate('abc', currenttime=105))
+        self.assertFalse(dupfilter.is_duplicate('def', currenttime=106))
+        self.assertFalse(dupfilter.is_duplicate('abc', currenttime=111))
+        self.assertEqual(dupfilter.stats(), {
+            'Messages Checked': 4, 'Duplicates Suppressed': 1,
+            'Duplicate Rate %': 25.0})
+
+    def test_maxsize(self):
+        """
+        no more than maxsize payloads are remembered
+        """
+        dupfilter = ais.DuplicateFilter(window=10, maxsize=3)
+        for payload in 'abcde':
+            dupfilter.is_duplicate(payload, currenttime=100)
+        self.assertEqual(list(dupfilter.payloads), ['c', 'd', 'e'])
+        self.assertFalse(dupfilter.is_duplicate('a', currenttime=100))
+
+    def test_tracker(self):
+        """
+        duplicates are not processed and are counted against the source
+        that sent them
+        """
+        aistracker = ais.AISTracker()
+        aistracker.duplicatefilter = ais.DuplicateFilter()
+        payload = '14V?r<0024OilDhNWM5=5bNJ00Rr'
+        aistracker.process_message(payload, source='rx1')
+        with self.assertRaises(ais.DuplicateMessage):
+            aistracker.process_message(payload, source='rx2')
+        stats = aistracker.tracker_stats()
+        self.assertEqual(aistracker.messagesprocessed, 1)
+        self.assertEqual(len(aistracker.stations['308542000'].posrep), 1)
+        self.assertEqual(stats['Duplicates']['Duplicates Suppressed'], 1)
+        self.assertEqual(stats['Sources']['rx2']['Duplicates'], 1)
+
+
+class TagBlockTests(unittest.TestCase):
+    """
+    test reading NMEA 4.x tag blocks
+    """
+
+    def test_parse_tag_block(self):
+        """
+        source, time, line count and group are read from the tag block
+        """
+        tags = nmea.parse_tag_block(
+            'g:1-2-73874,n:157036,s:r003669945,c:1241544035*4A')
+        self.assertEqual(tags, {
+            'group': (1, 2, 73874), 'linecount': 157036,
+            'source': 'r003669945', 'time': 1241544035})
+
+    def test_bad_checksum(self):
+        """
+        a tag block with the wrong checksum is rejected
+        """
+        with self.assertRaises(nmea.NMEACheckSumFailed):
+            nmea.parse_tag_block('s:rcv1,c:1690000000*65')
+
+    def test_timestamp(self):
+        """
+        times in seconds and milliseconds give the same timestamp
+        """
+        self.assertEqual(
+            nmea.tag_block_timestamp({'time': 1690000000}),
+            '2023/07/22 04:26:40')
+        self.assertEqual(
+            nmea.tag_block_timestamp({'time': 1690000000123}),
+            '2023/07/22 04:26:40')
+        self.assertIsNone(nmea.tag_block_timestamp(None))
+
+    def test_multipart(self):
+        """
+        the tag blocks of all the parts of a message are combined
+        """
+        nmeatracker = nmea.NMEAtracker()
+        sentences = [
+            ('\\g:1-2-73874,n:157036,s:r003669945,c:1241544035*4A\\'
+             '!AIVDM,2,1,5,A,53P6>F42;si4mPhOJ208Dr0mV0<Q8DF22222'
+             '220t41H;==8cN<R1FDj0,0*39'),
+            '\\g:2-2-73874,n:157037*1D\\!AIVDM,2,2,5,A,CH8888888888880,2*2A']
+        self.assertIsNone(nmeatracker.process_sentence(sentences[0]))
+        payload = nmeatracker.process_sentence(sentences[1])
+        self.assertTrue(payload.startswith('53P6>F42'))
+        self.assertEqual(nmeatracker.lasttagblock['time'], 1241544035)
+        self.assertEqual(nmeatracker.lasttagblock['linecount'], 157036)
+
+    def test_multipart_stale_tags(self):
+        """
+        tags from an unfinished message are not merged into the next one
+        """
+        nmeatracker = nmea.NMEAtracker()
+        sentences = [
+            ('\\g:1-2-73874,n:157036,s:r003669945,c:1241544035*4A\\'
+             '!AIVDM,2,1,5,A,53P6>F42;si4mPhOJ208Dr0mV0<Q8DF22222'
+             '220t41H;==8cN<R1FDj0,0*39'),
+            ('\\s:rcv1,c:1690000000*64\\'
+             '!AIVDM,2,1,5,A,53P6>F42;si4mPhOJ208Dr0mV0<Q8DF22222'
+             '220t41H;==8cN<R1FDj0,0*39'),
+            '!AIVDM,2,2,5,A,CH8888888888880,2*2A']
+        self.assertIsNone(nmeatracker.process_sentence(sentences[0]))
+        self.assertIsNone(nmeatracker.process_sentence(sentences[1]))
+        payload = nmeatracker.process_sentence(sentences[2])
+        self.assertTrue(payload.startswith('53P6>F42'))
+        self.assertEqual(nmeatracker.lasttagblock,
+                         {'source': 'rcv1', 'time': 1690000000})
+        self.assertEqual(nmeatracker.multiparttags, {})
+
+    def test_network_keeps_tag_blocks(self):
+        """
+        tag blocks are not stripped from sentences read from the network
+        """
+        line = ('\\s:rcv1,c:1690000000*64\\'
+                '!AIVDM,1,1,,A,13P6>F002lwce04NvkaT<CPGH<02,0*69')
+        self.assertEqual(nmea.NMEALINEREGEX.findall(line + '\r\n'), [line])
+
+    def test_file_times(self):
+        """
+        messages from a file get the times from their tag blocks
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filepath = os.path.join(tmpdir, 'tagblocks.nmea')
+            with open(filepath, 'w') as nmeafile:
+                nmeafile.write(
+                    '\\s:rcv1,c:1690000000*64\\'
+                    '!AIVDM,1,1,,A,13P6>F002lwce04NvkaT<CPGH<02,0*69\n')
+            self.assertTrue(capturefile.has_tag_block_times(filepath))
+            aistracker, _, _ = capturefile.aistracker_from_file(
+                filepath, timingsource=[])
+        self.assertEqual(aistracker.timings, ['2023/07/22 04:26:40'])
+
+
+class MessageFilterTests(unittest.TestCase):
+    """
+    test filtering messages before they are decoded
+    """
+
+    def test_msgtypes(self):
+        """
+        only the wanted message types are kept
+        """
+        msgfilter = ais.MessageFilter(msgtypes=[18])
+        self.assertFalse(msgfilter.is_wanted('14V?r<0024OilDhNWM5=5bNJ00Rr'))
+        self.assertTrue(msgfilter.is_wanted('B43JRq00LhTWc5VejDI>wwWUoP06'))
+
+    def test_mmsis(self):
+        """
+        only messages from the wanted MMSIs are kept
+        """
+        msgfilter = ais.MessageFilter(mmsis=['308542000'])
+        self.assertTrue(msgfilter.is_wanted('14V?r<0024OilDhNWM5=5bNJ00Rr'))
+        self.assertFalse(msgfilter.is_wanted('B43JRq00LhTWc5VejDI>wwWUoP06'))
+        self.assertEqual(msgfilter.stats(), {
+            'Messages Checked': 2, 'Messages Filtered Out': 1,
+            'Filtered Out %': 50.0})
+
+    def test_bbox(self):
+        """
+        only position reports inside the bounding box are kept
+        """
+        msgfilter = ais.MessageFilter(bbox=[-4, 53, -3, 54])
+        self.assertTrue(msgfilter.is_wanted('14V?r<0024OilDhNWM5=5bNJ00Rr'))
+        self.assertFalse(msgfilter.is_wanted('B43JRq00LhTWc5VejDI>wwWUoP06'))
+
+    def test_tracker(self):
+        """
+        unwanted messages are not processed by the tracker
+        """
+        aistracker = ais.AISTracker()
+        aistracker.messagefilter = ais.MessageFilter(msgtypes=[1, 2, 3])
+        with self.assertRaises(ais.UnwantedMessage):
+            aistracker.process_message('B43JRq00LhTWc5VejDI>wwWUoP06')
+        aistracker.process_message('14V?r<0024OilDhNWM5=5bNJ00Rr')
+        self.assertEqual(list(aistracker.stations), ['308542000'])
+        self.assertEqual(
+            aistracker.tracker_stats()['Filtered']['Messages Filtered Out'],
+            1)
+
+
+class DecodeCacheTests(unittest.TestCase):
+    """
+    test caching decoded messages by payload
+    """
+
+    def test_repeat(self):
+        """
+        a repeated payload gives a new message with the same fields
+        """
+        payload = '55P5TL01VIaAL@7WKO@mBplU@<PDhh000000001S;AJ::4A80?4i@E53'
+        aistracker = ais.AISTracker()
+        aistracker.decodecache = allmessages.DecodeCache()
+        first = aistracker.process_message(payload, timestamp='first')
+        second = aistracker.process_message(payload, timestamp='second')
+        self.assertIsNot(first, second)
+        self.assertIs(type(first), type(second))
+        self.assertEqual(first.name, second.name)
+        self.assertEqual(second.rxtime, 'second')
+        self.assertEqual(aistracker.messagesprocessed, 2)
+        self.assertEqual(
+            aistracker.tracker_stats()['Decode Cache']['Cache Hits'], 1)
+
+    def test_types_and_size(self):
+        """
+        only the chosen message types are cached, the least recently
+        used payload is removed when the cache is full
+        """
+        decodecache = allmessages.DecodeCache(maxsize=1)
+        aistracker = ais.AISTracker()
+        aistracker.decodecache = decodecache
+        aistracker.process_message('14V?r<0024OilDhNWM5=5bNJ00Rr')
+        self.assertEqual(len(decodecache), 0)
+        aistracker.process_message(
+            '55P5TL01VIaAL@7WKO@mBplU@<PDhh000000001S;AJ::4A80?4i@E53')
+        payload = ('537QR042Ci8kD9PsB20HT@DhTv2222222222221I:0H?24pW0Ch'
+                   'PDTQBDSp888888888880')
+        aistracker.process_message(payload)
+        self.assertEqual(list(decodecache.messages), [payload])
+
+
+class StaticDataChangeTests(unittest.TestCase):
+    """
+    test skipping static data that has not changed
+    """
+
+    def setUp(self):
+        self.payload = (
+            '55P5TL01VIaAL@7WKO@mBplU@<PDhh000000001S;AJ::4A80?4i@E53')
+        self.aistracker = ais.AISTracker()
+        self.changes = []
+        self.aistracker.changehandler = (
+            lambda stn, msgobj, changes: self.changes.append(changes))
+
+    def test_unchanged(self):
+        """
+        the same static data again does not change the station details
+        """
+        self.aistracker.process_message(self.payload)
+        self.aistracker.process_message(self.payload)
+        stn = self.aistracker.stations['369190000']
+        self.assertEqual(len(self.changes), 1)
+        self.assertEqual(
+            stn.sentmsgs['Type 5 - Static and Voyage Related Data'], 2)
+        self.assertEqual(list(stn.staticdata), [5])
+
+    def test_destination_changed(self):
+        """
+        the change handler is told when the destination changes
+        """
+        msgbinary = binary.ais_sentence_payload_binary(self.payload)
+        newpayload = binary.ais_sentence_binary_payload(
+            msgbinary[:302] + '0' * 120 + msgbinary[422:])
+        self.aistracker.process_message(self.payload)
+        self.aistracker.process_message(newpayload)
+        self.assertEqual(self.changes[1], {'Destination': ('SEATT', '')})
+
+
+    def test_shared_details_overwritten(self):
+        """
+        a type 19 with the same static data as before is used again once
+        a type 24 has overwritten the length and width it set
+        """
+        type19 = 'C3P8A>@007tgWa7fF6`00000P2>:`W0H28k111111110B0D2Q120'
+        msgbinary = binary.ais_sentence_payload_binary(
+            'H3P7uLDT4I138D0FA=;l001`0310')
+        type24 = binary.ais_sentence_binary_payload(
+            msgbinary[:8] + binary.ais_sentence_payload_binary(
+                type19)[8:38] + msgbinary[38:])
+        for payload in (type19, type24, type19):
+            self.aistracker.process_message(payload)
+        stn = self.aistracker.stations['235016505']
+        self.assertEqual(stn.details['Length (m)'], 10)
+        self.assertEqual(stn.details['Width (m)'], 4)
+        self.assertEqual(self.changes[2]['Length (m)'], (0, 10))
+        self.assertEqual(list(stn.staticdata), [19])
+
+class BenchmarkTests(unittest.TestCase):
+    """
+    test the benchmark runs on generated traffic
+    """
+
+    def test_traffic_generator(self):
+        """
+        the generated sentences are valid and make up whole messages
+        """
+        generator = bench.TrafficGenerator(stations=20, seed=2)
+        sentences = list(generator.sentences(200))
+        self.assertTrue(all(
+            nmea.calculate_nmea_checksum(sentence) for sentence in sentences))
+        _, payloads = bench.reassemble_messages(sentences)
+        self.assertEqual(len(payloads), 200)
+        aistracker, _ = bench.track_messages(payloads)
+        self.assertEqual(aistracker.messagesprocessed, 200)
+
+    def test_run_benchmark(self):
+        """
+        every stage is timed and the results can be compared
+        """
+        results = bench.run_benchmark(messages=300, stations=20)
+        self.assertEqual(results['Messages'], 300)
+        for stage in ('NMEA Parse', 'Checksum', 'Payload to Binary',
+                      'AISTracker.process_message', 'AISMessageLog.store',
+                      'Export JSONL', 'Export KMZ', 'Export GeoJSON'):
+            self.assertIn(stage, results['Stages'])
+        table = bench.create_results_table(results, baseline=results)
+        self.assertEqual(table[0][-1], 'Speed vs Baseline')
+        self.assertEqual(table[1][-1], '1.00x')
+
 
 if __name__ == '__main__':
     unittest.main()